@@ -0,0 +1,335 @@
+'''
+This module contains the python backend: a module (`ssa_functions`) is translated into python source, compiled once
+and its functions are cached as python callables
+
+* locals are python locals (`l0`, `l1`, ...), parameters are the first ones (missing args are `None`)
+* blocks are the branches of a dispatch loop on the index of the current block (a single block function has no loop)
+* phis are python locals assigned together (a tuple assignment, so in parallel) before jumping to their block
+* nodes shared by more instructions of a block and `call`s are assigned to temporaries, in evaluation order,
+  the other nodes are inlined in the expression using them
+* the operations have the semantics of the folding passes (see `semantics`): values of integer types wrap around
+  (masking the python ints), divisions truncate toward zero exactly, and the operations without a defined result
+  (a division by zero, a shift count out of range) raise `ArithmeticError`
+'''
+
+from collections import OrderedDict
+from data        import opcodes
+from callgraph   import CALL_IDS
+from persistent  import snapshot
+from semantics   import MODULAR_OPS, SHIFT_OPS, check_shift, shift_limit, truncated_div, wrap
+from strength    import int_type
+from walk        import children, postorder
+
+PHI_IDS   = opcodes(['phi'])
+CONST_IDS = opcodes(['const'])
+LOCAL_IDS = opcodes(['ldloc', 'stloc'])
+LDLOC_IDS = opcodes(['ldloc'])
+
+# deeper expressions are split into temporaries (the python parser has a nesting limit)
+MAX_INLINE_DEPTH = 32
+
+# python expressions of the operations on python ints, before wrapping around (`truncated_div` and `check_shift` are the ones
+# of `semantics`, the last argument of a shift is the limit of its count)
+EXPRESSIONS = {
+  'add':  '({} + {})',
+  'sub':  '({} - {})',
+  'mul':  '({} * {})',
+  'div':  'truncated_div({}, {})',
+  'less': 'int({} < {})',
+  'shl':  '({} << check_shift({}, {}))',
+  'shr':  '({} >> check_shift({}, {}))',
+  'neg':  '(-{})',
+}
+
+# the operations whose result may be out of the range of their type, when their operands are in it
+WRAPPED_OPS = MODULAR_OPS + ['div', 'shl']
+
+# how many compiled modules and compiled sources are kept (the least recently used ones are dropped)
+MODULE_CACHE_SIZE = 64
+CODE_CACHE_SIZE   = 64
+
+class LRUCache:
+  '''
+  Data structure for handling a dict keeping only its `size` most recently used entries
+  '''
+
+  def __init__(self, size):
+    self.size    = size
+    self.entries = OrderedDict()
+
+  def __len__(self):
+    return len(self.entries)
+
+  def __contains__(self, key):
+    return key in self.entries
+
+  def get(self, key):
+    '''
+    This function returns the value of `key` (`None` when it isn't cached), making it the most recently used
+    '''
+
+    if key not in self.entries:
+      return None
+
+    self.entries.move_to_end(key)
+    return self.entries[key]
+
+  def put(self, key, value):
+    self.entries[key] = value
+    self.entries.move_to_end(key)
+
+    while len(self.entries) > self.size:
+      self.entries.popitem(last=False)
+
+  def clear(self):
+    self.entries.clear()
+
+# compiled modules by the identity of their blocks (an entry keeps its blocks alive, so the identities in its key aren't reused
+# while it's cached, and they can be freed once it's dropped)
+MODULE_CACHE = LRUCache(MODULE_CACHE_SIZE)
+# compiled code by source, for modules with equal functions
+CODE_CACHE   = LRUCache(CODE_CACHE_SIZE)
+
+def wrapped(expr, typ):
+  '''
+  This function returns the python expression `expr` wrapped around to the range of `typ` (expressions of types without
+  a fixed width are returned as they are)
+  '''
+
+  info = int_type(typ)
+
+  if info is None:
+    return expr
+
+  signed, width = info
+  mask          = (1 << width) - 1
+
+  if not signed:
+    return f'({expr} & {mask})'
+
+  # adding the sign bit before masking and subtracting it after maps the unsigned range to the signed one
+  bias = 1 << (width - 1)
+  return f'(({expr} + {bias} & {mask}) - {bias})'
+
+class FunctionWriter:
+  '''
+  Data structure for handling the translation of a function into python source lines
+  '''
+
+  def __init__(self, fn_name, ssa, identifiers):
+    self.fn_name     = fn_name
+    self.ssa         = ssa
+    self.identifiers = identifiers # python identifier of each function of the module
+    self.lines       = []
+    self.temps       = 0
+    self.index       = { block_name: i for i, block_name in enumerate(ssa.keys()) }
+
+  def new_temp(self):
+    self.temps += 1
+    return f't{self.temps - 1}'
+
+  def leaf(self, node):
+    match node.code:
+      case 'const':
+        return repr(wrap(node.value, node.typ))
+
+      case 'ldloc':
+        return f'l{node.loc}'
+
+      case 'ldphi':
+        return f'phi_{node.name}'
+
+  def operation(self, node, operands, args):
+    '''
+    This function returns the python expression of the operation `node` on the expressions `args` of its `operands`
+    '''
+
+    # operands of another type (like the `i64` products of `strength.div_by_const`) are converted to the one of the operation,
+    # the results of the modular operations are the same either way
+    if node.code not in MODULAR_OPS:
+      args = [arg if operand.typ == node.typ else wrapped(arg, node.typ) for operand, arg in zip(operands, args)]
+
+    if node.code in SHIFT_OPS:
+      args.append(shift_limit(node.typ))
+
+    expr = EXPRESSIONS[node.code].format(*args)
+
+    return wrapped(expr, node.typ) if node.code in WRAPPED_OPS else expr
+
+  def expression(self, root, memo, uses, indent):
+    '''
+    This function returns the python expression of `root`, the temporaries it needs are assigned first (appended to the lines),
+    `memo` contains the expression and the depth of the nodes already translated in the block (by id)
+    '''
+
+    for node in postorder(root, skip=memo):
+      operands = children(node)
+
+      if node.code in ['const', 'ldloc', 'ldphi']:
+        expr, depth = self.leaf(node), 0
+      else:
+        args  = [memo[id(o)][0] for o in operands]
+        depth = 1 + max((memo[id(o)][1] for o in operands), default=0)
+
+        match node.code:
+          case 'call':
+            fn   = self.identifiers.get(node.fn, f'externals[{node.fn!r}]')
+            expr = f'{fn}({", ".join(args)})'
+
+          case 'stloc':
+            expr = args[0]
+
+          case 'ret' | 'branch':
+            expr = args[0] if len(args) > 0 else 'None'
+
+          case _:
+            expr = self.operation(node, operands, args)
+
+      # a shared node is one value (a `ldloc` is read before the following stores), and `call`s keep their order
+      if node is not root and (node.op in CALL_IDS or (uses.get(id(node), 0) > 1 and node.op not in CONST_IDS) or depth > MAX_INLINE_DEPTH):
+        temp = self.new_temp()
+        self.lines.append(f'{indent}{temp} = {expr}')
+        expr, depth = temp, 0
+
+      memo[id(node)] = expr, depth
+
+    return memo[id(root)][0]
+
+  def jump(self, pred, target, memo, uses, indent):
+    '''
+    This function appends the lines assigning the phis of `target` (when coming from `pred`) and jumping to it
+    '''
+
+    phis = [phi for phi in self.ssa[target] if phi.op in PHI_IDS]
+
+    if len(phis) > 0:
+      values = [self.expression(phi.values[phi.preds.index(pred)], memo, uses, indent) for phi in phis]
+      self.lines.append(f'{indent}{", ".join(f"phi_{phi.name}" for phi in phis)} = {", ".join(values)}')
+
+    self.lines.append(f'{indent}block = {self.index[target]}')
+    self.lines.append(f'{indent}continue')
+
+  def write_block(self, block_name, indent):
+    block = [instr for instr in self.ssa[block_name] if instr.op not in PHI_IDS]
+    memo  = {}
+    uses  = {}
+
+    for instr in block:
+      for node in postorder(instr):
+        for child in children(node):
+          uses[id(child)] = uses.get(id(child), 0) + 1
+
+    for instr in block:
+      match instr.code:
+        case 'stloc':
+          self.lines.append(f'{indent}l{instr.loc} = {self.expression(instr, memo, uses, indent)}')
+
+        case 'ret':
+          self.lines.append(f'{indent}return {self.expression(instr, memo, uses, indent)}')
+          return
+
+        case 'goto':
+          self.jump(block_name, instr.target, memo, uses, indent)
+          return
+
+        case 'branch':
+          cond = self.expression(instr, memo, uses, indent)
+          self.lines.append(f'{indent}if {cond}:')
+          # the values of the phis computed on an edge aren't computed on the other one
+          self.jump(block_name, instr.T, dict(memo), uses, indent + '  ')
+          self.lines.append(f'{indent}else:')
+          self.jump(block_name, instr.F, dict(memo), uses, indent + '  ')
+          return
+
+        # an instruction used for its sideeffects
+        case _:
+          self.lines.append(f'{indent}{self.expression(instr, memo, uses, indent)}')
+
+    # a block without terminator returns nothing
+    self.lines.append(f'{indent}return None')
+
+  def write(self):
+    '''
+    This function returns the source of the function
+    '''
+
+    locs  = sorted({ node.loc for block in self.ssa.values() for instr in block for node in postorder(instr) if node.op in LOCAL_IDS })
+    # the type each local is read as, so the parameters can be wrapped around to it
+    types = { node.loc: node.typ for block in self.ssa.values() for instr in block for node in postorder(instr) if node.op in LDLOC_IDS }
+    phis = [instr.name for block in self.ssa.values() for instr in block if instr.op in PHI_IDS]
+
+    self.lines.append(f'def {self.identifiers[self.fn_name]}(*args):')
+
+    # the parameters are the first locals
+    for loc in locs:
+      self.lines.append(f'  l{loc} = {wrapped(f"args[{loc}]", types.get(loc, ""))} if len(args) > {loc} else None')
+
+    for name in phis:
+      self.lines.append(f'  phi_{name} = None')
+
+    if len(self.ssa) == 1:
+      self.write_block(next(iter(self.ssa.keys())), '  ')
+    else:
+      self.lines.append('  block = 0')
+      self.lines.append('  while True:')
+
+      for i, block_name in enumerate(self.ssa.keys()):
+        self.lines.append(f'    {"if" if i == 0 else "elif"} block == {i}:')
+        self.write_block(block_name, '      ')
+
+    return '\n'.join(self.lines)
+
+def module_source(ssa_functions):
+  '''
+  This function returns the python source of `ssa_functions` and the identifier of each function in it
+  '''
+
+  identifiers = { fn_name: f'fn{i}' for i, fn_name in enumerate(ssa_functions.keys()) }
+  source      = '\n\n'.join(FunctionWriter(fn_name, ssa, identifiers).write() for fn_name, ssa in ssa_functions.items())
+
+  return source, identifiers
+
+class CompiledModule:
+  '''
+  Data structure for handling the python callables of a compiled module, `module[fn_name](*args)` runs a function
+  '''
+
+  def __init__(self, source, functions, blocks):
+    self.source    = source
+    self.functions = functions
+    # the blocks of the module, so their identities stay valid as cache key
+    self.blocks    = blocks
+
+  def __getitem__(self, fn_name):
+    return self.functions[fn_name]
+
+def compile_module(ssa_functions, externals={}):
+  '''
+  This function returns `ssa_functions` compiled to python (see `CompiledModule`), `externals` are the callables
+  of the functions called but not in the module
+
+  The result is cached: compiling again a module whose blocks weren't rewritten (see `persistent`) returns the same callables
+  '''
+
+  blocks = snapshot(ssa_functions)
+  key    = (id(externals),) + tuple((fn_name, block_name, id(block)) for fn_name, ssa in blocks.items() for block_name, block in ssa.items())
+
+  if key in MODULE_CACHE:
+    return MODULE_CACHE.get(key)
+
+  source, identifiers = module_source(ssa_functions)
+
+  if source not in CODE_CACHE:
+    CODE_CACHE.put(source, compile(source, '<ssa-module>', 'exec'))
+
+  namespace = { 'externals': externals, 'truncated_div': truncated_div, 'check_shift': check_shift }
+  exec(CODE_CACHE.get(source), namespace)
+
+  module = CompiledModule(source, { fn_name: namespace[identifier] for fn_name, identifier in identifiers.items() }, (blocks, externals))
+  MODULE_CACHE.put(key, module)
+
+  return module
+
+def clear_cache():
+  MODULE_CACHE.clear()
+  CODE_CACHE.clear()
@@ -0,0 +1,174 @@
+'''
+This module contains the benchmarks of the optimizer: random modules (see `generate`) of increasing size are converted
+into ssa and optimized, the results are written as json, so they can be compared with the ones of an older run
+
+  python bench.py --sizes 1000 10000 100000 1000000 --output bench_output.json
+  python bench.py --compare old.json
+  python bench.py --tier 0
+
+Each size is run in a forked process, so its peak memory (the max resident set size) doesn't include the runs before it
+'''
+
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from generate           import GeneratorOptions, generate_module, add_calls
+from stackir2ssa        import sir2ssa
+from optimizer          import optimize0, optimize1, OPTIMIZER_VERSION
+from parallel           import optimize_parallel
+from inline             import function_size
+
+DEFAULT_SIZES  = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_OUTPUT = 'bench_output.json'
+# instructions of each generated function, a module of `size` instructions has `size // FUNCTION_SIZE` functions
+FUNCTION_SIZE  = 1_000
+# the relative throughput loss reported as regression by `compare`
+TOLERANCE      = 0.2
+
+# the throughputs compared by `compare`
+THROUGHPUTS = ['sir2ssa_instrs_per_s', 'optimize_instrs_per_s']
+
+def peak_memory_kb():
+  # `ru_maxrss` is in bytes on macos, in kilobytes elsewhere
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak // 1024 if sys.platform == 'darwin' else peak
+
+def bench_size(size, seed, options, call_ratio, workers, tier=1):
+  '''
+  This function returns the measures of converting and optimizing a random module of about `size` sir instructions,
+  with `optimize1` or with `optimize0` (from the sir, so the conversion is measured again) when `tier` is 0
+  '''
+
+  functions = max(1, size // options.size)
+
+  start         = time.perf_counter()
+  sir_functions = generate_module(seed, functions, sir=True, options=options)
+  generate_time = time.perf_counter() - start
+  sir_instrs    = sum(len(sir) for sir in sir_functions.values())
+
+  start         = time.perf_counter()
+  ssa_functions = { fn_name: sir2ssa(sir) for fn_name, sir in sir_functions.items() }
+  sir2ssa_time  = time.perf_counter() - start
+  ssa_nodes     = sum(function_size(ssa) for ssa in ssa_functions.values())
+
+  # the calls are added to the ssa (the sir has no `call`, so the low tier runs without them)
+  if call_ratio > 0 and tier > 0:
+    add_calls(ssa_functions, seed, call_ratio)
+
+  start = time.perf_counter()
+
+  if tier == 0:
+    passes, result = optimize0(sir_functions)
+  else:
+    passes, result = optimize1(ssa_functions) if workers <= 1 else optimize_parallel(ssa_functions, workers=workers)
+
+  optimize_time = time.perf_counter() - start
+
+  return {
+    'size':                  size,
+    'functions':             functions,
+    'sir_instrs':            sir_instrs,
+    'ssa_nodes':             ssa_nodes,
+    'optimized_ssa_nodes':   sum(function_size(ssa) for ssa in result.values()),
+    'generate_s':            generate_time,
+    'sir2ssa_s':             sir2ssa_time,
+    'sir2ssa_instrs_per_s':  sir_instrs / sir2ssa_time if sir2ssa_time > 0 else None,
+    'optimize_s':            optimize_time,
+    'optimize_instrs_per_s': sir_instrs / optimize_time if optimize_time > 0 else None,
+    'passes':                passes,
+    'peak_memory_kb':        peak_memory_kb(),
+  }
+
+def run(sizes, seed=0, options=None, call_ratio=0.0, workers=1, tier=1):
+  '''
+  This function returns the results of the benchmarks (see `bench_size`) with the configuration used
+  '''
+
+  options = options or GeneratorOptions(size=FUNCTION_SIZE)
+  results = []
+
+  for size in sizes:
+    # a fresh process per size, so the peak memory is the one of this size only
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('fork')) as pool:
+      results.append(pool.submit(bench_size, size, seed, options, call_ratio, workers, tier).result())
+
+    print(f'{size:>9} instrs: sir2ssa {results[-1]["sir2ssa_s"]:.3f}s, optimize {results[-1]["optimize_s"]:.3f}s '
+          f'({results[-1]["passes"]} passes), peak {results[-1]["peak_memory_kb"] // 1024}mb', file=sys.stderr)
+
+  return {
+    'optimizer_version': OPTIMIZER_VERSION,
+    'python':            platform.python_version(),
+    'platform':          platform.platform(),
+    'time':              time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'seed':              seed,
+    'call_ratio':        call_ratio,
+    'workers':           workers,
+    'tier':              tier,
+    'options':           vars(options),
+    'results':           results,
+  }
+
+def compare(old, new, tolerance=TOLERANCE):
+  '''
+  This function returns the regressions of `new` compared to `old` (results of `run`): the throughputs of the same size
+  which got slower by more than `tolerance`
+  '''
+
+  old_results = { r['size']: r for r in old['results'] }
+  regressions = []
+
+  for result in new['results']:
+    if result['size'] not in old_results:
+      continue
+
+    for measure in THROUGHPUTS:
+      before, after = old_results[result['size']][measure], result[measure]
+
+      if before and after and after < before * (1 - tolerance):
+        regressions.append({ 'size': result['size'], 'measure': measure, 'before': before, 'after': after })
+
+  return regressions
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='benchmarks of sir2ssa and optimize1 on random modules')
+  parser.add_argument('--sizes',          type=int,   nargs='+', default=DEFAULT_SIZES, help='sir instructions of each module')
+  parser.add_argument('--seed',           type=int,   default=0)
+  parser.add_argument('--function-size',  type=int,   default=FUNCTION_SIZE)
+  parser.add_argument('--branch-density', type=float, default=0.15)
+  parser.add_argument('--max-depth',      type=int,   default=4)
+  parser.add_argument('--const-ratio',    type=float, default=0.3)
+  parser.add_argument('--call-ratio',     type=float, default=0.0, help='probability of a store calling another function')
+  parser.add_argument('--workers',        type=int,   default=1, help='more than 1 uses `parallel.optimize_parallel`')
+  parser.add_argument('--tier',           type=int,   default=1, choices=[0, 1], help='0 uses `optimizer.optimize0`')
+  parser.add_argument('--output',         default=DEFAULT_OUTPUT)
+  parser.add_argument('--compare',        metavar='OLD', help='results of an older run, exits with 1 on regressions')
+  parser.add_argument('--tolerance',      type=float, default=TOLERANCE)
+  args = parser.parse_args(argv)
+
+  options = GeneratorOptions(
+    size=args.function_size, branch_density=args.branch_density, max_depth=args.max_depth, const_ratio=args.const_ratio,
+  )
+  results = run(args.sizes, args.seed, options, args.call_ratio, args.workers, args.tier)
+
+  with open(args.output, 'w') as f:
+    json.dump(results, f, indent=2)
+
+  if args.compare is not None:
+    with open(args.compare) as f:
+      regressions = compare(json.load(f), results, args.tolerance)
+
+    for r in regressions:
+      print(f'regression: {r["measure"]} of size {r["size"]} went from {r["before"]:.0f} to {r["after"]:.0f}', file=sys.stderr)
+
+    return 1 if len(regressions) > 0 else 0
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
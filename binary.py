@@ -0,0 +1,397 @@
+'''
+This module contains the binary file format of modules (sir or ssa functions), which can be read lazily: the file is memory mapped
+and a function is only decoded when it's requested
+
+A file is made of (integers are unsigned varints, unless said otherwise):
+* the header (see `HEADER`): magic, format version, kind (`KIND_SIR` or `KIND_SSA`), functions count, offsets of the strings and of the index
+* the records of the functions, one after the other
+* the strings table: count, then length and utf8 bytes of each string (names, types, opcodes, labels and string operands),
+  strings are referred by their index in the table
+* the index (see `INDEX_ENTRY`): name, offset and size of the record of each function
+
+A record starts with the opcodes table (name and operands count of each opcode used by the function) and the types table,
+instructions refer to them by index, then:
+* ssa: the nodes children first (see `serialize`), each one is its opcode, its type and its operands, an instruction operand
+  is the index of an earlier node (so a shared subtree is written once), then the blocks (name and indexes of their instructions)
+* sir: the instructions, a label is opcode `SIR_LABEL` followed by its name, the others are their opcode + 1, their type and their operands
+
+Operands are tagged values (see `Tag`), since the same slot may hold different kinds of values
+'''
+
+import mmap
+import struct
+
+from data      import Instr, Label, instr_from_operands, OPERANDS
+from serialize import Operand, encode_function
+
+MAGIC   = b'IRMF'
+VERSION = 1
+
+KIND_SIR = 0
+KIND_SSA = 1
+
+# the opcode of labels in sir records, the opcodes of the instructions come after it
+SIR_LABEL = 0
+
+HEADER      = struct.Struct('<4sBBHIQQ') # magic, version, kind, unused, functions count, strings offset, index offset
+INDEX_ENTRY = struct.Struct('<IQQ')      # name (string index), offset, size
+FLOAT       = struct.Struct('<d')
+
+class Tag:
+  '''
+  The tags of the operands (a class, so the reader can `match` on the names)
+  '''
+
+  NONE   = 0
+  INT    = 1 # zigzag varint
+  STR    = 2 # string index
+  FLOAT  = 3 # 8 bytes double
+  FALSE  = 4
+  TRUE   = 5
+  NODE   = 6 # node index
+  NODES  = 7 # count, node indexes
+  VALUES = 8 # count, tagged values
+
+def write_varint(out, n):
+  while n >= 0x80:
+    out.append((n & 0x7f) | 0x80)
+    n >>= 7
+
+  out.append(n)
+
+def zigzag(n):
+  return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+def unzigzag(n):
+  return n >> 1 if n & 1 == 0 else -((n + 1) >> 1)
+
+class StringTable:
+  '''
+  Data structure for handling the strings table of a file being written
+  '''
+
+  def __init__(self):
+    self.index = {}
+
+  def __call__(self, s):
+    return self.index.setdefault(s, len(self.index))
+
+  def write(self, out):
+    write_varint(out, len(self.index))
+
+    for s in self.index.keys():
+      data = s.encode()
+      write_varint(out, len(data))
+      out.extend(data)
+
+class RecordWriter:
+  '''
+  Data structure for handling the encoding of a function record (see the module)
+  '''
+
+  def __init__(self, strings):
+    self.strings = strings
+    self.out     = bytearray()
+
+  def varint(self, n):
+    write_varint(self.out, n)
+
+  def value(self, value):
+    # `bool` is checked before `int`, since it's a subclass of it
+    if value is None:
+      self.out.append(Tag.NONE)
+    elif value is False or value is True:
+      self.out.append(Tag.TRUE if value else Tag.FALSE)
+    elif isinstance(value, int):
+      self.out.append(Tag.INT)
+      self.varint(zigzag(value))
+    elif isinstance(value, str):
+      self.out.append(Tag.STR)
+      self.varint(self.strings(value))
+    elif isinstance(value, float):
+      self.out.append(Tag.FLOAT)
+      self.out.extend(FLOAT.pack(value))
+    elif isinstance(value, (list, tuple)):
+      self.out.append(Tag.VALUES)
+      self.varint(len(value))
+
+      for v in value:
+        self.value(v)
+    else:
+      raise TypeError(f'operand `{value!r}` can\'t be serialized')
+
+  def tables(self, codes, types):
+    self.varint(len(codes))
+
+    for code in codes:
+      self.varint(self.strings(code))
+      self.varint(len(OPERANDS[code]))
+
+    self.varint(len(types))
+
+    for typ in types:
+      self.varint(self.strings(typ))
+
+  def ssa(self, ssa):
+    codes, types, nodes, blocks = encode_function(ssa)
+
+    self.tables(codes, types)
+    self.varint(len(nodes))
+
+    for code, typ, kinds, operands in nodes:
+      self.varint(code)
+      self.varint(typ)
+
+      for kind, operand in zip(kinds, operands):
+        match kind:
+          case Operand.VALUE | Operand.VALUES:
+            self.value(operand)
+
+          case Operand.NODE:
+            self.out.append(Tag.NODE)
+            self.varint(operand)
+
+          case Operand.NODES:
+            self.out.append(Tag.NODES)
+            self.varint(len(operand))
+
+            for i in operand:
+              self.varint(i)
+
+    self.varint(len(blocks))
+
+    for block_name, roots in blocks:
+      self.varint(self.strings(block_name))
+      self.varint(len(roots))
+
+      for i in roots:
+        self.varint(i)
+
+  def sir(self, sir):
+    codes = {}
+    types = {}
+
+    for instr in sir:
+      if isinstance(instr, Instr):
+        codes.setdefault(instr.code, len(codes))
+        types.setdefault(instr.typ, len(types))
+
+    self.tables(list(codes.keys()), list(types.keys()))
+    self.varint(len(sir))
+
+    for instr in sir:
+      if isinstance(instr, Label):
+        self.varint(SIR_LABEL)
+        self.varint(self.strings(instr.name))
+        continue
+
+      self.varint(codes[instr.code] + SIR_LABEL + 1)
+      self.varint(types[instr.typ])
+
+      for operand in instr.operands():
+        self.value(operand)
+
+def write_module(path, functions):
+  '''
+  This function writes the module `functions` (sir or ssa functions by name, or an iterable of `(fn_name, function)` pairs,
+  like a generator, each function is only encoded when it's written) into the file at `path`
+  '''
+
+  items   = functions.items() if isinstance(functions, dict) else functions
+  strings = StringTable()
+  index   = []
+  kind    = None
+
+  with open(path, 'wb') as f:
+    # the header is written again at the end, when the offsets are known
+    f.write(bytes(HEADER.size))
+
+    for fn_name, fn in items:
+      fn_kind = KIND_SSA if isinstance(fn, dict) else KIND_SIR
+
+      if kind is not None and fn_kind != kind:
+        raise ValueError('a module can\'t mix sir and ssa functions')
+
+      kind   = fn_kind
+      record = RecordWriter(strings)
+
+      if kind == KIND_SSA:
+        record.ssa(fn)
+      else:
+        record.sir(list(fn))
+
+      index.append((strings(fn_name), f.tell(), len(record.out)))
+      f.write(record.out)
+
+    strings_offset = f.tell()
+    table          = bytearray()
+    strings.write(table)
+    f.write(table)
+
+    index_offset = f.tell()
+
+    for entry in index:
+      f.write(INDEX_ENTRY.pack(*entry))
+
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, VERSION, KIND_SSA if kind is None else kind, 0, len(index), strings_offset, index_offset))
+
+class RecordReader:
+  '''
+  Data structure for handling the decoding of a function record (see the module), `data` is the buffer of the file
+  '''
+
+  def __init__(self, data, pos, strings):
+    self.data    = data
+    self.pos     = pos
+    self.strings = strings
+
+  def varint(self):
+    n     = 0
+    shift = 0
+
+    while True:
+      byte      = self.data[self.pos]
+      self.pos += 1
+      n        |= (byte & 0x7f) << shift
+      shift    += 7
+
+      if byte < 0x80:
+        return n
+
+  def value(self, nodes=None):
+    tag       = self.data[self.pos]
+    self.pos += 1
+
+    match tag:
+      case Tag.NONE:   return None
+      case Tag.INT:    return unzigzag(self.varint())
+      case Tag.STR:    return self.strings[self.varint()]
+      case Tag.FLOAT:
+        value     = FLOAT.unpack_from(self.data, self.pos)[0]
+        self.pos += FLOAT.size
+        return value
+      case Tag.FALSE:  return False
+      case Tag.TRUE:   return True
+      case Tag.NODE:   return nodes[self.varint()]
+      case Tag.NODES:  return [nodes[self.varint()] for _ in range(self.varint())]
+      case Tag.VALUES: return [self.value(nodes) for _ in range(self.varint())]
+
+    raise ValueError(f'unknown operand tag {tag}')
+
+  def tables(self):
+    codes = [(self.strings[self.varint()], self.varint()) for _ in range(self.varint())]
+    types = [self.strings[self.varint()] for _ in range(self.varint())]
+
+    return codes, types
+
+  def ssa(self):
+    codes, types = self.tables()
+    nodes        = []
+
+    for _ in range(self.varint()):
+      code, arity = codes[self.varint()]
+      typ         = types[self.varint()]
+
+      nodes.append(instr_from_operands(code, typ, [self.value(nodes) for _ in range(arity)]))
+
+    blocks = {}
+
+    for _ in range(self.varint()):
+      block_name         = self.strings[self.varint()]
+      blocks[block_name] = [nodes[self.varint()] for _ in range(self.varint())]
+
+    return blocks
+
+  def sir(self):
+    codes, types = self.tables()
+    sir          = []
+
+    for _ in range(self.varint()):
+      code = self.varint()
+
+      if code == SIR_LABEL:
+        sir.append(Label(self.strings[self.varint()]))
+        continue
+
+      code, arity = codes[code - SIR_LABEL - 1]
+      typ         = types[self.varint()]
+
+      sir.append(instr_from_operands(code, typ, [self.value() for _ in range(arity)]))
+
+    return sir
+
+class ModuleFile:
+  '''
+  Data structure for handling a module file opened for reading, `module[fn_name]` decodes a function,
+  only the header, the strings and the index are read when opening it
+  '''
+
+  def __init__(self, path):
+    self.file = open(path, 'rb')
+    self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, self.kind, _, count, strings_offset, index_offset = HEADER.unpack_from(self.data, 0)
+
+    if magic != MAGIC or version != VERSION:
+      self.close()
+      raise ValueError(f'`{path}` isn\'t a module file (version {VERSION})')
+
+    reader       = RecordReader(self.data, strings_offset, None)
+    self.strings = []
+
+    for _ in range(reader.varint()):
+      size = reader.varint()
+      self.strings.append(str(self.data[reader.pos:reader.pos + size], 'utf8'))
+      reader.pos += size
+
+    # offset and size of each record, by function name
+    self.index = {}
+
+    for i in range(count):
+      name, offset, size             = INDEX_ENTRY.unpack_from(self.data, index_offset + i * INDEX_ENTRY.size)
+      self.index[self.strings[name]] = offset, size
+
+  def __getitem__(self, fn_name):
+    offset, _ = self.index[fn_name]
+    reader    = RecordReader(self.data, offset, self.strings)
+
+    return reader.ssa() if self.kind == KIND_SSA else reader.sir()
+
+  def __contains__(self, fn_name):
+    return fn_name in self.index
+
+  def __len__(self):
+    return len(self.index)
+
+  def __iter__(self):
+    return iter(self.index.keys())
+
+  def keys(self):
+    return self.index.keys()
+
+  def items(self):
+    '''
+    This function yields `(fn_name, function)` pairs, decoding each function when it's reached
+    '''
+
+    for fn_name in self.index.keys():
+      yield fn_name, self[fn_name]
+
+  def close(self):
+    self.data.close()
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+def load_module(path):
+  '''
+  This function returns all the functions of the module file at `path`
+  '''
+
+  with ModuleFile(path) as module:
+    return dict(module.items())
@@ -0,0 +1,253 @@
+'''
+This module contains the persistent optimization cache: optimized functions are stored on disk, keyed by a hash of their content,
+so the functions which didn't change since the last build are loaded instead of optimized again
+
+* the structural hash of a function is the hash of its flat encoding (see `serialize`), which is the same for equal functions
+  and tells apart shared and duplicated nodes (a shared node is a single value, see `hashcons`)
+* the key of a function mixes its name and structural hash with the ones of the functions it may inline or evaluate
+  (the functions of the module it calls, directly or not, with how many calls to them the module has, see `inline.should_inline`),
+  the optimizer version and the passes configuration (with the bytecode of each pass, see `passes_hash`)
+* entries are files named after their key, the least recently used ones are removed when the cache grows over its size
+'''
+
+import os
+import pickle
+import hashlib
+
+from types      import CodeType
+from callgraph  import CallGraph
+from optimizer  import O1_PASSES, OPTIMIZER_VERSION
+from persistent import copy_on_write
+from serialize  import encode_function, decode_function
+
+# the size of the cache directory, in bytes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+def digest(data):
+  return hashlib.blake2b(repr(data).encode(), digest_size=16).hexdigest()
+
+def structural_hash(ssa):
+  '''
+  This function returns the hash of the content of the ssa function `ssa` (blocks and instruction trees)
+  '''
+
+  return digest(encode_function(ssa))
+
+def code_key(code):
+  '''
+  This function returns the bytecode of the code object `code` with its constants (nested code objects included) and the names it reads,
+  it tells apart functions with the same name, like the lambdas registered as passes (which are all `<lambda>`)
+  '''
+
+  return code.co_code, tuple(code_key(c) if isinstance(c, CodeType) else c for c in code.co_consts), code.co_names
+
+def pass_key(p):
+  code = getattr(p.fn, '__code__', None)
+  return p.name, p.kind, p.order, p.fn.__module__, p.fn.__qualname__, None if code is None else code_key(code)
+
+def passes_hash(pass_manager):
+  '''
+  This function returns the hash of the configuration of `pass_manager` (the code of each pass included) and of the optimizer version
+  '''
+
+  return digest((OPTIMIZER_VERSION, [pass_key(p) for p in pass_manager.passes]))
+
+def function_keys(ssa_functions, pass_manager=O1_PASSES):
+  '''
+  This function returns the cache key of each function of `ssa_functions` (see the module)
+  '''
+
+  graph  = CallGraph(ssa_functions)
+  hashes = { fn_name: structural_hash(ssa) for fn_name, ssa in ssa_functions.items() }
+  config = passes_hash(pass_manager)
+  keys   = {}
+
+  for fn_name in ssa_functions.keys():
+    # the functions reachable from this one
+    reached = {}
+    stack   = list(graph.callees[fn_name])
+
+    while len(stack) > 0:
+      callee = stack.pop()
+
+      if callee in reached:
+        continue
+
+      reached[callee] = hashes[callee], graph.sites[callee]
+      stack.extend(graph.callees[callee])
+
+    keys[fn_name] = digest((config, fn_name, hashes[fn_name], sorted(reached.items())))
+
+  return keys
+
+class CacheStats:
+  '''
+  Data structure for handling the counters of an `OptimizationCache`
+  '''
+
+  def __init__(self):
+    self.hits      = 0
+    self.misses    = 0
+    self.stores    = 0
+    self.evictions = 0
+
+  def hit_rate(self):
+    lookups = self.hits + self.misses
+    return self.hits / lookups if lookups > 0 else 0.0
+
+  def as_dict(self):
+    return {
+      'hits':      self.hits,
+      'misses':    self.misses,
+      'stores':    self.stores,
+      'evictions': self.evictions,
+      'hit_rate':  self.hit_rate(),
+    }
+
+  def __repr__(self):
+    return f'CacheStats({", ".join(f"{k}={v}" for k, v in self.as_dict().items())})'
+
+class OptimizationCache:
+  '''
+  Data structure for handling a directory of optimized functions (see the module), bounded to `max_bytes`
+
+  The recency of an entry is the modification time of its file (a hit touches it), so it survives across processes,
+  the size of the directory is read once and kept up to date by the stores, so the entries are only listed again when
+  it grows over `max_bytes` (the stores made by other processes are counted then)
+  '''
+
+  SUFFIX = '.ssa'
+
+  def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+    self.path      = path
+    self.max_bytes = max_bytes
+    self.stats     = CacheStats()
+    self.total     = None # the size of the entries, read by the first store
+
+    os.makedirs(path, exist_ok=True)
+
+  def entry_path(self, key):
+    return os.path.join(self.path, key + self.SUFFIX)
+
+  def entries(self):
+    '''
+    This function returns `(last use, size, path)` for each entry, least recently used first
+    '''
+
+    result = []
+
+    for entry in os.scandir(self.path):
+      if entry.name.endswith(self.SUFFIX):
+        stat = entry.stat()
+        result.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+    return sorted(result)
+
+  def size(self):
+    return sum(size for _, size, _ in self.entries())
+
+  def get(self, key):
+    '''
+    This function returns the function stored for `key`, `None` when it's not cached
+    '''
+
+    path = self.entry_path(key)
+
+    try:
+      with open(path, 'rb') as f:
+        encoded = pickle.load(f)
+
+      os.utime(path)
+    # a missing entry, or one evicted (or half written) by another process
+    except (OSError, EOFError, pickle.UnpicklingError):
+      self.stats.misses += 1
+      return None
+
+    self.stats.hits += 1
+    return decode_function(encoded)
+
+  def put(self, key, ssa):
+    '''
+    This function stores the function `ssa` for `key`, then evicts the least recently used entries if the cache is too big
+    '''
+
+    path = self.entry_path(key)
+    temp = f'{path}.{os.getpid()}.tmp'
+
+    # written aside and renamed, so readers never see a partial entry
+    with open(temp, 'wb') as f:
+      pickle.dump(encode_function(ssa), f, pickle.HIGHEST_PROTOCOL)
+
+    if self.total is None:
+      self.total = self.size()
+
+    # an entry stored again replaces the old one
+    try:
+      self.total -= os.path.getsize(path)
+    except OSError:
+      pass
+
+    self.total += os.path.getsize(temp)
+
+    os.replace(temp, path)
+    self.stats.stores += 1
+
+    if self.total > self.max_bytes:
+      self.evict()
+
+  def evict(self):
+    '''
+    This function removes the least recently used entries until the cache fits `max_bytes`
+    '''
+
+    entries = self.entries()
+    total   = sum(size for _, size, _ in entries)
+
+    for _, size, path in entries:
+      if total <= self.max_bytes:
+        break
+
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        continue
+
+      total                 -= size
+      self.stats.evictions += 1
+
+    self.total = total
+
+  def clear(self):
+    for _, _, path in self.entries():
+      os.remove(path)
+
+    self.total = 0
+
+def optimize_cached(ssa_functions, cache, pass_manager=O1_PASSES):
+  '''
+  This function does the same of `optimize1` (it returns `(passes, ssa_functions)`), but the functions found in `cache`
+  aren't optimized, the other ones are optimized (reading the cached version of their callees) and stored in it
+  '''
+
+  keys    = function_keys(ssa_functions, pass_manager)
+  # only the function dicts are copied (see `persistent.copy_on_write`)
+  module  = copy_on_write(ssa_functions)
+  missing = []
+
+  for fn_name, key in keys.items():
+    cached = cache.get(key)
+
+    if cached is None:
+      missing.append(fn_name)
+    else:
+      module[fn_name] = cached
+
+  if len(missing) == 0:
+    return 0, module
+
+  passes = pass_manager.run(module, missing)
+
+  for fn_name in missing:
+    cache.put(keys[fn_name], module[fn_name])
+
+  return passes, module
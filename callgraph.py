@@ -0,0 +1,119 @@
+'''
+This module contains the call graph of a module (`ssa_functions`): functions are nodes, `call`s to functions of the module are edges
+'''
+
+from data import opcodes
+from walk import postorder
+
+CALL_IDS = opcodes(['call'])
+
+def calls_in(ssa):
+  '''
+  This function yields the `call`s in the instructions of `ssa` (a function), in evaluation order
+  '''
+
+  for block in ssa.values():
+    for instr in block:
+      for node in postorder(instr):
+        if node.op in CALL_IDS:
+          yield node
+
+class CallGraph:
+  '''
+  Data structure for handling the call graph of `ssa_functions`, calls to functions outside the module are ignored
+  '''
+
+  def __init__(self, ssa_functions):
+    self.callees = { fn_name: [] for fn_name in ssa_functions.keys() }
+    # how many `call`s to each function are in the module
+    self.sites   = { fn_name: 0 for fn_name in ssa_functions.keys() }
+
+    for fn_name, ssa in ssa_functions.items():
+      for call in calls_in(ssa):
+        if call.fn not in ssa_functions:
+          continue
+
+        self.sites[call.fn] += 1
+
+        if call.fn not in self.callees[fn_name]:
+          self.callees[fn_name].append(call.fn)
+
+  def sccs(self):
+    '''
+    This function returns the strongly connected components of the graph (using Tarjan's algorithm without recursion),
+    each one comes after the components it calls, so callees are met before their callers
+    '''
+
+    index    = {} # visit order of each function
+    lowlink  = {} # lowest index reachable from the function
+    stack    = [] # functions whose component isn't complete yet
+    on_stack = set()
+    result   = []
+
+    for root in self.callees.keys():
+      if root in index:
+        continue
+
+      # the iterator tells which callees of the function are still to visit
+      work = [(root, iter(self.callees[root]))]
+      index[root] = lowlink[root] = len(index)
+      stack.append(root)
+      on_stack.add(root)
+
+      while len(work) > 0:
+        fn_name, callees = work[-1]
+
+        for callee in callees:
+          if callee not in index:
+            index[callee] = lowlink[callee] = len(index)
+            stack.append(callee)
+            on_stack.add(callee)
+            work.append((callee, iter(self.callees[callee])))
+            break
+
+          if callee in on_stack:
+            lowlink[fn_name] = min(lowlink[fn_name], index[callee])
+
+        # all the callees were visited
+        else:
+          work.pop()
+
+          if len(work) > 0:
+            caller          = work[-1][0]
+            lowlink[caller] = min(lowlink[caller], lowlink[fn_name])
+
+          # the function is the root of its component
+          if lowlink[fn_name] == index[fn_name]:
+            component = []
+
+            while True:
+              member = stack.pop()
+              on_stack.discard(member)
+              component.append(member)
+
+              if member == fn_name:
+                break
+
+            result.append(component)
+
+    return result
+
+  def recursive(self):
+    '''
+    This function returns the set of the functions which can (directly or not) call themselves
+    '''
+
+    result = set()
+
+    for component in self.sccs():
+      if len(component) > 1 or component[0] in self.callees[component[0]]:
+        result.update(component)
+
+    return result
+
+  def bottom_up(self):
+    '''
+    This function returns the names of the functions, callees before their callers (functions of the same cycle are adjacent)
+    '''
+
+    return [fn_name for component in self.sccs() for fn_name in component]
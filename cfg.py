@@ -0,0 +1,216 @@
+'''
+This module contains the control flow graph of a ssa function (blocks are nodes, `branch`/`goto` targets are edges)
+'''
+
+from data import opcodes
+from walk import postorder
+
+LOCAL_IDS = opcodes(['ldloc', 'stloc'])
+
+def successors(block):
+  '''
+  This function returns the names of the blocks reachable from the end of `block` (a block without `branch`/`goto` has no successors)
+  '''
+
+  if len(block) == 0:
+    return []
+
+  last = block[-1]
+
+  match last.code:
+    case 'goto':
+      return [last.target]
+
+    case 'branch':
+      return [last.T] if last.T == last.F else [last.T, last.F]
+
+    case _:
+      return []
+
+class CFG:
+  '''
+  Data structure for handling the control flow graph of `ssa`, the entry block is the first one
+  '''
+
+  def __init__(self, ssa):
+    self.entry = next(iter(ssa.keys()))
+    self.succs = { block_name: successors(block) for block_name, block in ssa.items() }
+    self.preds = { block_name: [] for block_name in ssa.keys() }
+
+    for block_name, succs in self.succs.items():
+      for succ in succs:
+        self.preds[succ].append(block_name)
+
+  def reverse_postorder(self):
+    '''
+    This function returns the names of the blocks reachable from the entry, each one before its successors (excluding back edges)
+    '''
+
+    postorder = []
+    visited   = { self.entry }
+    # the iterator tells which successors of the block are still to visit
+    stack     = [(self.entry, iter(self.succs[self.entry]))]
+
+    while len(stack) > 0:
+      block_name, succs = stack[-1]
+
+      for succ in succs:
+        if succ not in visited:
+          visited.add(succ)
+          stack.append((succ, iter(self.succs[succ])))
+          break
+
+      # all the successors were visited
+      else:
+        stack.pop()
+        postorder.append(block_name)
+
+    return postorder[::-1]
+
+  def reachable(self):
+    '''
+    This function returns the set of the names of the blocks reachable from the entry
+    '''
+
+    return set(self.reverse_postorder())
+
+  def dominators(self):
+    '''
+    This function returns the immediate dominator of each block reachable from the entry (the entry is dominated by itself),
+    using the iterative algorithm of Cooper, Harvey and Kennedy
+    '''
+
+    rpo   = self.reverse_postorder()
+    index = { block_name: i for i, block_name in enumerate(rpo) }
+    idom  = { self.entry: self.entry }
+
+    def intersect(a, b):
+      # walking up the dominator tree until the two blocks meet
+      while a != b:
+        while index[a] > index[b]:
+          a = idom[a]
+
+        while index[b] > index[a]:
+          b = idom[b]
+
+      return a
+
+    changed = True
+
+    while changed:
+      changed = False
+
+      for block_name in rpo[1:]:
+        # only the predecessors already processed are considered
+        preds    = [pred for pred in self.preds[block_name] if pred in idom]
+        new_idom = preds[0]
+
+        for pred in preds[1:]:
+          new_idom = intersect(pred, new_idom)
+
+        if idom.get(block_name) != new_idom:
+          idom[block_name] = new_idom
+          changed          = True
+
+    return idom
+
+  def dominance_frontiers(self, idom):
+    '''
+    This function returns the dominance frontier of each block reachable from the entry
+    (the blocks where its dominance ends, which is where phis are needed for values it defines)
+    '''
+
+    frontiers = { block_name: set() for block_name in idom.keys() }
+
+    for block_name in idom.keys():
+      preds = [pred for pred in self.preds[block_name] if pred in idom]
+
+      if len(preds) < 2:
+        continue
+
+      for pred in preds:
+        runner = pred
+
+        while runner != idom[block_name]:
+          frontiers[runner].add(block_name)
+          runner = idom[runner]
+
+    return frontiers
+
+def dominator_tree(idom):
+  '''
+  This function returns the children of each block in the dominator tree described by `idom`
+  '''
+
+  tree = { block_name: [] for block_name in idom.keys() }
+
+  for block_name, dominator in idom.items():
+    if block_name != dominator:
+      tree[dominator].append(block_name)
+
+  return tree
+
+def dominates(idom, a, b):
+  '''
+  This function returns whether the block `a` dominates the block `b`
+  '''
+
+  while b != a:
+    # reached the entry
+    if idom[b] == b:
+      return False
+
+    b = idom[b]
+
+  return True
+
+def remove_phi_incoming(block, pred):
+  '''
+  This function returns `block` without the phi values coming from `pred` (the edge from `pred` was removed)
+  '''
+
+  return [
+    instr.replace(
+      preds=[p for p in instr.preds if p != pred],
+      values=[v for p, v in zip(instr.preds, instr.values) if p != pred]
+    ) if instr.code == 'phi' and pred in instr.preds else instr
+    for instr in block
+  ]
+
+def rename_phi_pred(block, old, new):
+  '''
+  This function returns `block` with the phi values coming from `old` now coming from each block in the list `new`
+  '''
+
+  renamed = []
+
+  for instr in block:
+    if instr.code == 'phi' and old in instr.preds:
+      preds, values = [], []
+
+      for p, v in zip(instr.preds, instr.values):
+        preds.extend(new if p == old else [p])
+        values.extend([v] * len(new) if p == old else [v])
+
+      instr = instr.replace(preds=preds, values=values)
+
+    renamed.append(instr)
+
+  return renamed
+
+def max_label(ssa):
+  '''
+  This function returns the highest `n` of the blocks of `ssa` named `l<n>` (`-1` when there are none), so `l<n + 1>` is a new block name
+  '''
+
+  return max((int(block_name[1:]) for block_name in ssa.keys() if block_name[1:].isdigit()), default=-1)
+
+def max_local(ssa):
+  '''
+  This function returns the highest local read or stored by `ssa` (`-1` when there are none), so `n + 1` is a new local
+  '''
+
+  return max((node.loc for block in ssa.values() for instr in block for node in postorder(instr) if node.op in LOCAL_IDS), default=-1)
+
+def has_phis(block):
+  return len(block) > 0 and block[0].code == 'phi'
@@ -0,0 +1,27 @@
+import random
+import pytest
+
+from interpreter import Interpreter, Bailout
+
+def check_same_results(before, after, fn_names=None, runs=8, params=2, seed=0):
+  '''
+  This function asserts that the functions of `after` return what the ones of `before` return, on random args
+  (args where `before` can't run are skipped, like a division by zero)
+  '''
+
+  rng = random.Random(seed)
+
+  for fn_name in fn_names or before.keys():
+    for _ in range(runs):
+      args = [rng.choice([rng.randint(-20, 20), rng.randint(-2**40, 2**40)]) for _ in range(params)]
+
+      try:
+        expected = Interpreter(before, fuel=10**6).call(fn_name, list(args))
+      except Bailout:
+        continue
+
+      assert Interpreter(after, fuel=10**7).call(fn_name, list(args)) == expected, (fn_name, args)
+
+@pytest.fixture
+def same_results():
+  return check_same_results
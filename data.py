@@ -4,37 +4,162 @@ This module contains data structure for
   - SSA instructions
 '''
 
+from sys import intern
+
+# operand slots of each instruction code (sir instructions leave the ssa only operands to `None`, for example `add` in sir has no `l` and `r`)
+OPERANDS = {
+  'ldloc':  ('loc',),
+  'ldc':    ('value',),
+  'const':  ('value',),
+  'stloc':  ('loc', 'value'),
+  'add':    ('l', 'r'),
+  'sub':    ('l', 'r'),
+  'mul':    ('l', 'r'),
+  'div':    ('l', 'r'),
+  'less':   ('l', 'r'),
+  'shl':    ('l', 'r'),
+  'shr':    ('l', 'r'),
+  'neg':    ('value',),
+  'ret':    ('value',),
+  'pop':    (),
+  'jmp':    ('target',),
+  'jmpf':   ('target',),
+  'goto':   ('target',),
+  'branch': ('value', 'T', 'F'),
+  'call':   ('fn', 'args'),
+  'phi':    ('name', 'preds', 'values'), # at the beginning of a block, `values[i]` is the value when coming from `preds[i]`
+  'ldphi':  ('name',),                   # reads the value of the phi `name`
+}
+
+OPCODES        = []  # integer opcode -> instruction code
+OPCODE_CLASSES = {}  # instruction code -> slotted `Instr` subclass
+
 class Instr:
   '''
   Data structure for handling sir and ssa instruction
+
+  The instance is created from the subclass of its code (see `register_opcode`), which has fixed operand slots,
+  while `code` and `op` (the integer opcode) are class attributes, so a node only stores `typ` and its operands
+
+  Instructions are never mutated once built (use `replace`), so optimized functions can share nodes with the unoptimized ones
   '''
 
-  def __init__(self, code, typ, **kwargs):
-    assert 'code' not in kwargs
-    assert 'typ'  not in kwargs
+  __slots__ = ('typ',)
+
+  code     = None
+  op       = None
+  OPERANDS = ()
+
+  def __new__(cls, code, typ, **kwargs):
+    if code not in OPCODE_CLASSES:
+      raise ValueError(f'unknown instr code `{code}`')
+
+    return object.__new__(OPCODE_CLASSES[code])
+
+  def __reduce__(self):
+    # used by `copy` and `pickle`, since `__new__` needs the instruction code
+    return instr_from_operands, (self.code, self.typ, self.operands())
+
+  def __repr__(self):
+    kwargs = ''.join(f', {k}={repr(v)}' for k, v in self.fields())
+    return f'Instr({repr(self.code)}, {repr(self.typ)}{kwargs})'
+
+  def operands(self):
+    '''
+    This function returns the values of the operand slots, in declaration order
+    '''
+
+    return tuple(getattr(self, name) for name in self.OPERANDS)
+
+  def fields(self):
+    '''
+    This function returns the operands as `(name, value)` pairs (the compatibility replacement for `__dict__.items()`)
+    '''
+
+    return [(name, getattr(self, name)) for name in self.OPERANDS]
+
+  def replace(self, **kwargs):
+    '''
+    This function returns a copy of the instruction with the operands in `kwargs` replaced (the other operands are shared)
+    '''
+
+    return Instr(self.code, self.typ, **{ **dict(self.fields()), **kwargs })
 
-    self.__dict__ = kwargs
-    self.code     = code
-    self.typ      = typ
-  
   def to_human_readable_sir(self):
     '''
     This function returns a representation of the instruction formatted as 'code typ argN=...'
     '''
 
-    kwargs = ", ".join(f"{k}={repr(self.__dict__[k])}" for k in filter(lambda k: k not in ["code", "typ"], self.__dict__.keys()))
+    kwargs = ", ".join(f"{k}={repr(v)}" for k, v in self.fields() if v is not None)
     return f'{self.code} {self.typ} {kwargs}'
 
+def register_opcode(code, operands):
+  '''
+  This function creates the slotted `Instr` subclass for `code`, assigning it the next integer opcode
+  '''
+
+  assert code not in OPCODE_CLASSES
+
+  # generating an `__init__` with one keyword argument per operand slot is faster than a generic loop over `**kwargs`
+  # (types are interned, so comparing them is comparing pointers)
+  namespace = { 'intern': intern }
+  exec(
+    f'def __init__(self, code, typ, {"".join(f"{name}=None, " for name in operands)}):\n'
+    f'  self.typ = intern(typ)\n' +
+    ''.join(f'  self.{name} = {name}\n' for name in operands),
+    namespace
+  )
+
+  OPERANDS[code]       = tuple(operands)
+  OPCODE_CLASSES[code] = type(f'Instr_{code}', (Instr,), {
+    '__slots__': tuple(operands),
+    '__init__':  namespace['__init__'],
+    'code':      intern(code),
+    'op':        len(OPCODES),
+    'OPERANDS':  tuple(operands),
+  })
+  OPCODES.append(code)
+
+def opcode(code):
+  '''
+  This function returns the integer opcode of `code`
+  '''
+
+  return OPCODE_CLASSES[code].op
+
+def opcodes(codes):
+  '''
+  This function returns the set of integer opcodes of `codes` (for fast membership tests)
+  '''
+
+  return frozenset(map(opcode, codes))
+
+def instr_from_operands(code, typ, operands):
+  '''
+  This function does the same of `Instr(code, typ, **kwargs)`, but takes the operands in declaration order
+  '''
+
+  return Instr(code, typ, **dict(zip(OPERANDS[code], operands)))
+
+for code, operands in list(OPERANDS.items()):
+  del OPERANDS[code]
+  register_opcode(code, operands)
+
 class Label:
   '''
   Data structure for handling a sir label
   '''
 
+  __slots__ = ('name',)
+
   def __init__(self, name):
     self.name = name
-  
+
   def __eq__(self, r):
     return isinstance(r, Label) and self.name == r.name
-  
+
+  def __repr__(self):
+    return f'Label({repr(self.name)})'
+
   def to_human_readable_sir(self):
-    return f'{self.name}:'
\ No newline at end of file
+    return f'{self.name}:'
@@ -0,0 +1,232 @@
+'''
+This module contains the passes removing dead code from a ssa function, they are built on its control flow graph (see `cfg`)
+and return the names of the blocks they changed (or removed)
+'''
+
+from data      import Instr, opcodes
+from cfg       import CFG, successors, remove_phi_incoming, rename_phi_pred, has_phis
+from semantics import wrap
+from walk      import postorder, collect_instructions_with_sideeffects
+
+LDLOC_IDS = opcodes(['ldloc'])
+STLOC_IDS = opcodes(['stloc'])
+CONST_IDS = opcodes(['const'])
+
+def fold_constant_branches(ssa):
+  '''
+  This function replaces `branch`es on a constant value (or with the same target on both sides) with a `goto`
+  '''
+
+  dirty = []
+
+  for block_name, block in list(ssa.items()):
+    if len(block) == 0 or block[-1].code != 'branch':
+      continue
+
+    branch = block[-1]
+
+    # the constant is a value of its type (a `u8` `256` is `0`)
+    if branch.value.op in CONST_IDS:
+      target = branch.T if wrap(branch.value.value, branch.value.typ) else branch.F
+    elif branch.T == branch.F:
+      target = branch.T
+    else:
+      continue
+
+    # the condition isn't computed anymore, but its sideeffects (like `call`s) still happen before jumping
+    ssa[block_name] = block[:-1] + collect_instructions_with_sideeffects(branch) + [Instr('goto', 'void', target=target)]
+    dirty.append(block_name)
+
+    # the block isn't a predecessor of the other target anymore
+    for dropped in {branch.T, branch.F} - {target}:
+      ssa[dropped] = remove_phi_incoming(ssa[dropped], block_name)
+      dirty.append(dropped)
+
+  return dirty
+
+def remove_unreachable_blocks(ssa):
+  '''
+  This function removes the blocks which can't be reached from the entry block
+  '''
+
+  reachable   = CFG(ssa).reachable()
+  unreachable = [block_name for block_name in ssa.keys() if block_name not in reachable]
+
+  dirty       = list(unreachable)
+
+  for block_name in unreachable:
+    # the reachable successors lose a predecessor
+    for succ in successors(ssa[block_name]):
+      if succ in reachable:
+        ssa[succ] = remove_phi_incoming(ssa[succ], block_name)
+        dirty.append(succ)
+
+  for block_name in unreachable:
+    del ssa[block_name]
+
+  return dirty
+
+def retarget(instr, old, new):
+  '''
+  This function returns `instr` (a `goto` or a `branch`) with its `old` targets replaced by `new`
+  '''
+
+  match instr.code:
+    case 'goto':
+      return instr.replace(target=new) if instr.target == old else instr
+
+    case 'branch':
+      return instr.replace(T=new if instr.T == old else instr.T, F=new if instr.F == old else instr.F)
+
+  return instr
+
+def thread_empty_blocks(ssa):
+  '''
+  This function redirects the jumps to blocks containing only a `goto` to the target of that `goto`
+  '''
+
+  dirty = []
+  cfg   = CFG(ssa)
+
+  for block_name in list(ssa.keys()):
+    # the block may have been retargeted while threading the blocks before it
+    block = ssa[block_name]
+
+    # the entry block can't be skipped, and a block jumping to itself is an infinite loop
+    if block_name == cfg.entry or len(block) != 1 or block[0].code != 'goto' or block[0].target == block_name:
+      continue
+
+    target = block[0].target
+
+    # the phis of the target need a value for each predecessor, which can't be two different ones
+    if has_phis(ssa[target]):
+      if any(pred in cfg.preds[target] for pred in cfg.preds[block_name]):
+        continue
+
+      ssa[target] = rename_phi_pred(ssa[target], block_name, cfg.preds[block_name])
+      dirty.append(target)
+
+    for pred in cfg.preds[block_name]:
+      ssa[pred]       = ssa[pred][:-1] + [retarget(ssa[pred][-1], block_name, target)]
+      cfg.succs[pred] = successors(ssa[pred])
+      dirty.append(pred)
+
+      if pred not in cfg.preds[target]:
+        cfg.preds[target].append(pred)
+
+    # the block is now unreachable
+    cfg.preds[target]     = [pred for pred in cfg.preds[target] if pred != block_name]
+    cfg.preds[block_name] = []
+
+  return dirty
+
+def merge_straight_blocks(ssa):
+  '''
+  This function merges each block ending with a `goto` with the target one, when it's its only predecessor
+  '''
+
+  dirty = []
+  cfg   = CFG(ssa)
+
+  for block_name in list(ssa.keys()):
+    # the block was merged into its predecessor
+    if block_name not in ssa:
+      continue
+
+    while len(ssa[block_name]) > 0 and ssa[block_name][-1].code == 'goto':
+      target = ssa[block_name][-1].target
+
+      # a block with phis is left to the phis simplification (see `mem2reg`)
+      if target == block_name or target == cfg.entry or cfg.preds[target] != [block_name] or has_phis(ssa[target]):
+        break
+
+      ssa[block_name] = ssa[block_name][:-1] + ssa.pop(target)
+      dirty.extend([block_name, target])
+
+      # the successors of the target are now the successors of the merged block
+      cfg.succs[block_name] = cfg.succs.pop(target)
+      del cfg.preds[target]
+
+      for succ in cfg.succs[block_name]:
+        cfg.preds[succ] = [block_name if pred == target else pred for pred in cfg.preds[succ]]
+        ssa[succ]       = rename_phi_pred(ssa[succ], target, [block_name])
+        dirty.append(succ)
+
+  return dirty
+
+def locals_read(instr):
+  '''
+  This function returns the set of locals read by `instr` (and its operands)
+  '''
+
+  return { node.loc for node in postorder(instr) if node.op in LDLOC_IDS }
+
+def liveness(ssa, cfg):
+  '''
+  This function returns the sets of the locals live at the beginning and at the end of each block (which may be read before being written again)
+  '''
+
+  gen  = {} # locals read by the block before being written
+  kill = {} # locals written by the block
+
+  for block_name, block in ssa.items():
+    gen[block_name], kill[block_name] = set(), set()
+
+    for instr in block:
+      gen[block_name] |= locals_read(instr) - kill[block_name]
+
+      if instr.op in STLOC_IDS:
+        kill[block_name].add(instr.loc)
+
+  live_in  = { block_name: set() for block_name in ssa.keys() }
+  live_out = { block_name: set() for block_name in ssa.keys() }
+  # liveness flows backward, so successors are visited first
+  order    = cfg.reverse_postorder()[::-1]
+  changed  = True
+
+  while changed:
+    changed = False
+
+    for block_name in order:
+      live_out[block_name] = set().union(*(live_in[succ] for succ in cfg.succs[block_name]))
+      new_live_in          = gen[block_name] | (live_out[block_name] - kill[block_name])
+
+      if new_live_in != live_in[block_name]:
+        live_in[block_name] = new_live_in
+        changed             = True
+
+  return live_in, live_out
+
+def remove_dead_stores(ssa):
+  '''
+  This function removes the `stloc`s to locals which are never read again (keeping the instructions with sideeffects of their values)
+  '''
+
+  dirty    = []
+  _, live_out = liveness(ssa, CFG(ssa))
+
+  for block_name, block in list(ssa.items()):
+    live      = set(live_out[block_name])
+    new_block = []
+    changed   = False
+
+    # walking the block backward, so `live` contains the locals read after the current instruction
+    for instr in reversed(block):
+      if instr.op in STLOC_IDS and instr.loc not in live:
+        kept    = collect_instructions_with_sideeffects(instr)
+        changed = True
+      else:
+        kept    = [instr]
+
+        if instr.op in STLOC_IDS:
+          live.discard(instr.loc)
+
+      for k in reversed(kept):
+        live |= locals_read(k)
+        new_block.append(k)
+
+    if changed:
+      ssa[block_name] = new_block[::-1]
+      dirty.append(block_name)
+
+  return dirty
@@ -0,0 +1,231 @@
+'''
+This module contains the generator of random programs, used by the benchmarks (see `bench`): the same seed and options
+always give the same program
+
+Programs are valid and terminate:
+* locals are stored before being read (the parameters are the first locals, see `inline`), and the stack is empty at labels and jumps
+* divisions are by non zero constants
+* loops are counted, `for (i = 0; i < n; i = i + 1)` with a constant `n`, and their counter is only stored by the loop
+'''
+
+import random
+
+from data        import Instr, Label
+from stackir2ssa import sir2ssa
+from walk        import postorder
+
+BIN_OPS = ['add', 'sub', 'mul', 'div', 'less', 'shl', 'shr']
+
+class GeneratorOptions:
+  '''
+  Data structure for handling the options of the generator
+
+  * `size`           about how many sir instructions a function has
+  * `branch_density` the probability of a statement being an `if` (a `jmpf` and a `jmp`) or a loop, instead of a store
+  * `loop_ratio`     the probability of a control flow statement being a loop
+  * `max_depth`      the maximum depth of expressions
+  * `const_ratio`    the probability of an expression leaf being a constant (otherwise it's a local)
+  * `max_nesting`    the maximum nesting of control flow statements
+  * `params`         how many parameters a function has
+  * `locals`         how many locals a function has (parameters included)
+  * `max_trips`      the maximum trip count of loops
+  * `typ`            the type of the values
+  '''
+
+  def __init__(self, size=100, branch_density=0.15, loop_ratio=0.3, max_depth=4, const_ratio=0.3, max_nesting=3,
+               params=2, locals=8, max_trips=8, typ='i32'):
+    self.size           = size
+    self.branch_density = branch_density
+    self.loop_ratio     = loop_ratio
+    self.max_depth      = max_depth
+    self.const_ratio    = const_ratio
+    self.max_nesting    = max_nesting
+    self.params         = params
+    self.locals         = max(locals, params + 1)
+    self.max_trips      = max_trips
+    self.typ            = typ
+
+class SirGenerator:
+  '''
+  Data structure for handling the generation of a sir function (see `generate_sir`)
+  '''
+
+  def __init__(self, rng, options):
+    self.rng      = rng
+    self.options  = options
+    self.sir      = []
+    self.labels   = 0
+    # the next local used as loop counter (the counters come after the other locals, so the statements never store them)
+    self.counter  = options.locals
+
+  def emit(self, code, **operands):
+    self.sir.append(Instr(code, operands.pop('typ', self.options.typ), **operands))
+
+  def new_label(self):
+    self.labels += 1
+    return f'L{self.labels - 1}'
+
+  def expression(self, depth):
+    '''
+    This function emits the instructions pushing a random expression at most `depth` deep
+    '''
+
+    rng = self.rng
+
+    if depth <= 1 or rng.random() < 0.25:
+      if rng.random() < self.options.const_ratio:
+        self.emit('ldc', value=rng.randint(-100, 100))
+      else:
+        self.emit('ldloc', loc=rng.randrange(self.options.locals))
+
+      return
+
+    if rng.random() < 0.1:
+      self.expression(depth - 1)
+      self.emit('neg')
+      return
+
+    code = rng.choice(BIN_OPS)
+    self.expression(depth - 1)
+
+    # the right operand of divisions and shifts is a constant, so they are always defined
+    match code:
+      case 'div':
+        self.emit('ldc', value=rng.choice([-1, 1]) * rng.randint(1, 50))
+
+      case 'shl' | 'shr':
+        self.emit('ldc', value=rng.randint(0, 8))
+
+      case _:
+        self.expression(depth - 1)
+
+    self.emit(code)
+
+  def store(self):
+    loc = self.rng.randrange(self.options.locals)
+
+    self.expression(self.options.max_depth)
+    self.emit('stloc', loc=loc, typ='void')
+
+  def if_statement(self, budget, nesting):
+    else_label = self.new_label()
+    end_label  = self.new_label()
+
+    self.expression(self.options.max_depth)
+    self.emit('jmpf', target=else_label, typ='void')
+    self.statements(budget // 2, nesting + 1)
+    self.emit('jmp', target=end_label, typ='void')
+    self.sir.append(Label(else_label))
+    self.statements(budget // 2, nesting + 1)
+    self.sir.append(Label(end_label))
+
+  def loop(self, budget, nesting):
+    counter       = self.counter
+    self.counter += 1
+    head          = self.new_label()
+    exit          = self.new_label()
+
+    self.emit('ldc', value=0)
+    self.emit('stloc', loc=counter, typ='void')
+    self.sir.append(Label(head))
+    self.emit('ldloc', loc=counter)
+    self.emit('ldc', value=self.rng.randint(1, self.options.max_trips))
+    self.emit('less')
+    self.emit('jmpf', target=exit, typ='void')
+    self.statements(budget, nesting + 1)
+
+    self.emit('ldloc', loc=counter)
+    self.emit('ldc', value=1)
+    self.emit('add')
+    self.emit('stloc', loc=counter, typ='void')
+    self.emit('jmp', target=head, typ='void')
+    self.sir.append(Label(exit))
+
+  def statements(self, budget, nesting):
+    '''
+    This function emits statements until about `budget` instructions are emitted
+    '''
+
+    end = len(self.sir) + max(budget, 1)
+
+    while len(self.sir) < end:
+      if nesting < self.options.max_nesting and self.rng.random() < self.options.branch_density:
+        remaining = end - len(self.sir)
+
+        if self.rng.random() < self.options.loop_ratio:
+          self.loop(remaining // 3, nesting)
+        else:
+          self.if_statement(remaining // 3, nesting)
+      else:
+        self.store()
+
+  def generate(self):
+    # the locals which aren't parameters are initialized
+    for loc in range(self.options.params, self.options.locals):
+      self.emit('ldc', value=self.rng.randint(-100, 100))
+      self.emit('stloc', loc=loc, typ='void')
+
+    self.statements(self.options.size - len(self.sir) - 2 * self.options.max_depth, 0)
+    self.expression(self.options.max_depth)
+    self.emit('ret')
+
+    return self.sir
+
+def generate_sir(seed=0, options=None, **kwargs):
+  '''
+  This function returns a random sir function, `options` (or the `kwargs`) are the ones of `GeneratorOptions`
+  '''
+
+  return SirGenerator(random.Random(seed), options or GeneratorOptions(**kwargs)).generate()
+
+def generate_ssa(seed=0, options=None, **kwargs):
+  '''
+  This function returns a random ssa function (a random sir function converted, see `generate_sir`)
+  '''
+
+  return sir2ssa(generate_sir(seed, options, **kwargs))
+
+def add_calls(ssa_functions, seed=0, call_ratio=0.1):
+  '''
+  This function makes the functions of `ssa_functions` call the ones before them: the value of a store becomes
+  `value + f(value, x)` with probability `call_ratio` (`x` is a local read by the value, so it's already stored, or the value
+  itself), the call graph has no cycles
+  '''
+
+  rng   = random.Random(seed)
+  names = list(ssa_functions.keys())
+
+  for i, fn_name in enumerate(names[1:], 1):
+    ssa = ssa_functions[fn_name]
+
+    for block_name, block in list(ssa.items()):
+      new_block = []
+
+      for instr in block:
+        if instr.code == 'stloc' and rng.random() < call_ratio:
+          value = instr.value
+          x     = next((node for node in postorder(value) if node.code == 'ldloc'), value)
+          call  = Instr('call', value.typ, fn=names[rng.randrange(i)], args=[value, x])
+          instr = instr.replace(value=Instr('add', value.typ, l=value, r=call))
+
+        new_block.append(instr)
+
+      ssa[block_name] = new_block
+
+  return ssa_functions
+
+def generate_module(seed=0, functions=10, sir=False, call_ratio=0.0, options=None, **kwargs):
+  '''
+  This function returns a module of `functions` random functions (`f0`, `f1`, ...), as sir when `sir` is true,
+  otherwise as ssa, where functions call the ones before them (see `add_calls`)
+  '''
+
+  options = options or GeneratorOptions(**kwargs)
+  module  = { f'f{i}': generate_sir(seed * 1_000_003 + i, options) for i in range(functions) }
+
+  if sir:
+    return module
+
+  ssa_functions = { fn_name: sir2ssa(fn) for fn_name, fn in module.items() }
+
+  return add_calls(ssa_functions, seed, call_ratio) if call_ratio > 0 else ssa_functions
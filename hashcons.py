@@ -0,0 +1,96 @@
+'''
+This module contains the hash consing layer for ssa instructions (structurally equal instructions become the same node,
+turning instruction trees into a dag) and the global value numbering pass built on it
+
+A node referenced more than once in the same block represents a single value (it's computed once, see `utils.ssa_chunk_to_human_readable`),
+so only instructions without sideeffects are interned, and `ldloc`s are numbered with the version of the local they read
+(a `stloc` creates a new version of its local)
+'''
+
+from data import Instr, opcodes
+from walk import transform
+
+# instructions whose value only depends on their operands (and, for `ldloc`, on the version of the local)
+PURE_OPS     = ['add', 'sub', 'mul', 'div', 'less', 'shl', 'shr', 'neg', 'const', 'ldloc', 'ldphi']
+PURE_OPS_IDS = opcodes(PURE_OPS)
+LDLOC_IDS    = opcodes(['ldloc'])
+STLOC_IDS    = opcodes(['stloc'])
+
+class HashConsTable:
+  '''
+  Data structure for handling the interned instructions, each one is keyed by its value number
+  (code, type and the identity of its already interned operands)
+  '''
+
+  def __init__(self):
+    self.table = {}
+
+  def operand_key(self, operand):
+    # interned instructions are compared by identity
+    if isinstance(operand, Instr):
+      return id(operand)
+
+    # `call` args
+    if isinstance(operand, list):
+      return tuple(map(self.operand_key, operand))
+
+    # the class is part of the key because `1 == 1.0 == True`
+    return operand.__class__, operand
+
+  def intern(self, instr, local_version=lambda loc: 0):
+    '''
+    This function returns the interned version of `instr` (the first structurally equal instruction met),
+    `local_version(loc)` gives the version of the local read by a `ldloc`
+    '''
+
+    return transform(instr, lambda node: (False, self.intern_node(node, local_version)))[1]
+
+  def intern_node(self, instr, local_version):
+    '''
+    This function does the same of `intern`, but assumes the operands of `instr` are already interned
+    '''
+
+    if instr.op not in PURE_OPS_IDS:
+      return instr
+
+    key = (instr.op, instr.typ, tuple(map(self.operand_key, instr.operands())))
+
+    # `ldloc`s reading different versions of the same local are different values
+    if instr.op in LDLOC_IDS:
+      key += (local_version(instr.loc),)
+
+    # the instruction is the first of its value number
+    return self.table.setdefault(key, instr)
+
+  def __len__(self):
+    return len(self.table)
+
+def global_value_numbering(ssa):
+  '''
+  This function interns the instructions of each block of `ssa` in a table shared by the whole function,
+  so equal subexpressions become the same node (common subexpression elimination), returns the names of the changed blocks
+
+  `ldloc`s are only merged inside the same block, since the version of a local at the beginning of a block is unknown
+  '''
+
+  table = HashConsTable()
+  dirty = []
+
+  for block_name, block in list(ssa.items()):
+    new_block = []
+    # how many `stloc`s to each local were met so far in the block
+    versions  = {}
+
+    for instr in block:
+      new_block.append(table.intern(instr, lambda loc: (block_name, versions.get(loc, 0))))
+
+      # the value of the `stloc` is read before storing, so the version is bumped after interning it
+      if instr.op in STLOC_IDS:
+        versions[instr.loc] = versions.get(instr.loc, 0) + 1
+
+    # replacing the block only when an instruction was merged
+    if any(a is not b for a, b in zip(new_block, block)):
+      ssa[block_name] = new_block
+      dirty.append(block_name)
+
+  return dirty
@@ -0,0 +1,222 @@
+'''
+This module contains the inliner: `call`s to functions of the module are replaced with a copy of the callee's blocks,
+when a size/benefit cost model says it pays off
+
+The callee's parameters are locals `0..len(args) - 1`, so the args are stored into the (renumbered) parameters before jumping
+to the copied entry block, and each `ret` becomes a store to a new local followed by a `goto` to the block continuing the caller
+'''
+
+from data      import Instr, opcodes
+from cfg       import successors, rename_phi_pred, has_phis, max_label, max_local
+from callgraph import CallGraph, CALL_IDS
+from walk      import postorder, transform
+
+CONST_IDS = opcodes(['const'])
+PHI_IDS   = opcodes(['phi'])
+LDPHI_IDS = opcodes(['ldphi'])
+RET_IDS   = opcodes(['ret'])
+
+# callees with at most these many nodes are always inlined
+INLINE_THRESHOLD = 40
+# callees called once in the module are inlined up to these many nodes (the copy replaces the only use)
+SINGLE_SITE_THRESHOLD = 400
+# each constant arg makes the callee this cheaper, since it can be folded once inlined
+CONST_ARG_BONUS = 10
+# callers aren't grown past these many nodes
+CALLER_BUDGET = 4000
+
+def function_size(ssa):
+  '''
+  This function returns how many nodes are in the instructions of `ssa` (a function)
+  '''
+
+  return sum(1 for block in ssa.values() for instr in block for node in postorder(instr))
+
+def should_inline(call, callee_size, sites, threshold=INLINE_THRESHOLD, single_site_threshold=SINGLE_SITE_THRESHOLD):
+  '''
+  This function returns whether inlining `call` to a callee of `callee_size` nodes, called from `sites` places in the module, pays off
+  '''
+
+  cost = callee_size - CONST_ARG_BONUS * sum(1 for arg in call.args if arg.op in CONST_IDS)
+
+  return cost <= threshold or (sites == 1 and cost <= single_site_threshold)
+
+def first_call(instr):
+  '''
+  This function returns the first `call` evaluated by `instr`, or `None`
+  '''
+
+  for node in postorder(instr):
+    if node.op in CALL_IDS:
+      return node
+
+  return None
+
+def rename_callee(callee, labels, locals_base, phi_names, ret_local, cont):
+  '''
+  This function returns the blocks of `callee` renamed with `labels`, with locals moved after `locals_base` and phis renamed with `phi_names`,
+  each `ret` stores its value into `ret_local` (when it's not `None`) and jumps to the block `cont`
+  '''
+
+  def rename(node):
+    match node.code:
+      case 'ldloc' | 'stloc':
+        return True, node.replace(loc=node.loc + locals_base)
+
+      case 'ldphi':
+        return True, node.replace(name=phi_names[node.name])
+
+      case 'phi':
+        return True, node.replace(name=phi_names[node.name], preds=[labels[p] for p in node.preds])
+
+      case 'goto':
+        return True, node.replace(target=labels[node.target])
+
+      case 'branch':
+        return True, node.replace(T=labels[node.T], F=labels[node.F])
+
+      case _:
+        return False, node
+
+  memo   = {}
+  blocks = {}
+
+  for block_name, block in callee.items():
+    new_block = []
+
+    for instr in block:
+      instr = transform(instr, rename, memo)[1]
+
+      if instr.op in RET_IDS:
+        if ret_local is not None and instr.value is not None:
+          new_block.append(Instr('stloc', 'void', loc=ret_local, value=instr.value))
+
+        new_block.append(Instr('goto', 'void', target=cont))
+        # instructions following a `ret` are never executed
+        break
+
+      new_block.append(instr)
+
+    # a block without terminator returns
+    if len(new_block) == 0 or new_block[-1].code not in ['goto', 'branch']:
+      new_block.append(Instr('goto', 'void', target=cont))
+
+    blocks[labels[block_name]] = new_block
+
+  return blocks
+
+def inline_call(ssa, block_name, index, call, callee):
+  '''
+  This function replaces `call` (the first one evaluated by `ssa[block_name][index]`) with a copy of `callee`,
+  the block is split at the instruction, which is moved to a new block reading the returned value from a new local
+  '''
+
+  block       = ssa[block_name]
+  instr       = block[index]
+  next_label  = max_label(ssa) + 1
+  locals_base = max_local(ssa) + 1
+  ret_local   = locals_base + max_local(callee) + 1
+  labels      = {}
+
+  for callee_block in callee.keys():
+    labels[callee_block] = f'l{next_label}'
+    next_label          += 1
+
+  cont = f'l{next_label}'
+
+  # phis names are unique in a function, so the callee's ones get a suffix
+  used      = { i.name for b in ssa.values() for i in b if i.op in PHI_IDS }
+  phi_names = {}
+
+  for b in callee.values():
+    for i in b:
+      if i.op in PHI_IDS:
+        n = 0
+
+        while f'{i.name}_{n}' in used:
+          n += 1
+
+        phi_names[i.name] = f'{i.name}_{n}'
+        used.add(phi_names[i.name])
+
+  # the args are evaluated in order and stored in the parameters, then the copied body is entered
+  pre = block[:index] + [Instr('stloc', 'void', loc=locals_base + i, value=arg) for i, arg in enumerate(call.args)]
+  pre.append(Instr('goto', 'void', target=labels[next(iter(callee.keys()))]))
+
+  # the instruction reads the returned value instead of calling (a `call` used as instruction is just dropped)
+  if instr is call:
+    rest = block[index + 1:]
+  else:
+    ret_value = Instr('ldloc', call.typ, loc=ret_local)
+    rest      = [transform(instr, lambda node: (True, ret_value) if node is call else (False, node))[1]] + block[index + 1:]
+
+  # the successors of the block are now reached from the continuation
+  for succ in successors(block):
+    ssa[succ] = rename_phi_pred(ssa[succ], block_name, [cont])
+
+  ssa[block_name] = pre
+  ssa.update(rename_callee(callee, labels, locals_base, phi_names, ret_local, cont))
+  ssa[cont] = rest
+
+  return [block_name, cont] + list(labels.values()) + successors(block)
+
+def inline_calls(ssa_functions, fn_names=None, threshold=INLINE_THRESHOLD, single_site_threshold=SINGLE_SITE_THRESHOLD, budget=CALLER_BUDGET, external_sites=None):
+  '''
+  This function inlines the `call`s to non recursive functions of `ssa_functions` which pass the cost model (see `should_inline`),
+  returns the names of the changed functions (only the ones in `fn_names` are changed, when given)
+
+  When `ssa_functions` is only a part of the module (see `parallel`), `external_sites` are the `call`s to each function
+  made by the functions not in it
+
+  Callees are visited before their callers, so the copied bodies already have their own calls inlined
+  '''
+
+  graph          = CallGraph(ssa_functions)
+  recursive      = graph.recursive()
+  changed        = []
+  external_sites = external_sites or {}
+
+  for fn_name in graph.bottom_up():
+    if fn_names is not None and fn_name not in fn_names:
+      continue
+
+    ssa  = ssa_functions[fn_name]
+    size = function_size(ssa)
+    # the blocks of the copied callees aren't visited, their calls were already considered when optimizing the callee
+    todo = list(ssa.keys())
+
+    while len(todo) > 0:
+      block_name = todo.pop(0)
+
+      for index, instr in enumerate(ssa[block_name]):
+        # phi values are evaluated on the edges, there's no place to put the copy in
+        if instr.op in PHI_IDS:
+          continue
+
+        call = first_call(instr)
+
+        if call is None or call.fn not in ssa_functions or call.fn in recursive:
+          continue
+
+        callee      = ssa_functions[call.fn]
+        callee_size = function_size(callee)
+
+        # the entry block of the callee is entered from the caller, so it can't have phis
+        if has_phis(callee[next(iter(callee.keys()))]) or size + callee_size > budget:
+          continue
+
+        if not should_inline(call, callee_size, graph.sites[call.fn] + external_sites.get(call.fn, 0), threshold, single_site_threshold):
+          continue
+
+        inline_call(ssa, block_name, index, call, callee)
+        size += callee_size
+
+        # the rest of the block was moved to the continuation (it's the last block added)
+        todo.insert(0, next(reversed(ssa.keys())))
+
+        if fn_name not in changed:
+          changed.append(fn_name)
+
+        break
+
+  return changed
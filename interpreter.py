@@ -0,0 +1,343 @@
+'''
+This module contains the interpreter of ssa functions and the partial evaluation pass built on it
+
+Each block is compiled once into python closures (one for each node, taking the frame of the running function),
+so running a block doesn't dispatch on `code` anymore, the dispatch only happens while compiling
+
+Running is bounded by a fuel budget (each block entered consumes as much fuel as its nodes), and it's stopped with `Bailout`
+when the function reads something unknown at compile time or has sideeffects (`call`s to functions outside the module)
+'''
+
+from data      import Instr, opcodes
+from cfg       import has_phis
+from walk      import children, postorder, transform
+from callgraph import CALL_IDS
+from semantics import converter, operation
+
+PHI_IDS   = opcodes(['phi'])
+CONST_IDS = opcodes(['const'])
+
+# how many nodes a compile time evaluated call can run
+DEFAULT_FUEL = 100_000
+
+# values not computed yet in the block
+MISSING = object()
+
+class Bailout(Exception):
+  '''
+  Raised when a function can't be evaluated at compile time (the reason is the message)
+  '''
+
+class Frame:
+  '''
+  Data structure for handling the state of a running function: its locals, the values of its phis
+  and the values of the nodes shared in the current block (computed once each time the block is entered)
+  '''
+
+  __slots__ = ('locals', 'phis', 'cache')
+
+  def __init__(self, args):
+    self.locals = dict(enumerate(args))
+    self.phis   = {}
+    self.cache  = None
+
+class CompiledBlock:
+  '''
+  Data structure for handling a compiled block
+
+  * `enter[pred]` assigns the phis when coming from `pred` (the values are computed before assigning any)
+  * `body` runs the instructions before the terminator
+  * `terminator` returns `(next_block, None)`, or `(None, returned_value)`
+  '''
+
+  __slots__ = ('enter', 'body', 'terminator', 'slots', 'cost')
+
+def read_local(loc):
+  def f(frame):
+    try:
+      return frame.locals[loc]
+    except KeyError:
+      raise Bailout(f'local `{loc}` is read before being written')
+
+  return f
+
+def cached(slot, f):
+  '''
+  This function returns `f` computing its value once per block execution (the node is shared)
+  '''
+
+  def g(frame):
+    value = frame.cache[slot]
+
+    if value is MISSING:
+      value = frame.cache[slot] = f(frame)
+
+    return value
+
+  return g
+
+class Interpreter:
+  '''
+  Data structure for handling the compiled functions of `ssa_functions` and the fuel left
+  '''
+
+  def __init__(self, ssa_functions, fuel=DEFAULT_FUEL):
+    self.ssa_functions = ssa_functions
+    self.fuel          = fuel
+    self.compiled      = {}
+
+  def compile_node(self, node, compiled):
+    '''
+    This function returns the closure computing `node`, `compiled` contains the closures of its children
+    '''
+
+    match node.code:
+      # constants and locals may be out of the range of their type (like a negative `u32`), so they are wrapped around
+      case 'const':
+        value = converter(node.typ)(node.value)
+        return lambda frame: value
+
+      case 'ldloc':
+        read, convert = read_local(node.loc), converter(node.typ)
+        return lambda frame: convert(read(frame))
+
+      case 'ldphi':
+        name = node.name
+        return lambda frame: frame.phis[name]
+
+      # the operations have the semantics of the folding passes (see `semantics`), the ones without a result at compile time
+      # (a division by zero, a shift out of the range of the type) are left to the runtime
+      case 'neg':
+        op, value = operation('neg', node.typ), compiled[id(node.value)]
+        return lambda frame: op(value(frame))
+
+      case 'add' | 'sub' | 'mul' | 'div' | 'less' | 'shl' | 'shr':
+        op, l, r, code = operation(node.code, node.typ), compiled[id(node.l)], compiled[id(node.r)], node.code
+
+        def binary(frame):
+          try:
+            return op(l(frame), r(frame))
+          except (ArithmeticError, ValueError) as e:
+            raise Bailout(f'`{code}` can\'t be evaluated at compile time: {e}')
+
+        return binary
+
+      case 'call':
+        fn, args = node.fn, [compiled[id(arg)] for arg in node.args]
+        return lambda frame: self.call(fn, [arg(frame) for arg in args])
+
+      case 'stloc':
+        loc, value = node.loc, compiled[id(node.value)]
+
+        def stloc(frame):
+          frame.locals[loc] = value(frame)
+
+        return stloc
+
+      case 'ret':
+        if node.value is None:
+          return lambda frame: (None, None)
+
+        value = compiled[id(node.value)]
+        return lambda frame: (None, value(frame))
+
+      case 'goto':
+        target = node.target
+        return lambda frame: (target, None)
+
+      case 'branch':
+        value, T, F = compiled[id(node.value)], node.T, node.F
+        return lambda frame: (T if value(frame) else F, None)
+
+      case _:
+        raise Bailout(f'instruction `{node.code}` can\'t be interpreted')
+
+  def compile_tree(self, root, compiled, shared):
+    '''
+    This function compiles `root` children first (without recursion), the nodes in `shared` compute their value once per block execution
+    '''
+
+    for node in postorder(root, skip=compiled):
+      f = self.compile_node(node, compiled)
+
+      if id(node) in shared:
+        f = cached(shared[id(node)], f)
+
+      compiled[id(node)] = f
+
+    return compiled[id(root)]
+
+  def compile_block(self, block):
+    '''
+    This function returns `block` compiled (see `CompiledBlock`)
+    '''
+
+    instrs = [instr for instr in block if instr.op not in PHI_IDS]
+    # how many times each node is used as operand in the block
+    uses   = {}
+
+    for instr in instrs:
+      for node in postorder(instr):
+        for child in children(node):
+          uses[id(child)] = uses.get(id(child), 0) + 1
+
+    shared   = {}
+    compiled = {}
+
+    for instr in instrs:
+      for node in postorder(instr):
+        if uses.get(id(node), 0) > 1 and node.op not in CONST_IDS and id(node) not in shared:
+          shared[id(node)] = len(shared)
+
+    result       = CompiledBlock()
+    result.slots = len(shared)
+    result.cost  = sum(1 for instr in block for _ in postorder(instr))
+    result.enter = {}
+
+    # phi values are computed at the end of the predecessor, so they don't use the cache of the block
+    for phi in block:
+      if phi.op not in PHI_IDS:
+        break
+
+      for pred, value in zip(phi.preds, phi.values):
+        result.enter.setdefault(pred, []).append((phi.name, self.compile_tree(value, {}, {})))
+
+    for pred, assignments in result.enter.items():
+      result.enter[pred] = self.compile_phis(assignments)
+
+    if len(instrs) > 0 and instrs[-1].code in ['ret', 'goto', 'branch']:
+      terminator, instrs = instrs[-1], instrs[:-1]
+    # a block without terminator returns nothing
+    else:
+      terminator = Instr('ret', 'void')
+
+    result.body       = [self.compile_tree(instr, compiled, shared) for instr in instrs]
+    result.terminator = self.compile_tree(terminator, compiled, shared)
+
+    return result
+
+  def compile_phis(self, assignments):
+    names  = [name for name, _ in assignments]
+    values = [value for _, value in assignments]
+
+    def enter(frame):
+      # phis are assigned in parallel
+      new_values = [value(frame) for value in values]
+      frame.phis.update(zip(names, new_values))
+
+    return enter
+
+  def compile_function(self, fn_name):
+    '''
+    This function returns the compiled blocks of `fn_name` (compiled once and cached)
+    '''
+
+    if fn_name not in self.compiled:
+      ssa = self.ssa_functions[fn_name]
+
+      if has_phis(next(iter(ssa.values()))):
+        raise Bailout(f'the entry block of `{fn_name}` has phis')
+
+      self.compiled[fn_name] = next(iter(ssa.keys())), { block_name: self.compile_block(block) for block_name, block in ssa.items() }
+
+    return self.compiled[fn_name]
+
+  def call(self, fn_name, args):
+    '''
+    This function runs `fn_name` with `args` as parameters (locals `0..len(args) - 1`), returns the returned value (`None` for void functions)
+    '''
+
+    # the called function isn't known, so the call may have sideeffects
+    if fn_name not in self.ssa_functions:
+      raise Bailout(f'call to `{fn_name}` may have sideeffects')
+
+    block_name, blocks = self.compile_function(fn_name)
+    frame              = Frame(args)
+    pred               = None
+
+    try:
+      while True:
+        block       = blocks[block_name]
+        self.fuel  -= block.cost
+
+        if self.fuel < 0:
+          raise Bailout('out of fuel')
+
+        if pred is not None and pred in block.enter:
+          block.enter[pred](frame)
+
+        frame.cache = [MISSING] * block.slots
+
+        for step in block.body:
+          step(frame)
+
+        pred, (block_name, value) = block_name, block.terminator(frame)
+
+        if block_name is None:
+          return value
+
+    # too deep recursion
+    except RecursionError:
+      raise Bailout('maximum recursion depth reached')
+
+def evaluate_constant_calls(ssa_functions, fn_names=None, fuel=DEFAULT_FUEL):
+  '''
+  This function replaces the `call`s to functions of the module, whose args are all constants, with the returned value,
+  when the callee can be run at compile time with `fuel` (see `Interpreter`), returns the names of the changed functions
+  (only the ones in `fn_names` are changed, when given)
+
+  `call`s to void functions are removed when they are instructions (the callee had no sideeffects)
+  '''
+
+  interpreter = Interpreter(ssa_functions)
+  # results by `(fn, args)`, `Bailout` when the call can't be evaluated
+  results     = {}
+  changed     = []
+
+  def evaluate(call):
+    key = (call.fn, tuple(arg.value for arg in call.args))
+
+    if key not in results:
+      interpreter.fuel = fuel
+
+      try:
+        results[key] = interpreter.call(call.fn, list(key[1]))
+      except Bailout:
+        results[key] = Bailout
+
+    return results[key]
+
+  def replace(node):
+    if node.op not in CALL_IDS or node.fn not in ssa_functions or any(arg.op not in CONST_IDS for arg in node.args):
+      return False, node
+
+    result = evaluate(node)
+
+    if result is Bailout or result is None:
+      return False, node
+
+    return True, Instr('const', node.typ, value=result)
+
+  for fn_name, ssa in ssa_functions.items():
+    if fn_names is not None and fn_name not in fn_names:
+      continue
+
+    memo = {}
+
+    for block_name, block in list(ssa.items()):
+      new_block = []
+
+      for instr in block:
+        # a void call without sideeffects is useless
+        if instr.op in CALL_IDS and instr.fn in ssa_functions and all(arg.op in CONST_IDS for arg in instr.args) and evaluate(instr) is None:
+          continue
+
+        new_block.append(transform(instr, replace, memo)[1])
+
+      if len(new_block) != len(block) or any(a is not b for a, b in zip(new_block, block)):
+        ssa[block_name] = new_block
+
+        if fn_name not in changed:
+          changed.append(fn_name)
+
+  return changed
@@ -0,0 +1,385 @@
+'''
+This module contains the lowering of ssa functions to three address code: each block of instruction trees becomes a linear list
+of instructions reading and writing numbered virtual registers, then the registers are allocated with linear scan
+
+* operands are evaluated in the order given by their Sethi-Ullman number (the one needing more registers first), which keeps
+  less values alive at the same time, operands with sideeffects keep their order
+* phis are virtual registers written by copies at the end of the predecessors (on a new block, when the predecessor
+  has more successors), the values of the phis of a block are computed before any is written
+* a node shared by more instructions of a block (see `hashcons`) is computed once
+'''
+
+from data import opcodes
+from walk import children, is_pure
+
+CONST_IDS = opcodes(['const'])
+PHI_IDS   = opcodes(['phi'])
+LDPHI_IDS = opcodes(['ldphi'])
+
+# how many physical registers `linear_scan` allocates by default
+DEFAULT_REGISTERS = 8
+
+class VReg:
+  '''
+  Data structure for handling a virtual register
+  '''
+
+  __slots__ = ('n',)
+
+  def __init__(self, n):
+    self.n = n
+
+  def __eq__(self, other):
+    return isinstance(other, VReg) and self.n == other.n
+
+  def __hash__(self):
+    return hash(self.n)
+
+  def __repr__(self):
+    return f'v{self.n}'
+
+class TAC:
+  '''
+  Data structure for handling a three address instruction: `dst = code typ args` (`dst` is `None` when no value is written),
+  args are virtual registers or constants, `attrs` are the other operands (like the `loc` of `ldloc` or the targets of `branch`)
+  '''
+
+  __slots__ = ('code', 'typ', 'dst', 'args', 'attrs')
+
+  def __init__(self, code, typ, dst=None, args=(), **attrs):
+    self.code  = code
+    self.typ   = typ
+    self.dst   = dst
+    self.args  = list(args)
+    self.attrs = attrs
+
+  def uses(self):
+    return [a for a in self.args if isinstance(a, VReg)]
+
+  def __repr__(self):
+    operands = ', '.join([repr(a) for a in self.args] + [f'{k}={v!r}' for k, v in self.attrs.items()])
+    dst      = f'{self.dst!r} = ' if self.dst is not None else ''
+
+    return f'{dst}{self.code} {self.typ} {operands}'.rstrip()
+
+class LinearFunction:
+  '''
+  Data structure for handling a lowered function: its blocks of three address instructions (the entry is the first)
+  and how many virtual registers it uses
+  '''
+
+  def __init__(self):
+    self.blocks = {}
+    self.vregs  = 0
+
+  def new_vreg(self):
+    self.vregs += 1
+    return VReg(self.vregs - 1)
+
+  def successors(self, block_name):
+    last = self.blocks[block_name][-1] if len(self.blocks[block_name]) > 0 else None
+
+    if last is None:
+      return []
+
+    match last.code:
+      case 'goto':
+        return [last.attrs['target']]
+
+      case 'branch':
+        return [last.attrs['T'], last.attrs['F']]
+
+      case _:
+        return []
+
+def sethi_ullman(root):
+  '''
+  This function returns how many registers are needed to evaluate each node of `root` (by id), without recursion
+  '''
+
+  need  = {}
+  stack = [(root, False)]
+
+  while len(stack) > 0:
+    node, expanded = stack.pop()
+
+    if id(node) in need:
+      continue
+
+    if not expanded:
+      stack.append((node, True))
+      stack.extend((child, False) for child in children(node) if id(child) not in need)
+      continue
+
+    operands = sorted((need[id(child)] for child in children(node)), reverse=True)
+
+    # constants are immediate operands, other leaves need a register
+    if len(operands) == 0:
+      need[id(node)] = 0 if node.op in CONST_IDS else 1
+    else:
+      # the i-th operand evaluated keeps the i operands before it alive
+      need[id(node)] = max(max(n + i for i, n in enumerate(operands)), 1)
+
+  return need
+
+def evaluation_order(node, need):
+  '''
+  This function returns the children of `node` in the order they are evaluated, the ones needing more registers first
+  (only when none of them has sideeffects, otherwise they keep their order)
+  '''
+
+  operands = children(node)
+
+  if len(operands) < 2 or not all(is_pure(o) for o in operands):
+    return operands
+
+  return sorted(operands, key=lambda o: -need[id(o)])
+
+class Lowering:
+  '''
+  Data structure for handling the lowering of a ssa function (see `lower`)
+  '''
+
+  def __init__(self, ssa):
+    self.ssa  = ssa
+    self.fn   = LinearFunction()
+    self.phis = {} # virtual register of each phi
+
+    for block in ssa.values():
+      for instr in block:
+        if instr.op in PHI_IDS:
+          self.phis[instr.name] = self.fn.new_vreg()
+
+  def operand(self, node, values):
+    '''
+    This function returns the operand reading the value of `node` (already evaluated)
+    '''
+
+    if node.op in CONST_IDS:
+      return node.value
+
+    if node.op in LDPHI_IDS:
+      return self.phis[node.name]
+
+    return values[id(node)]
+
+  def emit_tree(self, root, out, values):
+    '''
+    This function appends to `out` the instructions evaluating `root`, `values` contains the registers of the nodes already evaluated
+    (by id), returns the operand with the value of `root`
+    '''
+
+    if root.op in CONST_IDS or root.op in LDPHI_IDS or id(root) in values:
+      return self.operand(root, values)
+
+    need  = sethi_ullman(root)
+    stack = [(root, False)]
+
+    while len(stack) > 0:
+      node, expanded = stack.pop()
+
+      if id(node) in values or node.op in CONST_IDS or node.op in LDPHI_IDS:
+        continue
+
+      if not expanded:
+        stack.append((node, True))
+        # reversed, so the first operand to evaluate is popped first
+        stack.extend((child, False) for child in reversed(evaluation_order(node, need)))
+        continue
+
+      args  = []
+      attrs = {}
+
+      for field_name, field in node.fields():
+        # a `ret` without value
+        if field is None:
+          continue
+
+        if field_name in ['l', 'r', 'value']:
+          args.append(self.operand(field, values))
+        elif field_name == 'args':
+          args.extend(self.operand(arg, values) for arg in field)
+        else:
+          attrs[field_name] = field
+
+      dst = self.fn.new_vreg() if node.typ != 'void' else None
+      out.append(TAC(node.code, node.typ, dst, args, **attrs))
+
+      values[id(node)] = dst
+
+    return self.operand(root, values)
+
+  def phi_copies(self, pred, succ, out, values):
+    '''
+    This function appends to `out` the copies writing the phis of `succ` when coming from `pred`, `values` are the registers
+    of the nodes evaluated by `pred` (see `emit_tree`)
+    '''
+
+    temps = []
+
+    # the values are computed before writing any phi, since they may read the phis being written
+    for phi in self.ssa[succ]:
+      if phi.op not in PHI_IDS:
+        break
+
+      value = phi.values[phi.preds.index(pred)]
+      temp  = self.fn.new_vreg()
+
+      out.append(TAC('mov', phi.typ, temp, [self.emit_tree(value, out, values)]))
+      temps.append((self.phis[phi.name], phi.typ, temp))
+
+    for dst, typ, temp in temps:
+      out.append(TAC('mov', typ, dst, [temp]))
+
+  def lower(self):
+    for block_name, block in self.ssa.items():
+      out    = []
+      values = {}
+
+      self.fn.blocks[block_name] = out
+
+      for instr in block:
+        if instr.op in PHI_IDS:
+          continue
+
+        # the copies of the phis of the successors are done before leaving the block
+        if instr.code == 'goto' and any(i.op in PHI_IDS for i in self.ssa[instr.target]):
+          self.phi_copies(block_name, instr.target, out, values)
+
+        if instr.code == 'branch':
+          args   = [self.emit_tree(instr.value, out, values)]
+          labels = {}
+
+          # the copies of a successor with phis can't be done before branching, they go on a new block on the edge
+          for side in ['T', 'F']:
+            target = getattr(instr, side)
+
+            if any(i.op in PHI_IDS for i in self.ssa[target]):
+              edge                 = f'{block_name}_{target}'
+              self.fn.blocks[edge] = []
+              self.phi_copies(block_name, target, self.fn.blocks[edge], dict(values))
+              self.fn.blocks[edge].append(TAC('goto', 'void', target=target))
+              target               = edge
+
+            labels[side] = target
+
+          out.append(TAC('branch', 'void', None, args, **labels))
+          continue
+
+        self.emit_tree(instr, out, values)
+
+    return self.fn
+
+def lower(ssa):
+  '''
+  This function returns `ssa` lowered to three address code (see `LinearFunction`)
+  '''
+
+  return Lowering(ssa).lower()
+
+def vreg_liveness(fn):
+  '''
+  This function returns the sets of the virtual registers live at the beginning and at the end of each block of `fn`
+  '''
+
+  gen  = {}
+  kill = {}
+
+  for block_name, block in fn.blocks.items():
+    gen[block_name], kill[block_name] = set(), set()
+
+    for instr in block:
+      gen[block_name] |= set(instr.uses()) - kill[block_name]
+
+      if instr.dst is not None:
+        kill[block_name].add(instr.dst)
+
+  live_in  = { block_name: set() for block_name in fn.blocks.keys() }
+  live_out = { block_name: set() for block_name in fn.blocks.keys() }
+  changed  = True
+
+  while changed:
+    changed = False
+
+    for block_name in reversed(list(fn.blocks.keys())):
+      live_out[block_name] = set().union(*(live_in[succ] for succ in fn.successors(block_name)))
+      new_live_in          = gen[block_name] | (live_out[block_name] - kill[block_name])
+
+      if new_live_in != live_in[block_name]:
+        live_in[block_name] = new_live_in
+        changed             = True
+
+  return live_in, live_out
+
+def live_intervals(fn):
+  '''
+  This function returns the interval `[start, end]` of the positions where each virtual register is live,
+  instructions are numbered in block order (a register live across a block covers all of it)
+  '''
+
+  live_in, live_out = vreg_liveness(fn)
+  intervals         = {}
+  position          = 0
+
+  def extend(vreg, at):
+    start, end      = intervals.get(vreg, (at, at))
+    intervals[vreg] = min(start, at), max(end, at)
+
+  for block_name, block in fn.blocks.items():
+    start = position
+
+    for instr in block:
+      for vreg in instr.uses():
+        extend(vreg, position)
+
+      if instr.dst is not None:
+        extend(instr.dst, position)
+
+      position += 1
+
+    for vreg in live_in[block_name]:
+      extend(vreg, start)
+
+    for vreg in live_out[block_name]:
+      extend(vreg, max(position - 1, start))
+
+  return intervals
+
+def linear_scan(fn, registers=DEFAULT_REGISTERS):
+  '''
+  This function allocates the virtual registers of `fn` to `registers` physical registers (`r0`, `r1`, ...),
+  the ones which don't fit are spilled to stack slots (`s0`, `s1`, ...), returns the location of each virtual register
+
+  When no register is free, the interval ending last is spilled (Poletto and Sarkar)
+  '''
+
+  intervals = live_intervals(fn)
+  location  = {}
+  free      = [f'r{i}' for i in range(registers)][::-1]
+  # intervals holding a register, sorted by end
+  active    = []
+  slots     = 0
+
+  for vreg, (start, end) in sorted(intervals.items(), key=lambda item: item[1][0]):
+    # the registers of the intervals ended before this one are free again
+    while len(active) > 0 and active[0][0] < start:
+      _, expired = active.pop(0)
+      free.append(location[expired])
+
+    if len(free) > 0:
+      location[vreg] = free.pop()
+      active.append((end, vreg))
+    elif len(active) > 0 and active[-1][0] > end:
+      # the interval ending last gives its register to this one
+      spilled_end, spilled = active.pop()
+      location[vreg]       = location[spilled]
+      location[spilled]    = f's{slots}'
+      slots               += 1
+      active.append((end, vreg))
+    else:
+      location[vreg] = f's{slots}'
+      slots         += 1
+
+    active.sort(key=lambda item: item[0])
+
+  return location
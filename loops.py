@@ -0,0 +1,284 @@
+'''
+This module contains the natural loops of a ssa function (found with dominators), the induction variables of their counters
+and the loop unrolling pass built on them
+
+Unrolling works on locals (before they are promoted by `mem2reg`), so the copies of the body share them and no phi has to be renamed,
+the counter of a loop is a local stored once per iteration with `i = i +- n`
+'''
+
+from data import Instr, opcodes
+from cfg  import CFG, dominates, max_label
+from walk import postorder
+
+LDLOC_IDS = opcodes(['ldloc'])
+STLOC_IDS = opcodes(['stloc'])
+CONST_IDS = opcodes(['const'])
+PHI_IDS   = opcodes(['phi'])
+
+# the unrolled copies of a loop can't be more than these many nodes
+UNROLL_BUDGET = 2000
+# how many copies of the body are made for loops without a known trip count
+UNROLL_FACTOR = 4
+
+class Loop:
+  '''
+  Data structure for handling a natural loop: its header, its blocks (including the header)
+  and the blocks jumping back to the header (latches)
+  '''
+
+  def __init__(self, header, blocks, latches):
+    self.header  = header
+    self.blocks  = blocks
+    self.latches = latches
+
+  def __repr__(self):
+    return f'Loop(header={self.header!r}, blocks={sorted(self.blocks)!r}, latches={self.latches!r})'
+
+class InductionVariable:
+  '''
+  Data structure for handling the counter of a loop: the local `loc` is stored once per iteration with `loc + step`,
+  `init` is its value when entering the loop (`None` when unknown)
+  '''
+
+  def __init__(self, loc, step, init):
+    self.loc  = loc
+    self.step = step
+    self.init = init
+
+def natural_loops(cfg, idom):
+  '''
+  This function returns the natural loops of the graph, a loop for each header (the back edges to the same header are merged),
+  a back edge is an edge to a block dominating its source
+  '''
+
+  loops = {}
+
+  for block_name in idom.keys():
+    for succ in cfg.succs[block_name]:
+      if not dominates(idom, succ, block_name):
+        continue
+
+      loop = loops.setdefault(succ, Loop(succ, { succ }, []))
+      loop.latches.append(block_name)
+
+      # the body is made by the blocks reaching the latch without passing through the header
+      worklist = [block_name]
+
+      while len(worklist) > 0:
+        b = worklist.pop()
+
+        if b in loop.blocks:
+          continue
+
+        loop.blocks.add(b)
+        worklist.extend(pred for pred in cfg.preds[b] if pred in idom)
+
+  return list(loops.values())
+
+def loop_size(ssa, loop):
+  return sum(1 for block_name in loop.blocks for instr in ssa[block_name] for _ in postorder(instr))
+
+def induction_variable(ssa, loop, cfg, idom):
+  '''
+  This function returns the induction variable compared by the `branch` ending the header of `loop`, or `None`
+  '''
+
+  branch = ssa[loop.header][-1] if len(ssa[loop.header]) > 0 else None
+
+  if branch is None or branch.code != 'branch' or branch.value.code != 'less' or len(loop.latches) != 1:
+    return None
+
+  # one side of the `branch` has to leave the loop
+  if (branch.T in loop.blocks) == (branch.F in loop.blocks):
+    return None
+
+  # the counter is the local compared with the other operand
+  compared = [o for o in [branch.value.l, branch.value.r] if o.op in LDLOC_IDS]
+
+  for candidate in compared:
+    loc    = candidate.loc
+    stores = [(block_name, instr) for block_name in loop.blocks for instr in ssa[block_name] if instr.op in STLOC_IDS and instr.loc == loc]
+
+    if len(stores) != 1:
+      continue
+
+    block_name, store = stores[0]
+    value             = store.value
+
+    # the store has to run once per iteration (and after the header compared the counter)
+    if block_name == loop.header or not dominates(idom, block_name, loop.latches[0]):
+      continue
+
+    if value.code not in ['add', 'sub'] or not (value.l.op in LDLOC_IDS and value.l.loc == loc and value.r.op in CONST_IDS):
+      if not (value.code == 'add' and value.r.op in LDLOC_IDS and value.r.loc == loc and value.l.op in CONST_IDS):
+        continue
+
+    step = value.r.value if value.r.op in CONST_IDS else value.l.value
+    step = -step if value.code == 'sub' else step
+
+    return InductionVariable(loc, step, initial_value(ssa, loop, cfg, loc))
+
+  return None
+
+def initial_value(ssa, loop, cfg, loc):
+  '''
+  This function returns the constant stored in `loc` by the only block entering `loop`, or `None`
+  '''
+
+  entering = [pred for pred in cfg.preds[loop.header] if pred not in loop.blocks]
+
+  if len(entering) != 1:
+    return None
+
+  for instr in reversed(ssa[entering[0]]):
+    if instr.op in STLOC_IDS and instr.loc == loc:
+      return instr.value.value if instr.value.op in CONST_IDS else None
+
+  return None
+
+def trip_count(ssa, loop, iv, fold, limit):
+  '''
+  This function returns how many times the body of `loop` runs (simulating its counter), or `None` when it's unknown or above `limit`
+  '''
+
+  branch = ssa[loop.header][-1]
+  cond   = branch.value
+  # the other operand of the comparison has to be constant
+  bound  = cond.r if cond.l.op in LDLOC_IDS and cond.l.loc == iv.loc else cond.l
+
+  if iv.init is None or bound.op not in CONST_IDS:
+    return None
+
+  # whether the loop continues when the comparison is true
+  stays = branch.T in loop.blocks
+  i     = iv.init
+
+  for count in range(limit + 1):
+    l, r = (i, bound.value) if bound is cond.r else (bound.value, i)
+
+    try:
+      if bool(int(fold('less', bound.typ, l, r))) != stays:
+        return count
+
+      # the counter wraps around like the stored one
+      i = fold('add', bound.typ, i, iv.step)
+    except ArithmeticError:
+      return None
+
+  return None
+
+def copy_loop(loop, copies, next_label):
+  '''
+  This function returns the names of the blocks of each copy of `loop` (the first copy keeps the original names),
+  `next_label` is the number of the first free `l<n>` name
+  '''
+
+  names = [{ block_name: block_name for block_name in loop.blocks }]
+
+  for _ in range(copies - 1):
+    names.append({})
+
+    for block_name in sorted(loop.blocks):
+      names[-1][block_name] = f'l{next_label}'
+      next_label           += 1
+
+  return names
+
+def retarget_copy(instr, names, next_header):
+  '''
+  This function returns the terminator `instr` of a copy of the loop, jumping to the copy `names` of the loop blocks
+  and to `next_header` instead of the header (the back edge)
+  '''
+
+  target = lambda t: next_header if t == names['__header__'] else names.get(t, t)
+
+  match instr.code:
+    case 'goto':
+      return instr.replace(target=target(instr.target))
+
+    case 'branch':
+      return instr.replace(T=target(instr.T), F=target(instr.F))
+
+  return instr
+
+def unroll_loop(ssa, loop, copies, trips=None):
+  '''
+  This function replaces `loop` with `copies` copies of it, the back edge of each copy jumps to the header of the next one
+  (the last to the first), when `trips` is known the `branch` of the headers whose result is known becomes a `goto`:
+  * `trips == copies - 1` (full unrolling), the last copy of the header leaves the loop and the other ones stay in it
+  * `trips % copies == 0` (partial unrolling), only the first header checks the counter
+  '''
+
+  next_label = max_label(ssa) + 1
+  names      = copy_loop(loop, copies, next_label)
+  full       = trips is not None and trips == copies - 1
+  branch     = ssa[loop.header][-1]
+  stay, exit = (branch.T, branch.F) if branch.T in loop.blocks else (branch.F, branch.T)
+  # the blocks are rewritten while copying, so the copies are made from the original ones
+  original   = { block_name: ssa[block_name] for block_name in loop.blocks }
+
+  for k, copy in enumerate(names):
+    # the last copy of a fully unrolled loop only contains the header (the body ran `trips` times)
+    if full and k == copies - 1:
+      blocks = [loop.header]
+    else:
+      blocks = sorted(loop.blocks)
+
+    next_header = names[(k + 1) % copies][loop.header]
+
+    for block_name in blocks:
+      # instructions are immutable, so the copies share them
+      block = original[block_name]
+      last  = block[-1] if len(block) > 0 else None
+
+      if block_name == loop.header and trips is not None and (full or k > 0):
+        last = Instr('goto', 'void', target=exit if full and k == copies - 1 else stay)
+
+      if last is not None:
+        last = retarget_copy(last, { **copy, '__header__': loop.header }, next_header)
+
+      ssa[copy[block_name]] = block[:-1] + [last] if last is not None else block
+
+  return [name for copy in names for name in copy.values()]
+
+def unroll_loops(ssa, fold, factor=UNROLL_FACTOR, budget=UNROLL_BUDGET):
+  '''
+  This function unrolls the innermost loops of `ssa` with a counter (see `InductionVariable`), `fold(code, typ, *values)` computes
+  the value of an operation on constants (see `rewrite.RuleSet`), returns the names of the changed blocks:
+  * loops with a compile time known trip count are fully unrolled, when the copies fit in `budget` nodes
+  * the other ones are copied `factor` times (fitting in `budget`), jumping less often back to the header
+
+  Functions with phis are left as they are (their locals were already promoted)
+  '''
+
+  if any(instr.op in PHI_IDS for block in ssa.values() for instr in block):
+    return []
+
+  cfg   = CFG(ssa)
+  idom  = cfg.dominators()
+  loops = natural_loops(cfg, idom)
+  dirty = []
+
+  for loop in loops:
+    # only innermost loops are unrolled (an outer loop would copy the inner ones)
+    if any(other is not loop and other.header in loop.blocks for other in loops):
+      continue
+
+    # the loops are found on the graph before unrolling, so a changed one is found again the next time
+    if any(block_name in dirty for block_name in loop.blocks):
+      continue
+
+    iv = induction_variable(ssa, loop, cfg, idom)
+
+    if iv is None or iv.step == 0:
+      continue
+
+    size  = loop_size(ssa, loop)
+    trips = trip_count(ssa, loop, iv, fold, budget // max(size, 1))
+
+    if trips is not None and size * (trips + 1) <= budget:
+      dirty.extend(unroll_loop(ssa, loop, trips + 1, trips))
+    elif factor > 1 and size * factor <= budget:
+      dirty.extend(unroll_loop(ssa, loop, factor, trips if trips is not None and trips % factor == 0 else None))
+
+  return dirty
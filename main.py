@@ -29,7 +29,7 @@ ssa_functions = {
   }
 }
 
-o1_passes, o1_functions = optimize1(ssa_functions, 'main')
+o1_passes, o1_functions = optimize1(ssa_functions)
 
 # print('sir =', dict_prettyrepr(sir_functions, use_custom_repr=sir_pretty_repr), end='\n\n')
 print('ssa =', dict_prettyrepr(ssa_functions, use_custom_repr=ssa_pretty_repr), end='\n\n')
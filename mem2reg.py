@@ -0,0 +1,240 @@
+'''
+This module contains the pass promoting locals to ssa values (mem2reg): `stloc`s are removed and each `ldloc` is replaced
+with the value stored in the local (or with a `ldphi`, reading the phi inserted where more stored values meet)
+
+Values are pure trees, so they can be referenced from the blocks they dominate (and phis are read with `ldphi` nodes,
+which is what keeps loops from making trees cyclic)
+'''
+
+from data     import Instr, opcodes
+from cfg      import CFG, dominator_tree, max_label
+from deadcode import liveness, locals_read, remove_unreachable_blocks
+from walk     import postorder, transform, is_pure
+
+LDLOC_IDS = opcodes(['ldloc'])
+STLOC_IDS = opcodes(['stloc'])
+PHI_IDS   = opcodes(['phi'])
+LDPHI_IDS = opcodes(['ldphi'])
+
+def promotable_locals(ssa):
+  '''
+  This function returns the locals which can be promoted and their types, a local can be promoted when
+  the values stored in it have no sideeffects and only read locals which can be promoted (or are never written)
+  '''
+
+  stores = {} # values stored in each local
+  typs   = {} # type of each local
+
+  for block in ssa.values():
+    for instr in block:
+      for node in postorder(instr):
+        if node.op in LDLOC_IDS:
+          typs.setdefault(node.loc, node.typ)
+
+      if instr.op in STLOC_IDS:
+        stores.setdefault(instr.loc, []).append(instr.value)
+        typs.setdefault(instr.loc, instr.value.typ)
+
+  promotable = set(stores.keys())
+  changed    = True
+
+  # removing a local can make other locals not promotable (the ones storing values reading it)
+  while changed:
+    changed = False
+
+    for loc in list(promotable):
+      for value in stores[loc]:
+        if not is_pure(value) or any(read in stores and read not in promotable for read in locals_read(value)):
+          promotable.discard(loc)
+          changed = True
+          break
+
+  return promotable, typs
+
+def fresh_phi_names(ssa):
+  '''
+  This function yields the phi names not used yet in `ssa`
+  '''
+
+  used = { instr.name for block in ssa.values() for instr in block if instr.op in PHI_IDS }
+  i    = 0
+
+  while True:
+    if f'p{i}' not in used:
+      yield f'p{i}'
+
+    i += 1
+
+def substitute_locals(instr, values):
+  '''
+  This function returns `instr` with each `ldloc` of a local in `values` replaced with its value
+  '''
+
+  return transform(instr, lambda node: (True, values[node.loc]) if node.op in LDLOC_IDS and node.loc in values else (False, node))[1]
+
+def promote_locals(ssa):
+  '''
+  This function promotes the locals of `ssa` to ssa values, inserting phis where needed, returns the names of the changed blocks
+  '''
+
+  # the dominator tree is only built over reachable blocks
+  dirty                = remove_unreachable_blocks(ssa)
+  promotable, typs     = promotable_locals(ssa)
+
+  if len(promotable) == 0:
+    return dirty
+
+  cfg = CFG(ssa)
+
+  # the entry block can't have phis (there's no predecessor giving the initial values), so a new one is created when it has predecessors
+  if len(cfg.preds[cfg.entry]) > 0:
+    entry = f'l{max_label(ssa) + 1}'
+    old   = dict(ssa)
+
+    ssa.clear()
+    ssa[entry] = [Instr('goto', 'void', target=cfg.entry)]
+    ssa.update(old)
+
+    cfg = CFG(ssa)
+
+  idom         = cfg.dominators()
+  frontiers    = cfg.dominance_frontiers(idom)
+  live_in, _   = liveness(ssa, cfg)
+  phi_names    = fresh_phi_names(ssa)
+  # blocks storing each local
+  def_blocks   = { loc: set() for loc in promotable }
+  # locals needing a phi at the beginning of each block, and the name of the phi
+  phis         = { block_name: {} for block_name in ssa.keys() }
+
+  for block_name, block in ssa.items():
+    for instr in block:
+      if instr.op in STLOC_IDS and instr.loc in promotable:
+        def_blocks[instr.loc].add(block_name)
+
+  # placing phis in the iterated dominance frontier of the stores (only where the local is live)
+  for loc in sorted(promotable):
+    worklist = list(def_blocks[loc])
+
+    while len(worklist) > 0:
+      for frontier in frontiers[worklist.pop()]:
+        if loc in phis[frontier] or loc not in live_in[frontier]:
+          continue
+
+        phis[frontier][loc] = next(phi_names)
+        # the phi is a new store to the local
+        worklist.append(frontier)
+
+  # the value of each local at the end of each block
+  end_values = {}
+  # walking the dominator tree, each block starts with the values at the end of its immediate dominator
+  # (before the stores, the value of a local is the one it has when the function is called)
+  stack      = [(cfg.entry, { loc: Instr('ldloc', typs[loc], loc=loc) for loc in promotable })]
+  children   = dominator_tree(idom)
+
+  while len(stack) > 0:
+    block_name, values = stack.pop()
+    values             = dict(values)
+    new_block          = []
+
+    for loc, name in phis[block_name].items():
+      values[loc] = Instr('ldphi', typs[loc], name=name)
+
+    for instr in ssa[block_name]:
+      # phi values are read at the end of the predecessors, so they are replaced later
+      if instr.op in PHI_IDS:
+        new_block.append(instr)
+        continue
+
+      instr = substitute_locals(instr, values)
+
+      # the stored value is now the value of the local
+      if instr.op in STLOC_IDS and instr.loc in promotable:
+        values[instr.loc] = instr.value
+        continue
+
+      new_block.append(instr)
+
+    ssa[block_name]        = new_block
+    end_values[block_name] = values
+
+    stack.extend((child, values) for child in children[block_name])
+
+  for block_name, block in ssa.items():
+    new_phis = [
+      Instr('phi', typs[loc], name=name, preds=list(cfg.preds[block_name]), values=[end_values[pred][loc] for pred in cfg.preds[block_name]])
+      for loc, name in phis[block_name].items()
+    ]
+
+    # the values of the phis already there may read promoted locals
+    ssa[block_name] = new_phis + [
+      instr.replace(values=[substitute_locals(v, end_values[p]) for p, v in zip(instr.preds, instr.values)]) if instr.op in PHI_IDS else instr
+      for instr in block
+    ]
+
+  return list(ssa.keys())
+
+def substitute_phis(ssa, values):
+  '''
+  This function replaces each `ldphi` of a phi in `values` with its value, in every block of `ssa`
+  '''
+
+  replace = lambda node: (True, values[node.name]) if node.op in LDPHI_IDS and node.name in values else (False, node)
+  memo    = {}
+  changed = False
+
+  for block_name, block in list(ssa.items()):
+    new_block = [transform(instr, replace, memo)[1] for instr in block]
+
+    if any(a is not b for a, b in zip(new_block, block)):
+      ssa[block_name] = new_block
+      changed         = True
+
+  return changed
+
+def simplify_phis(ssa):
+  '''
+  This function removes the phis never read and replaces the ones with a single value (ignoring themselves) with that value,
+  returns the names of the changed blocks
+  '''
+
+  dirty = []
+
+  while True:
+    phis = { instr.name: instr for block in ssa.values() for instr in block if instr.op in PHI_IDS }
+
+    # phis read by instructions which aren't phis, then the phis they read
+    read     = set()
+    worklist = [instr for block in ssa.values() for instr in block if instr.op not in PHI_IDS]
+
+    while len(worklist) > 0:
+      for node in postorder(worklist.pop()):
+        if node.op in LDPHI_IDS and node.name not in read:
+          read.add(node.name)
+          worklist.extend(phis[node.name].values)
+
+    # a phi is trivial when its values are all the same node (or the phi itself)
+    trivial = {}
+
+    for name, phi in phis.items():
+      values = { id(v): v for v in phi.values if not (v.op in LDPHI_IDS and v.name == name) }
+
+      # a value reading the phi itself is left (it would be substituted forever)
+      if len(values) == 1 and not any(node.op in LDPHI_IDS and node.name == name for node in postorder(next(iter(values.values())))):
+        trivial[name] = next(iter(values.values()))
+
+    removed = (phis.keys() - read) | trivial.keys()
+
+    if len(removed) == 0:
+      return dirty
+
+    for block_name, block in list(ssa.items()):
+      if any(instr.op in PHI_IDS and instr.name in removed for instr in block):
+        ssa[block_name] = [instr for instr in block if not (instr.op in PHI_IDS and instr.name in removed)]
+        dirty.append(block_name)
+
+    # the value of a trivial phi may read another trivial phi, so they are substituted until none is read anymore
+    for _ in range(len(trivial) + 1):
+      if not substitute_phis(ssa, trivial):
+        break
+
+    dirty.extend(ssa.keys())
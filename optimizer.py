@@ -1,73 +1,100 @@
-from copy import deepcopy
-from math import sqrt
-from data import Instr
+from data        import Instr, opcodes
+from passmanager import PassManager, BLOCK_PASS, FUNCTION_PASS, MODULE_PASS
+from persistent  import copy_on_write
+from peephole    import peephole
+from stackir2ssa import sir2ssa
+from hashcons    import global_value_numbering
+from rewrite     import Rule, RuleSet
+from strength    import shift_add_mul, div_by_const, int_type, is_power_of_two
+from mem2reg     import promote_locals, simplify_phis
+from sccp        import sparse_conditional_constant_propagation
+from inline      import inline_calls
+from interpreter import evaluate_constant_calls
+from loops       import unroll_loops
+from recursion   import recursion_to_loop
+from deadcode    import fold_constant_branches, thread_empty_blocks, remove_unreachable_blocks, merge_straight_blocks, remove_dead_stores
+from walk        import INSTR_WITH_POSSIBLE_SIDEEFFECTS, collect_instructions_with_sideeffects, is_pure
+from semantics   import fold, fits, wrap
 
 MAIN_CLASS_OPS = ['add', 'sub']
 SUB_CLASS_OPS = ['mul', 'div']
 BIN_OPS = MAIN_CLASS_OPS + SUB_CLASS_OPS + ['less'] + ['shl', 'shr']
-INSTR_WITH_POSSIBLE_SIDEEFFECTS = ['call']
-USELESS_OPS_AS_INSTR = BIN_OPS + ['neg', 'const', 'ldloc']
+USELESS_OPS_AS_INSTR = BIN_OPS + ['neg', 'const', 'ldloc', 'ldphi']
 
-def fold_op(op, l, r):
-  match op:
-    case 'add': return l + r
-    case 'sub': return l - r
-    case 'mul': return l * r
-    case 'div': return l / r
+# integer opcodes versions of the lists above, used by the hot paths
+BIN_OPS_IDS                         = opcodes(BIN_OPS)
+INSTR_WITH_POSSIBLE_SIDEEFFECTS_IDS = opcodes(INSTR_WITH_POSSIBLE_SIDEEFFECTS)
+USELESS_OPS_AS_INSTR_IDS            = opcodes(USELESS_OPS_AS_INSTR)
+REWRITABLE_OPS_IDS                  = opcodes(BIN_OPS + ['neg'])
 
-def op_of_same_class(opl, opr):
+def divisors_fit(n, m, typ):
   '''
-  This function returns whether `opl` and `opr` are both of the same op class (+- are of the same, */ are of the same)
+  This function returns whether `(x / n) / m` of type `typ` can be `x / (n * m)`: the divisors aren't `0` and their product
+  doesn't wrap around (the wrapped product would be another divisor)
   '''
 
-  return (opl in MAIN_CLASS_OPS and opr in MAIN_CLASS_OPS) or (opl in SUB_CLASS_OPS and opr in SUB_CLASS_OPS)
-
-def is_power_of_two(n):
-  '''
-  This functions returns whether `n` is a power of 2
-  '''
-
-  # this approach uses bit manipulation
-  # took from https://stackoverflow.com/a/57025941
-  return (n & (n-1) == 0) and n != 0
-
-def op_times_op(opl, opr):
-  '''
-  This function returns op * op, examples:
-  * `-` * `-` -> `+`
-  * `-` * `+` -> `-`
-  * `+` * `-` -> `-`
-  * `+` * `+` -> `+`
-
-  * `/` * `/` -> `*`
-  * `/` * `*` -> `/`
-  * `*` * `/` -> `/`
-  * `*` * `*` -> `*`
-  '''
-
-  assert op_of_same_class(opl, opr)
-
-  return {
-    'addadd': 'add',
-    'addsub': 'sub',
-
-    'subsub': 'add',
-    'subadd': 'sub',
-
-    'mulmul': 'mul',
-    'muldiv': 'div',
-    
-    'divmul': 'div',
-    'divdiv': 'mul',
-  }[opl + opr]
-
-def fold_bintree(tree):
+  n, m = wrap(n, typ), wrap(m, typ)
+  return n != 0 and m != 0 and fits(n * m, typ)
+
+# patterns for folding trees (`n`, `m` are consts and `x` is any instruction, see `rewrite`)
+FOLD_RULES = RuleSet([
+  # `n +-*/ n` -> `n` (operations on constants are folded)
+  Rule('n + m -> n + m',   name='fold add'),
+  Rule('n - m -> n - m',   name='fold sub'),
+  Rule('n * m -> n * m',   name='fold mul'),
+  Rule('n / m -> n / m',   name='fold div'),
+  Rule('n < m -> n < m',   name='fold less'),
+  Rule('n << m -> n << m', name='fold shl'),
+  Rule('n >> m -> n >> m', name='fold shr'),
+  Rule('-n -> -n',         name='fold neg'),
+
+  # `n +- (x +- n)` -> `n +- x`
+  'n + (x + m) -> x + (n + m)',
+  'n + (x - m) -> x + (n - m)',
+  'n - (x + m) -> (n - m) - x',
+  'n - (x - m) -> (n + m) - x',
+  'n + (m + x) -> x + (n + m)',
+  'n + (m - x) -> (n + m) - x',
+  'n - (m + x) -> (n - m) - x',
+  'n - (m - x) -> x + (n - m)',
+
+  # `(x +- n) +- n` -> `x +- n`
+  '(x + n) + m -> x + (n + m)',
+  '(x + n) - m -> x + (n - m)',
+  '(x - n) + m -> x + (m - n)',
+  '(x - n) - m -> x - (n + m)',
+  '(n + x) + m -> x + (n + m)',
+  '(n + x) - m -> x + (n - m)',
+  '(n - x) + m -> (n + m) - x',
+  '(n - x) - m -> (n - m) - x',
+
+  # `n * (x * n)` -> `n * x` and `(x */ n) */ n` -> `x */ n`
+  'n * (x * m) -> x * (n * m)',
+  'n * (m * x) -> x * (n * m)',
+  '(x * n) * m -> x * (n * m)',
+  '(n * x) * m -> x * (n * m)',
+  Rule('(x / n) / m -> x / (n * m)', when=lambda b, typ: divisors_fit(b['n'], b['m'], typ)),
+
+  # special situations with `0` and `1` (operands with sideeffects are never dropped)
+  'x + 0 -> x',
+  'x - 0 -> x',
+  'x * 1 -> x',
+  'x / 1 -> x',
+  '0 + x -> x',
+  '0 - x -> -x',
+  '1 * x -> x',
+  Rule('x * 0 -> 0', when=lambda b, typ: is_pure(b['x'])),
+  Rule('0 * x -> 0', when=lambda b, typ: is_pure(b['x'])),
+  Rule('0 / x -> 0', when=lambda b, typ: is_pure(b['x'])),
+], fold=fold)
+
+def fold_bintree(tree, memo=None):
   '''
   This function tries to recursively fold a binary tree instruction supporing the following patterns (assuming `n` is const and `x` is var):
   * `n +-*/ n` -> `n`
 
   * `n +- (x +- n)` -> `n +- x`
-  * `n */ (x */ n)` -> `n */ x`
+  * `n * (x * n)` -> `n * x`
 
   * `(x +- n) +- n` -> `x +- n`
   * `(x */ n) */ n` -> `x */ n`
@@ -82,140 +109,72 @@ def fold_bintree(tree):
   * `x * 1`  -> x
   * `1 * x`  -> x
   * `x / 1`  -> x
+
+  The patterns are the rules of `FOLD_RULES`, `memo` caches the results by node, so a node shared by more trees (see `hashcons`) is folded once
   '''
 
-  # tracking this function changed data
-  changed = False
+  return FOLD_RULES.rewrite(tree, memo)
 
-  # folding recursively left node
-  if tree.l.code in BIN_OPS:
-    t, tree.l = fold_bintree(tree.l)
-    changed += t
-
-  # folding recursively right node
-  if tree.r.code in BIN_OPS:
-    t, tree.r = fold_bintree(tree.r)
-    changed += t
-  
-  # folding `n +-*/ n`
-  if tree.r.code == 'const' and tree.l.code == 'const':
-    tree = Instr('const', tree.typ, value=int(fold_op(tree.code, tree.l.value, tree.r.value)))
-    changed = True
-  
-  # this operation has just been completely folded and does not need other checkings
-  if tree.code not in BIN_OPS:
-    return changed, tree
-  
-  # folding `n +- (x +- n)` and `n */ (x */ n)` pattern
-  if tree.l.code == 'const' and tree.r.code in BIN_OPS and (tree.r.r.code == 'const' or tree.r.l.code == 'const') and op_of_same_class(tree.code, tree.r.code):
-    # folding the right node of the right node with the left node
-    tree.l = Instr('const', tree.typ, value=fold_op(op_times_op(tree.code, tree.r.code) , tree.l.value, tree.r.r.value if tree.r.r.code == 'const' else tree.r.l.value))
-    # removing the const code of the right node
-    tree.r = tree.r.r if tree.r.r.code != 'const' else tree.r.l
+def is_reducible(x, typ):
+  '''
+  This function returns whether an operation of type `typ` on `x` can be strength reduced: the type is an integer one
+  and `x` isn't a `const` (a `const` is only met when the operation on it couldn't be folded, and the functions of the rules
+  get it as a value)
+  '''
 
-    changed = True
-  
-  # folding `(x +- n) +- n` and `(x */ n) */ n` pattern
-  if tree.r.code == 'const' and tree.l.code in BIN_OPS and (tree.l.r.code == 'const' or tree.l.l.code == 'const') and op_of_same_class(tree.code, tree.l.code):
-    # folding the right node of the right node with the left node
-    tree.r = Instr('const', tree.typ, value=fold_op(op_times_op(tree.code, tree.l.code), tree.r.value, tree.l.r.value if tree.l.r.code == 'const' else tree.l.l.value))
-    # removing the const code of the right node
-    tree.l = tree.l.r if tree.l.r.code != 'const' else tree.l.l
+  return x.code != 'const' and int_type(typ) is not None
 
-    changed = True
-  
-  # converting special situations with `0` and `1` at right
-  if tree.r.code == 'const':
-    match tree.r.value:
-      # `x +- 0` -> x
-      # `x * 0`  -> 0
-      case 0:
-        old, tree = tree, { 'add': tree.l, 'sub': tree.l, 'mul': tree.r, 'div': tree }[tree.code]
-        changed += old != tree
-
-      # `x * 1`  -> x
-      # `x / 1`  -> x
-      case 1:
-        old, tree = tree, { 'add': tree, 'sub': tree, 'mul': tree.l, 'div': tree.l }[tree.code]
-        changed += old != tree
-  
-  # converting special situations with `0` and `1` at left
-  if tree.l.code == 'const':
-    match tree.l.value:
-      # `0 + x`  -> x
-      # `0 - x`  -> -x
-      # `0 * x`  -> 0
-      # `0 / x`  -> 0
-      case 0:
-        old, tree = tree, { 'add': tree.r, 'sub': Instr('neg', tree.typ, value=tree.r), 'mul': tree.l, 'div': tree.l }[tree.code]
-        changed += old != tree
-
-      # `1 * x`  -> x
-      case 1:
-        old, tree = tree, { 'add': tree, 'sub': tree, 'mul': tree.r, 'div': tree }[tree.code]
-        changed += old != tree
-  
-  return changed, tree
+# patterns for replacing instructions with faster ones (integer types only, see `strength`)
+STRENGTH_RULES = RuleSet([
+  # converting `n * x` and `x * n` into shifts and additions (a single left bit shifting operation when `n` is a power of 2)
+  Rule('n * x -> mul(x, n)', when=lambda b, typ: is_reducible(b['x'], typ)),
+  Rule('x * n -> mul(x, n)', when=lambda b, typ: is_reducible(b['x'], typ)),
+
+  # converting `x / n` into a right bit shifting operation when `n` is a power of 2, otherwise into a multiplication by a magic number
+  Rule('x / n -> div(x, n)', when=lambda b, typ: is_reducible(b['x'], typ)),
+], fold=fold, functions={ 'mul': shift_add_mul, 'div': div_by_const })
 
-def collect_instructions_with_sideeffects(instr):
+def get_faster_corresponding_instruction(instr):
   '''
-  This function recursively walks through `instr`'s fields (`instr` is gonna be removed by the caller for uselessness)
-  looking for instructions with sideeffects to keep
+  This function tries to find a faster corresponding instruction to the one given (and to its operands), otherwise returns the same
   '''
-  
-  instructions = []
-
-  for field_name, field in instr.__dict__.items():
-    # skipping field `code`, `typ` etc..
-    if isinstance(field, Instr):
-      # whether the field could have side effects
-      if field.code in INSTR_WITH_POSSIBLE_SIDEEFFECTS:
-        instructions.append(field.code)
-      # otherwise search for instructions with sideeffects inside it
-      else:
-        instructions.extend(collect_instructions_with_sideeffects(field))
-  
-  return instructions
 
-def get_faster_corresponding_instruction(instr):
+  return STRENGTH_RULES.rewrite(instr)
+
+def rules_fired():
+  '''
+  This function returns how many times each folding and math replacing pattern was applied
+  '''
+
+  return FOLD_RULES.fired + STRENGTH_RULES.fired
+
+def optimize_tree(tree, memo=None):
   '''
-  This function tries to find a faster corresponding instruction to the one given, otherwise returns the same
+  This function folds and simplifies `tree` until it doesn't change anymore, this way only the dirty tree is walked again
+  (instead of the whole function), for `memo` look at `fold_bintree`
   '''
 
   # tracking whether this function changed data
   changed = False
 
-  # converting `n * x` and `x * n` where `n` is a power of 2 into a left bit shifting operation
-  if instr.code == 'mul':
-    # `n` is at the left of the node
-    if instr.l.code == 'const' and is_power_of_two(instr.l.value):
-      # converting `n` into a value for left bit shifting `x` and getting the same result
-      instr.l.value = int(sqrt(instr.l.value))
-      instr = Instr('shl', instr.typ, l=instr.r, r=instr.l)
-
-      changed = True
+  while tree.op in REWRITABLE_OPS_IDS:
+    # trying to fold the tree (otherwise it returns the same tree)
+    changing1, tree = fold_bintree(tree, memo)
 
-    # `n` is at the right of the node
-    elif instr.r.code == 'const' and is_power_of_two(instr.r.value):
-      # converting `n` into a value for left bit shifting `x` and getting the same result
-      instr.r.value = int(sqrt(instr.r.value))
-      instr = Instr('shl', instr.typ, l=instr.l, r=instr.r)
+    # replacing the tree with the corresponding faster one
+    changing2, tree = get_faster_corresponding_instruction(tree)
 
-      changed = True
-  
-  # converting `x / n` where `n` is a power of 2 into a right bit shifting operation
-  if instr.code == 'div' and instr.r.code == 'const' and is_power_of_two(instr.r.value):
-    # converting `n` into a value for right bit shifting `x` and getting the same result
-    instr.r.value = int(sqrt(instr.r.value))
-    instr = Instr('shr', instr.typ, l=instr.l, r=instr.r)
+    # the tree reached its fixed point
+    if not changing1 + changing2:
+      break
 
     changed = True
-  
-  return changed, instr
 
-def constfolding_plus_math_replacing_plus_rm_useless(ssa):
+  return changed, tree
+
+def constfolding_plus_math_replacing_plus_rm_useless_block(ssa, block_name):
   '''
-  This function walks through instructions (instructions in ssa form are tree-structured, so we even need to walk through instruction's fields)
+  This function walks through the instructions of `ssa[block_name]` (instructions in ssa form are tree-structured, so we even need to walk through instruction's fields)
   and replaces them with a folded version
 
   Secondary features:
@@ -224,81 +183,152 @@ def constfolding_plus_math_replacing_plus_rm_useless(ssa):
   '''
 
   # tracking whether this algorithm changed data
-  changed = False
+  changed   = False
+  new_block = []
+  # nodes shared by more instructions of the block are folded once
+  memo      = {}
+
+  for instr in ssa[block_name]:
+    # useless instructions aren't added to the new block
+    # they are passed to a function which is gonna recursively walk them to collect all instructions to keep (because they have sideeffects, like `call`)
+    if instr.op in USELESS_OPS_AS_INSTR_IDS:
+      new_block.extend(collect_instructions_with_sideeffects(instr))
+      changed = True
+      continue
+
+    # the folded fields of the instruction
+    new_fields = {}
+
+    # ssa instructions are tree-structured, so we need to check every field, whether it's an instruction and it's a bin op we try to fold it
+    for field_name, field in instr.fields():
+      # checking whether the field is an instruction and a bin op (or a negation)
+      if isinstance(field, Instr) and field.op in REWRITABLE_OPS_IDS:
+        # replacing the field with the folded and faster version
+        changing, new_field = optimize_tree(field, memo)
+
+        if changing:
+          new_fields[field_name] = new_field
+          changed                = True
+
+      # list fields (`call` args, phi values) are folded element by element
+      elif isinstance(field, list):
+        folded = [optimize_tree(e, memo) if isinstance(e, Instr) else (False, e) for e in field]
 
-  for block_name, block in ssa.items():
-    new_block = []
-
-    for i, instr in enumerate(block):
-      # useless instructions aren't added to the new block
-      if instr.code not in USELESS_OPS_AS_INSTR:
-        new_block.append(instr)
-      # they are passed to a function which is gonna recursively walk them to collect all instructions to keep (because they have sideeffects, like `call`)
-      else:
-        new_block.extend(collect_instructions_with_sideeffects(instr))
-        changed = True
-
-      # ssa instructions are tree-structured, so we need to check every field, whether it's an instruction and it's a bin op we try to fold it
-      for field_name, field in instr.__dict__.items():
-        # checking whether the field is an instruction and a bin op
-        if isinstance(field, Instr) and field.code in BIN_OPS:
-          # replacing the field with the folded version (actually `fold_bintree` tries to fold it, otherwise it returns the same instr)
-          changing1, instr.__dict__[field_name] = fold_bintree(field)
-
-          # replacing the field with the corresponding faster one
-          changing2, instr.__dict__[field_name] = get_faster_corresponding_instruction(field)
-
-          # updating the changes tracker
-          changed += changing1 + changing2
-    
-    # replacing the old block with the newer
+        if any(changing for changing, _ in folded):
+          new_fields[field_name] = [e for _, e in folded]
+          changed                = True
+
+    # the instruction is copied only when one of its fields was rewritten
+    new_block.append(instr.replace(**new_fields) if len(new_fields) > 0 else instr)
+
+  # replacing the old block with the newer (an unchanged block is kept, so it's still shared with the unoptimized function)
+  if changed:
     ssa[block_name] = new_block
-  
+
   return changed
 
-def remove_dead_code(ssa):
+def constfolding_plus_math_replacing_plus_rm_useless(ssa):
+  '''
+  This function does the same of `constfolding_plus_math_replacing_plus_rm_useless_block`, but for each block of `ssa`
+  '''
+
   changed = False
 
+  for block_name in list(ssa.keys()):
+    changed += constfolding_plus_math_replacing_plus_rm_useless_block(ssa, block_name)
+
   return changed
 
-def optimize1(ssa_functions, main):
+def remove_dead_code(ssa):
   '''
-  This function returns a copy of ssa with following changes:
-  * Constant operations are folded
-  * Some math instructions are replaced with faster (multiplications -> bit shift)
-  * Useless operations without sideeffects are removed (redundant code elimination)
+  This function removes dead code from `ssa`, returns the names of the changed (or removed) blocks:
+  * `branch`es on constant values are replaced with `goto`s
+  * jumps to blocks containing only a `goto` are redirected to its target
+  * blocks unreachable from the entry one are removed
+  * blocks are merged with their target when they are its only predecessor
+  * `stloc`s to locals never read again are removed
+  '''
+
+  dirty = []
+
+  for p in [fold_constant_branches, thread_empty_blocks, remove_unreachable_blocks, merge_straight_blocks, remove_dead_stores]:
+    dirty.extend(p(ssa))
+
+  return dirty
+
+# bumped when the output of the passes changes, so the results cached by older versions aren't used (see `cache`)
+OPTIMIZER_VERSION = 1
+
+# the passes run by `optimize1`, new passes can be plugged in with `O1_PASSES.register(...)`
+O1_PASSES = PassManager()
+
+O1_PASSES.add('constfolding', constfolding_plus_math_replacing_plus_rm_useless_block, BLOCK_PASS, order=0)
+O1_PASSES.add('recursion', recursion_to_loop, FUNCTION_PASS, order=-30)
+O1_PASSES.add('unroll', lambda ssa_functions, fn_name: unroll_loops(ssa_functions[fn_name], fold), FUNCTION_PASS, order=-20)
+O1_PASSES.add('mem2reg', lambda ssa_functions, fn_name: promote_locals(ssa_functions[fn_name]), FUNCTION_PASS, order=-10)
+O1_PASSES.add('sccp', lambda ssa_functions, fn_name: sparse_conditional_constant_propagation(ssa_functions[fn_name], fold), FUNCTION_PASS, order=-5)
+O1_PASSES.add('phis', lambda ssa_functions, fn_name: simplify_phis(ssa_functions[fn_name]), FUNCTION_PASS, order=10)
+O1_PASSES.add('gvn', lambda ssa_functions, fn_name: global_value_numbering(ssa_functions[fn_name]), FUNCTION_PASS, order=0)
+O1_PASSES.add('dead-code', lambda ssa_functions, fn_name: remove_dead_code(ssa_functions[fn_name]), FUNCTION_PASS, order=0)
+O1_PASSES.add('inline', inline_calls, MODULE_PASS, order=0)
+O1_PASSES.add('partial-eval', evaluate_constant_calls, MODULE_PASS, order=1)
+
+# the passes run by `optimize0`, the cheap ones of `O1_PASSES` (no pass looks at more than a function, and locals aren't promoted)
+O0_PASSES = PassManager()
+
+O0_PASSES.add('constfolding', constfolding_plus_math_replacing_plus_rm_useless_block, BLOCK_PASS, order=0)
+O0_PASSES.add('dead-code', lambda ssa_functions, fn_name: remove_dead_code(ssa_functions[fn_name]), FUNCTION_PASS, order=0)
 
-  * [TODO] Unreachable code elimination
-  * [TODO] Dead code elimination
-  * [TODO] Non-recursive functions are inlined where possible
-  * [TODO] Functions with constant args are compile time executed, excluding for instructions with sideeffects, which are keept
-  * [TODO] Loop unrolling (cycles with a an compile time known lifetime)
-  * [TODO] Recursive functions are converted into a cycle where possible
+def optimize0(sir_functions, pass_manager=O0_PASSES, profiler=None):
   '''
+  This function returns the sir functions `sir_functions` converted into ssa with the low tier optimizations, for the builds
+  where the latency matters more than the code:
+  * The sir is optimized by the peephole patterns while it's converted (see `peephole`)
+  * Constant operations are folded and some math instructions are replaced with faster ones, in each block
+  * Unreachable and dead code elimination
 
-  # traking passes, starting from -1 because the last pass doesn't actually change data (it just checks there's nothing to change anymore)
-  passes = -1
+  It returns `(passes, ssa_functions)` like `optimize1`, the result can still be optimized by `optimize1`
+  '''
 
-  # making sure to mutate a copy, keeping old unoptimized data
-  ssa_functions = deepcopy(ssa_functions)
+  ssa_functions = { fn_name: sir2ssa(peephole(sir)) for fn_name, sir in sir_functions.items() }
 
-  # not caring about algorithm calling order, they are called until the data is not gonna change anymore
-  while True:
-    passes += 1
+  if profiler is not None:
+    profiler.watch('fold', FOLD_RULES)
+    profiler.watch('strength', STRENGTH_RULES)
 
-    # starting to optimize the main function
-    ssa     = ssa_functions[main]
-    # tracking whether in this cycle some algorithm changed data
-    changed = False
+  passes = pass_manager.run(ssa_functions, profiler=profiler)
 
-    # constant folding + math simplfication + useless ops removal (excluding instructions with sideeffects)
-    changed += constfolding_plus_math_replacing_plus_rm_useless(ssa)
+  return passes, ssa_functions
 
-    # dead code is deleted
-    changed += remove_dead_code(ssa)
+def optimize1(ssa_functions, pass_manager=O1_PASSES, profiler=None):
+  '''
+  This function returns a copy of ssa_functions (each function is optimized) with following changes:
+  * Constant operations are folded
+  * Some math instructions are replaced with faster (multiplications -> bit shift)
+  * Useless operations without sideeffects are removed (redundant code elimination)
+  * Equal subexpressions are merged into the same node (global value numbering)
+  * Locals are promoted to ssa values, with phis where more values meet (mem2reg)
+  * Constants are propagated across blocks, only along the edges which can be taken (sparse conditional constant propagation)
+
+  * Unreachable code elimination (including branches on constants)
+  * Dead code elimination (stores to locals never read again)
+  * Non-recursive functions are inlined where the cost model says it pays off (see `inline.should_inline`)
+  * Calls with constant args are compile time executed, unless the callee has sideeffects or runs out of fuel (see `interpreter`)
+  * Loops with a counter are unrolled, fully when their trip count is compile time known (see `loops`)
+  * Tail recursive and accumulator recursive functions are converted into a loop (see `recursion`)
+
+  When `profiler` is given, it records the measures of the passes and of the rules (see `profiling`)
+  '''
 
-    # when the data is not goin to change anymore, the cycle has to stop
-    if not changed:
-      break
+  # making sure to mutate a copy, keeping old unoptimized data (only the function dicts are copied, blocks and instructions
+  # are shared with the unoptimized functions until a pass rewrites them)
+  ssa_functions = copy_on_write(ssa_functions)
+
+  if profiler is not None:
+    profiler.watch('fold', FOLD_RULES)
+    profiler.watch('strength', STRENGTH_RULES)
+
+  # the pass manager only visits again the blocks dirtied by a pass, until none is dirty anymore
+  passes = pass_manager.run(ssa_functions, profiler=profiler)
 
   return passes, ssa_functions
\ No newline at end of file
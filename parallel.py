@@ -0,0 +1,179 @@
+'''
+This module contains the parallel version of `optimizer.optimize1`: the functions of a module are optimized by a pool of processes
+
+* functions are sent to the workers and back with the flat encoding of `serialize` (cheaper than pickling the trees,
+  and it doesn't recurse on deep ones)
+* functions are optimized in call graph order: a function is optimized after the functions it calls, which are sent along
+  (already optimized) so the module passes (like the inliner) see their final version, functions of the same cycle are optimized together
+* functions with no order between them (like the ones calling nothing) are split into batches, one per task
+
+Workers are forked, so they share the pass manager of the parent (it may contain lambdas, which can't be pickled), where forking
+isn't available the module is optimized in the current process
+'''
+
+import multiprocessing
+
+from collections        import Counter
+from concurrent.futures import ProcessPoolExecutor
+from callgraph          import CallGraph, calls_in
+from optimizer          import O1_PASSES, optimize1
+from persistent         import copy_on_write
+from serialize          import encode_function, decode_function, encode_module, decode_module
+from stackir2ssa        import sir2ssa
+
+# how many batches each worker gets per call graph level, more batches balance better the load but cost more messages
+BATCHES_PER_WORKER = 4
+
+# the pass manager of the worker process (see `init_worker`)
+WORKER_PASS_MANAGER = None
+
+def init_worker(pass_manager):
+  global WORKER_PASS_MANAGER
+  WORKER_PASS_MANAGER = pass_manager
+
+def convert_batch(batch):
+  '''
+  This function converts the sir functions of `batch` into ssa, returns them encoded
+  '''
+
+  return { fn_name: encode_function(sir2ssa(sir)) for fn_name, sir in batch.items() }
+
+def optimize_batch(batch, context, external_sites):
+  '''
+  This function optimizes the encoded functions of `batch`, `context` are the encoded functions they call (already optimized),
+  `external_sites` the calls to them made by the functions of the module not sent (given to the inliner, see `inline.inline_calls`),
+  returns how many pass runs changed data and the optimized functions of `batch` encoded
+  '''
+
+  ssa_functions = decode_module(context)
+  ssa_functions.update(decode_module(batch))
+
+  changes = WORKER_PASS_MANAGER.run(ssa_functions, batch.keys(), options={ 'inline': { 'external_sites': external_sites } })
+
+  return changes, { fn_name: encode_function(ssa_functions[fn_name]) for fn_name in batch.keys() }
+
+def call_levels(graph):
+  '''
+  This function returns the components of `graph` (see `CallGraph.sccs`) grouped by level, the components of a level
+  only call the ones of the levels before
+  '''
+
+  level  = {}
+  levels = []
+
+  for component in graph.sccs():
+    members = set(component)
+    n       = max((level[callee] + 1 for fn_name in component for callee in graph.callees[fn_name] if callee not in members), default=0)
+
+    for fn_name in component:
+      level[fn_name] = n
+
+    while len(levels) <= n:
+      levels.append([])
+
+    levels[n].append(component)
+
+  return levels
+
+def transitive_callees(graph, fn_names):
+  '''
+  This function returns the set of the functions reachable from `fn_names` in `graph`, without `fn_names`
+  '''
+
+  result = set()
+  stack  = [callee for fn_name in fn_names for callee in graph.callees[fn_name]]
+
+  while len(stack) > 0:
+    fn_name = stack.pop()
+
+    if fn_name in result:
+      continue
+
+    result.add(fn_name)
+    stack.extend(graph.callees[fn_name])
+
+  return result - set(fn_names)
+
+def split(elements, count):
+  '''
+  This function splits `elements` into at most `count` lists of consecutive elements, with about the same length
+  '''
+
+  size = -(-len(elements) // count)
+  return [elements[i:i + size] for i in range(0, len(elements), size)]
+
+def optimize_parallel(ssa_functions=None, sir_functions=None, pass_manager=O1_PASSES, workers=None):
+  '''
+  This function does the same of `optimize1` (it returns `(passes, ssa_functions)`) using `workers` processes
+  (by default one per cpu), the module is either `ssa_functions` or `sir_functions`, which are converted into ssa by the workers too
+
+  The result may differ from `optimize1`, which runs the module passes over all the functions at once instead of in call graph order
+  '''
+
+  assert (ssa_functions is None) != (sir_functions is None)
+
+  workers = workers or multiprocessing.cpu_count()
+
+  if 'fork' not in multiprocessing.get_all_start_methods():
+    workers = 1
+
+  if workers == 1:
+    if sir_functions is not None:
+      ssa_functions = { fn_name: sir2ssa(sir) for fn_name, sir in sir_functions.items() }
+
+    return optimize1(ssa_functions, pass_manager)
+
+  context = multiprocessing.get_context('fork')
+  passes  = 0
+
+  with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker, initargs=(pass_manager,)) as pool:
+    if sir_functions is not None:
+      names   = list(sir_functions.keys())
+      batches = [{ fn_name: sir_functions[fn_name] for fn_name in batch } for batch in split(names, workers * BATCHES_PER_WORKER)]
+      encoded = {}
+
+      for converted in pool.map(convert_batch, batches):
+        encoded.update(converted)
+
+      # keeping the order of the module
+      encoded = { fn_name: encoded[fn_name] for fn_name in names }
+      module  = decode_module(encoded)
+    else:
+      # the optimized functions share the blocks of the unoptimized ones, until they are rewritten
+      module  = copy_on_write(ssa_functions)
+      encoded = encode_module(module)
+
+    graph = CallGraph(module)
+    # how many times each function calls each other one
+    calls = { fn_name: Counter(call.fn for call in calls_in(ssa)) for fn_name, ssa in module.items() }
+
+    for components in call_levels(graph):
+      tasks = []
+
+      for batch in split(components, workers * BATCHES_PER_WORKER):
+        fn_names = [fn_name for component in batch for fn_name in component]
+        callees  = transitive_callees(graph, fn_names)
+        inside   = Counter()
+
+        for fn_name in callees.union(fn_names):
+          inside.update(calls[fn_name])
+
+        external = { callee: graph.sites[callee] - inside[callee] for callee in callees }
+
+        tasks.append(pool.submit(
+          optimize_batch,
+          { fn_name: encoded[fn_name] for fn_name in fn_names },
+          { fn_name: encoded[fn_name] for fn_name in callees },
+          external,
+        ))
+
+      # the next level needs the functions of this one
+      for task in tasks:
+        changes, optimized = task.result()
+        passes            += changes
+
+        for fn_name, e in optimized.items():
+          encoded[fn_name] = e
+          module[fn_name]  = decode_function(e)
+
+  return passes, module
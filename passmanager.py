@@ -0,0 +1,187 @@
+'''
+This module contains the pass manager used by the optimizers, it keeps a worklist of dirty blocks
+so that a rewrite only makes the affected blocks to be visited again (instead of the whole function)
+'''
+
+from collections import deque
+
+BLOCK_PASS    = 'block'
+FUNCTION_PASS = 'function'
+MODULE_PASS   = 'module'
+PASS_KINDS    = [BLOCK_PASS, FUNCTION_PASS, MODULE_PASS]
+
+class Pass:
+  '''
+  Data structure for handling a registered optimization pass
+
+  * `block` passes are called as `fn(ssa, block_name)` and return whether they changed the block
+  * `function` passes are called as `fn(ssa_functions, fn_name)` and return the names of the blocks they dirtied
+  * `module` passes are called as `fn(ssa_functions, fn_names)` and return the names of the functions they changed (like the inliner),
+    only the functions in `fn_names` can be changed, the other ones are only read
+  * passes of the same kind are run sorted by `order` (lower first)
+  * the options given to `PassManager.run` for the name of the pass are passed as extra keyword arguments
+
+  Passes never mutate instructions or block lists in place, they replace them (`ssa[block_name] = new_block`, `instr.replace(...)`),
+  because the optimized functions share them with the unoptimized ones (see `persistent.copy_on_write`)
+  '''
+
+  def __init__(self, name, fn, kind, order):
+    assert kind in PASS_KINDS
+
+    self.name  = name
+    self.fn    = fn
+    self.kind  = kind
+    self.order = order
+
+class Worklist:
+  '''
+  Data structure for handling a fifo queue where an element is never queued twice
+  '''
+
+  def __init__(self, elements=()):
+    self.queue  = deque()
+    self.queued = set()
+
+    for e in elements:
+      self.push(e)
+
+  def push(self, e):
+    # the element is already waiting to be processed
+    if e in self.queued:
+      return
+
+    self.queue.append(e)
+    self.queued.add(e)
+
+  def pop(self):
+    e = self.queue.popleft()
+    self.queued.remove(e)
+
+    return e
+
+  def __len__(self):
+    return len(self.queue)
+
+class PassManager:
+  '''
+  Data structure for handling pass registration and the worklist driven run of them
+  '''
+
+  def __init__(self):
+    self.passes = []
+
+  def add(self, name, fn, kind=BLOCK_PASS, order=0):
+    '''
+    This function registers `fn` as pass, replacing an old pass with the same name
+    '''
+
+    self.remove(name)
+    self.passes.append(Pass(name, fn, kind, order))
+    # sorting is stable, so passes with the same order are run in registration order
+    self.passes.sort(key=lambda p: p.order)
+
+  def register(self, name, kind=BLOCK_PASS, order=0):
+    '''
+    This function is the decorator version of `add`
+    '''
+
+    def decorator(fn):
+      self.add(name, fn, kind, order)
+      return fn
+
+    return decorator
+
+  def remove(self, name):
+    self.passes = [p for p in self.passes if p.name != name]
+
+  def passes_of_kind(self, kind):
+    return [p for p in self.passes if p.kind == kind]
+
+  def run_function(self, ssa_functions, fn_name, profiler=None, options={}):
+    '''
+    This function runs the passes over `ssa_functions[fn_name]` until the worklist is empty,
+    returns how many pass runs changed data (passes are measured by `profiler` when given, see `profiling`, for `options` look at `run`)
+    '''
+
+    changes         = 0
+    block_passes    = [(p, options.get(p.name, {})) for p in self.passes_of_kind(BLOCK_PASS)]
+    function_passes = [(p, options.get(p.name, {})) for p in self.passes_of_kind(FUNCTION_PASS)]
+    # at the beginning every block is dirty
+    worklist        = Worklist(ssa_functions[fn_name].keys())
+
+    while True:
+      while len(worklist) > 0:
+        block_name = worklist.pop()
+        ssa        = ssa_functions[fn_name]
+
+        # the block may have been removed by a function pass after being queued
+        if block_name not in ssa:
+          continue
+
+        # block passes only touch their own block, so they are run on it until none of them changes it anymore
+        while True:
+          changed = False
+
+          for p, kwargs in block_passes:
+            if p.fn(ssa, block_name, **kwargs) if profiler is None else profiler.block_pass(p, ssa, block_name, **kwargs):
+              changes += 1
+              changed  = True
+
+          if not changed:
+            break
+
+      # function passes may change more blocks at once, only the dirtied ones are requeued
+      for p, kwargs in function_passes:
+        dirty = p.fn(ssa_functions, fn_name, **kwargs) if profiler is None else profiler.function_pass(p, ssa_functions, fn_name, **kwargs)
+
+        if dirty:
+          changes += 1
+
+          for block_name in dirty:
+            worklist.push(block_name)
+
+      # when no pass dirtied a block the function is optimized
+      if len(worklist) == 0:
+        break
+
+    return changes
+
+  def run(self, ssa_functions, fn_names=None, profiler=None, options=None):
+    '''
+    This function runs the passes over each function of `ssa_functions`, then the module passes,
+    the functions they changed are optimized again until no module pass changes them anymore, returns how many pass runs changed data
+
+    When `fn_names` is given only those functions are optimized, the other ones are only read (like the callees to inline),
+    passes are measured by `profiler` when given (see `profiling`), each round of the module passes is an iteration
+
+    `options` are the extra keyword arguments of the passes by pass name (like `{ 'inline': { 'external_sites': ... } }`,
+    see `parallel`), the ones of passes not registered are ignored
+    '''
+
+    options   = options or {}
+    changes   = 0
+    dirty     = list(ssa_functions.keys() if fn_names is None else fn_names)
+    optimized = list(dirty)
+
+    if profiler is not None:
+      profiler.begin(ssa_functions, optimized)
+
+    while len(dirty) > 0:
+      changes += sum(self.run_function(ssa_functions, fn_name, profiler, options) for fn_name in dirty)
+      dirty    = []
+
+      for p in self.passes_of_kind(MODULE_PASS):
+        kwargs  = options.get(p.name, {})
+        changed = p.fn(ssa_functions, fn_names, **kwargs) if profiler is None else profiler.module_pass(p, ssa_functions, fn_names, **kwargs)
+
+        if changed:
+          changes += 1
+          dirty.extend(fn_name for fn_name in changed if fn_name not in dirty)
+
+      if profiler is not None:
+        profiler.round += 1
+
+    if profiler is not None:
+      profiler.end(ssa_functions, optimized)
+
+    return changes
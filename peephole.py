@@ -0,0 +1,252 @@
+'''
+This module contains the peephole optimizer of sir functions, it works on the linear instructions before they are converted
+into ssa, so the cheaper code reaches `sir2ssa`
+
+It's a single pass over a stream of instructions (`peephole` is a generator, so it can sit between a reader and `sir2ssa_stream`):
+each instruction is appended to a window of the last instructions not yielded yet, then the patterns ending with it are replaced,
+the replacement goes through the patterns again (so `ldc 1; ldc 2; add; ldc 3; add` becomes `ldc 6`)
+
+* `ldc n; ldc m; op` becomes `ldc (n op m)`, and `ldc n; add; ldc m; add` becomes `ldc (n + m); add` (with `sub` and `mul` too,
+  see `optimizer.FOLD_RULES`)
+* `ldloc x` after `ldc n; stloc x` becomes `ldc n` while no label is met (a label may be reached from other paths)
+* `ldc n; pop` and `ldloc x; pop` are removed
+* `jmp L` right before `L:` is removed (a `jmpf L` becomes a `pop`), and so are the instructions after a `jmp` or a `ret` until the next label
+* a `jmpf` on a constant becomes a `jmp` or is removed
+* the strength reductions a stack can do with a single use of the operand (see `strength`): `x * 2**k` becomes `x << k`,
+  `x / 2**k` becomes `x >> k` for unsigned types, `x +- 0`, `x */ 1`, `x << 0`, `x >> 0` and `-(-x)` become `x`
+
+Folding has the semantics of `semantics.fold`, the same of the ssa optimizer (values wrap around to their type)
+'''
+
+from data      import Instr, Label
+from semantics import fold as fold_values, wrap
+from strength  import int_type, is_power_of_two, log2
+
+# how many instructions are kept back before being yielded (the patterns only look at the last 4 of them, the others
+# are kept so the instructions before a replaced pattern can still be part of another one)
+WINDOW = 16
+
+FOLDED_OPS   = ['add', 'sub', 'mul', 'div', 'less', 'shl', 'shr']
+ADDITIVE_OPS = ['add', 'sub']
+TERMINATORS  = ['jmp', 'ret']
+
+def fold(code, typ, *values):
+  '''
+  This function returns the operation `code` on the constants `values` of type `typ` as an int, `None` when it can't be folded
+  (it has no defined result at compile time, see `semantics`)
+  '''
+
+  try:
+    return int(fold_values(code, typ, *values))
+  except ArithmeticError:
+    return None
+
+def operand(ldc, typ):
+  '''
+  This function returns the constant of `ldc` as an operand of type `typ` (it's a value of its own type first, like a negative `u32`)
+  '''
+
+  return wrap(wrap(ldc.value, ldc.typ), typ)
+
+def is_ldc(instr):
+  return isinstance(instr, Instr) and instr.code == 'ldc'
+
+def is_code(instr, *codes):
+  return isinstance(instr, Instr) and instr.code in codes
+
+class Peephole:
+  '''
+  Data structure for handling the state of the peephole optimizer (see `peephole`)
+
+  * `window`      the instructions not yielded yet, the patterns are matched at its end
+  * `constants`   the `ldc` stored in each local since the last label (see `stloc`)
+  * `unreachable` whether the instructions are after a `jmp` or a `ret` (they are dropped until the next label)
+  '''
+
+  def __init__(self):
+    self.window      = []
+    self.constants   = {}
+    self.unreachable = False
+
+  def tail(self, n):
+    '''
+    This function returns the last `n` instructions of the window (`None` for the missing ones)
+    '''
+
+    return ([None] * n + self.window[-n:])[-n:]
+
+  def last(self):
+    return self.window[-1] if len(self.window) > 0 else None
+
+  def replace(self, n, *instrs):
+    # the replaced instructions are removed, the new ones are matched again
+    del self.window[len(self.window) - n:]
+
+    for instr in instrs:
+      self.emit(instr)
+
+  def emit(self, instr):
+    '''
+    This function appends `instr` to the window, replacing the patterns ending with it
+    '''
+
+    if isinstance(instr, Label):
+      self.label(instr)
+      return
+
+    if self.unreachable:
+      return
+
+    match instr.code:
+      case 'ldloc':
+        # the local is known to hold a constant
+        if instr.loc in self.constants:
+          self.emit(Instr('ldc', instr.typ, value=self.constants[instr.loc]))
+          return
+
+      case 'stloc':
+        previous = self.last()
+
+        if is_ldc(previous):
+          self.constants[instr.loc] = previous.value
+        else:
+          self.constants.pop(instr.loc, None)
+
+      case 'pop':
+        # loads have no sideeffects
+        if is_code(self.last(), 'ldc', 'ldloc'):
+          self.replace(1)
+          return
+
+      case 'neg':
+        previous = self.last()
+
+        if is_ldc(previous) and isinstance(previous.value, int):
+          self.replace(1, Instr('ldc', instr.typ, value=fold('neg', instr.typ, operand(previous, instr.typ))))
+          return
+
+        if is_code(previous, 'neg'):
+          self.replace(1)
+          return
+
+      case 'jmpf':
+        previous = self.last()
+
+        # the condition is known, so the jump is either always or never taken
+        if is_ldc(previous):
+          self.replace(1, *([Instr('jmp', 'void', target=instr.target)] if operand(previous, previous.typ) == 0 else []))
+          return
+
+      case code if code in FOLDED_OPS:
+        if self.binary(instr):
+          return
+
+    self.window.append(instr)
+
+    if instr.code in TERMINATORS:
+      self.unreachable = True
+
+  def binary(self, instr):
+    '''
+    This function replaces the patterns ending with the binary operation `instr`, returns whether one was replaced
+    '''
+
+    code         = instr.code
+    before, l, r = self.tail(3)
+    typ          = int_type(instr.typ)
+
+    # `ldc n; ldc m; op` -> `ldc (n op m)`
+    if is_ldc(l) and is_ldc(r) and isinstance(l.value, int) and isinstance(r.value, int):
+      value = fold(code, instr.typ, operand(l, instr.typ), operand(r, instr.typ))
+
+      if value is not None:
+        self.replace(2, Instr('ldc', instr.typ, value=value))
+        return True
+
+    # `ldc n; ldloc x; op` -> `ldloc x; ldc n; op`, so the constant is the right operand of commutative operations
+    if code in ['add', 'mul'] and is_ldc(l) and is_code(r, 'ldloc'):
+      self.replace(2, r, l, instr)
+      return True
+
+    if not is_ldc(r) or not isinstance(r.value, int):
+      return False
+
+    # the constant as the runtime sees it (a negative `u32` is a large one)
+    n = operand(r, instr.typ)
+
+    # `op n; ldc m; op` -> `ldc (n op m); op` (the two operations wrap around to the same type)
+    if code in ADDITIVE_OPS and is_code(l, *ADDITIVE_OPS) and l.typ == instr.typ and is_ldc(before) and isinstance(before.value, int):
+      m     = operand(before, instr.typ)
+      total = (m if l.code == 'add' else -m) + (n if code == 'add' else -n)
+      self.replace(3, Instr('ldc', instr.typ, value=wrap(total, instr.typ)), Instr('add', instr.typ))
+      return True
+
+    if code == 'mul' and is_code(l, 'mul') and l.typ == instr.typ and is_ldc(before) and isinstance(before.value, int):
+      self.replace(3, Instr('ldc', instr.typ, value=wrap(operand(before, instr.typ) * n, instr.typ)), instr)
+      return True
+
+    # `x +- 0`, `x */ 1` and `x <<>> 0` are `x`
+    if (code in ['add', 'sub', 'shl', 'shr'] and n == 0) or (code in ['mul', 'div'] and n == 1):
+      self.replace(1)
+      return True
+
+    if code == 'mul' and n == 0:
+      self.replace(1, Instr('pop', 'void'), Instr('ldc', instr.typ, value=0))
+      return True
+
+    if code == 'mul' and n == wrap(-1, instr.typ):
+      self.replace(1, Instr('neg', instr.typ))
+      return True
+
+    # the strength reductions (integer types only)
+    if typ is not None and is_power_of_two(n):
+      if code == 'mul':
+        self.replace(1, Instr('ldc', instr.typ, value=log2(n)), Instr('shl', instr.typ))
+        return True
+
+      # signed divisions round toward zero, so they need the operand again for the correction (see `strength.div_by_const`)
+      if code == 'div' and not typ[0]:
+        self.replace(1, Instr('ldc', instr.typ, value=log2(n)), Instr('shr', instr.typ))
+        return True
+
+    return False
+
+  def label(self, label):
+    last = self.last()
+
+    # jumps to the next instruction
+    if is_code(last, 'jmp') and last.target == label.name:
+      self.window.pop()
+    elif is_code(last, 'jmpf') and last.target == label.name:
+      self.replace(1, Instr('pop', 'void'))
+
+    # the label may be reached from other paths, where the locals hold other values
+    self.window.append(label)
+    self.constants.clear()
+    self.unreachable = False
+
+  def flush(self, keep=0):
+    '''
+    This function yields the instructions of the window but the last `keep` ones
+    '''
+
+    flushed = self.window[:len(self.window) - keep]
+    del self.window[:len(flushed)]
+
+    yield from flushed
+
+def peephole(sir, window=WINDOW):
+  '''
+  This function yields the instructions of `sir` (any iterable of sir instructions, like a generator) optimized by the patterns
+  of the module, keeping at most `window` instructions in memory
+  '''
+
+  optimizer = Peephole()
+
+  for instr in sir:
+    optimizer.emit(instr)
+
+    if len(optimizer.window) > window:
+      yield from optimizer.flush(window // 2)
+
+  yield from optimizer.flush()
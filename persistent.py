@@ -0,0 +1,67 @@
+'''
+This module contains utilities for handling ssa functions as persistent data structures
+
+Instructions are never mutated (see `Instr.replace`) and passes replace block lists instead of mutating them,
+so copying a module only means copying the dicts, while blocks and instructions are shared until they are rewritten
+'''
+
+def copy_on_write(ssa_functions):
+  '''
+  This function returns a copy of `ssa_functions` that can be optimized without touching the original one,
+  only the module dict and the function dicts are copied (blocks and instructions are shared)
+  '''
+
+  return { fn_name: dict(ssa) for fn_name, ssa in ssa_functions.items() }
+
+def snapshot(ssa_functions):
+  '''
+  This function returns a snapshot of `ssa_functions` (to be compared later with `snapshot_diff`),
+  it costs the same of `copy_on_write` since blocks are referenced and not copied
+  '''
+
+  return copy_on_write(ssa_functions)
+
+def same_block(old, new):
+  '''
+  This function returns whether two blocks contain the same instructions (compared by identity)
+  '''
+
+  return old is new or (len(old) == len(new) and all(a is b for a, b in zip(old, new)))
+
+def snapshot_diff(old, new):
+  '''
+  This function returns the `(fn_name, block_name)` pairs that were added, removed or rewritten between two snapshots
+  '''
+
+  diff = []
+
+  for fn_name in old.keys() | new.keys():
+    old_ssa = old.get(fn_name, {})
+    new_ssa = new.get(fn_name, {})
+
+    for block_name in old_ssa.keys() | new_ssa.keys():
+      # the block was added or removed
+      if block_name not in old_ssa or block_name not in new_ssa:
+        diff.append((fn_name, block_name))
+
+      # the block was rewritten
+      elif not same_block(old_ssa[block_name], new_ssa[block_name]):
+        diff.append((fn_name, block_name))
+
+  return diff
+
+def same_snapshot(old, new):
+  '''
+  This function returns whether nothing changed between two snapshots
+  '''
+
+  return len(snapshot_diff(old, new)) == 0
+
+def shared_instructions(old, new):
+  '''
+  This function returns how many top level instructions of `new` are shared with `old`
+  '''
+
+  old_instrs = { id(instr) for ssa in old.values() for block in ssa.values() for instr in block }
+
+  return sum(id(instr) in old_instrs for ssa in new.values() for block in ssa.values() for instr in block)
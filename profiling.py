@@ -0,0 +1,170 @@
+'''
+This module contains the profiler of the pass manager: given to `optimizer.optimize1` (or `PassManager.run`), it records
+
+* for each pass, and for each pass in each round of the module passes (see `PassManager.run`): how many times it was run,
+  how many runs changed data, the wall time and the nodes visited (the nodes of the block, the function or the module it was given)
+* how many times each rule of the watched rule sets fired (see `rewrite.RuleSet.fired`)
+* the instructions and nodes of each block before and after the optimization
+
+The pass manager only checks whether a profiler was given, so there's no cost when profiling is off
+'''
+
+import json
+import time
+
+from walk import postorder
+
+def block_nodes(block):
+  '''
+  This function returns how many nodes the instructions of `block` have (a node shared by more instructions is counted once)
+  '''
+
+  visited = set()
+  count   = 0
+
+  for instr in block:
+    for node in postorder(instr, skip=visited):
+      visited.add(id(node))
+      count += 1
+
+  return count
+
+def function_nodes(ssa):
+  return sum(block_nodes(block) for block in ssa.values())
+
+class PassStats:
+  '''
+  Data structure for handling the measures of a pass
+  '''
+
+  __slots__ = ('calls', 'changes', 'time', 'nodes')
+
+  def __init__(self):
+    self.calls   = 0
+    self.changes = 0
+    self.time    = 0.0
+    self.nodes   = 0
+
+  def add(self, changed, elapsed, nodes):
+    self.calls   += 1
+    self.changes += bool(changed)
+    self.time    += elapsed
+    self.nodes   += nodes
+
+  def as_dict(self):
+    return { 'calls': self.calls, 'changes': self.changes, 'time_s': self.time, 'nodes': self.nodes }
+
+class Profiler:
+  '''
+  Data structure for handling the measures of one or more runs of a pass manager (see the module)
+  '''
+
+  def __init__(self, rule_sets=None):
+    self.rule_sets  = dict(rule_sets or {}) # watched rule sets by name
+    self.passes     = {}                    # `PassStats` by pass name
+    self.kinds      = {}                    # kind of each pass
+    self.iterations = {}                    # `PassStats` by `(round, pass name)`
+    self.blocks     = {}                    # `[instrs before, nodes before, instrs after, nodes after]` by `(fn_name, block_name)`
+    self.rules      = {}                    # fire count of each rule by rule set name
+    self.round      = 0
+    self.time       = 0.0
+    self.started    = None
+    self.fired      = {}                    # fire counts of the rule sets when the run started
+
+  def watch(self, name, rule_set):
+    self.rule_sets[name] = rule_set
+
+  def begin(self, ssa_functions, fn_names):
+    '''
+    This function is called by the pass manager before optimizing `fn_names` (functions of `ssa_functions`)
+    '''
+
+    self.round   = 0
+    self.started = time.perf_counter()
+    self.fired   = { name: rule_set.fired.copy() for name, rule_set in self.rule_sets.items() }
+
+    for fn_name in fn_names:
+      for block_name, block in ssa_functions[fn_name].items():
+        self.blocks.setdefault((fn_name, block_name), [0, 0, 0, 0])[0:2] = len(block), block_nodes(block)
+
+  def end(self, ssa_functions, fn_names):
+    '''
+    This function is called by the pass manager after optimizing `fn_names`
+    '''
+
+    self.time += time.perf_counter() - self.started
+
+    for name, rule_set in self.rule_sets.items():
+      counts = self.rules.setdefault(name, {})
+
+      for rule, n in (rule_set.fired - self.fired[name]).items():
+        counts[rule] = counts.get(rule, 0) + n
+
+    for fn_name in fn_names:
+      for block_name, block in ssa_functions[fn_name].items():
+        self.blocks.setdefault((fn_name, block_name), [0, 0, 0, 0])[2:4] = len(block), block_nodes(block)
+
+  def block_pass(self, p, ssa, block_name, **kwargs):
+    return self.run_pass(p, block_nodes(ssa[block_name]), ssa, block_name, **kwargs)
+
+  def function_pass(self, p, ssa_functions, fn_name, **kwargs):
+    return self.run_pass(p, function_nodes(ssa_functions[fn_name]), ssa_functions, fn_name, **kwargs)
+
+  def module_pass(self, p, ssa_functions, fn_names, **kwargs):
+    nodes = sum(function_nodes(ssa_functions[fn_name]) for fn_name in (ssa_functions.keys() if fn_names is None else fn_names))
+    return self.run_pass(p, nodes, ssa_functions, fn_names, **kwargs)
+
+  def run_pass(self, p, nodes, *args, **kwargs):
+    '''
+    This function runs the pass `p` with `args` and `kwargs`, measuring it (`nodes` is how many nodes it's given), returns its result
+    '''
+
+    start   = time.perf_counter()
+    result  = p.fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    if p.name not in self.passes:
+      self.passes[p.name] = PassStats()
+      self.kinds[p.name]  = p.kind
+
+    self.passes[p.name].add(result, elapsed, nodes)
+    self.iterations.setdefault((self.round, p.name), PassStats()).add(result, elapsed, nodes)
+
+    return result
+
+  def as_dict(self):
+    return {
+      'time_s':     self.time,
+      'passes':     { name: { 'kind': self.kinds[name], **stats.as_dict() } for name, stats in self.passes.items() },
+      'iterations': [{ 'round': r, 'pass': name, **stats.as_dict() } for (r, name), stats in self.iterations.items()],
+      'rules':      self.rules,
+      'blocks':     [
+        { 'fn': fn_name, 'block': block_name, 'instrs_before': a, 'nodes_before': b, 'instrs_after': c, 'nodes_after': d }
+        for (fn_name, block_name), (a, b, c, d) in self.blocks.items()
+      ],
+    }
+
+  def to_json(self, path=None):
+    '''
+    This function returns the measures as json, also writing them to `path` when given
+    '''
+
+    data = json.dumps(self.as_dict(), indent=2)
+
+    if path is not None:
+      with open(path, 'w') as f:
+        f.write(data)
+
+    return data
+
+  def summary(self):
+    '''
+    This function returns a human readable table of the passes, the slowest first
+    '''
+
+    lines = [f'{"pass":<14} {"kind":<9} {"calls":>8} {"changes":>8} {"nodes":>10} {"time":>9}']
+
+    for name, stats in sorted(self.passes.items(), key=lambda item: -item[1].time):
+      lines.append(f'{name:<14} {self.kinds[name]:<9} {stats.calls:>8} {stats.changes:>8} {stats.nodes:>10} {stats.time:>8.3f}s')
+
+    return '\n'.join(lines)
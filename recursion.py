@@ -0,0 +1,133 @@
+'''
+This module contains the pass converting self recursive functions into loops, the recursive `call`s are replaced with
+a store of the args into the parameters (locals `0..len(args) - 1`) and a `goto` back to the entry block
+
+It handles:
+* tail recursion, `ret f(args)`
+* linear recursion with an accumulator, `ret x + f(args)` (or `*`, with the `call` on either side), the pending operations
+  are accumulated in a new local, which is applied to the values returned by the base cases
+'''
+
+from data      import Instr, opcodes
+from cfg       import max_label, max_local
+from callgraph import CALL_IDS
+from walk      import postorder, is_pure
+
+RET_IDS = opcodes(['ret'])
+
+# operations which can be accumulated (they are associative and commutative) and their identity
+ACCUMULATED_OPS = { 'add': 0, 'mul': 1 }
+
+def recursive_return(ret, fn_name):
+  '''
+  This function returns `(call, op, x)` when `ret` returns the result of a recursive `call` (`op` and `x` are `None` for tail calls,
+  otherwise the returned value is `op(x, call)`), `None` when `ret` isn't recursive and `False` when it can't be converted
+  '''
+
+  self_calls = [node for node in postorder(ret) if node.op in CALL_IDS and node.fn == fn_name]
+
+  if len(self_calls) == 0:
+    return None
+
+  value = ret.value
+
+  # tail call
+  if value is self_calls[0] and len(self_calls) == 1:
+    return value, None, None
+
+  if len(self_calls) != 1 or value.code not in ACCUMULATED_OPS:
+    return False
+
+  call = self_calls[0]
+
+  # the other operand is evaluated once per iteration, so it can't have sideeffects
+  for x, y in [(value.l, value.r), (value.r, value.l)]:
+    if y is call and is_pure(x):
+      return call, value.code, x
+
+  return False
+
+def recursion_to_loop(ssa_functions, fn_name):
+  '''
+  This function converts the self recursive `call`s of `fn_name` into a loop (see the module), when every one of them
+  is returned (directly or through an accumulator), returns the names of the changed blocks
+  '''
+
+  ssa     = ssa_functions[fn_name]
+  entry   = next(iter(ssa.keys()))
+  returns = {}
+  op      = None
+
+  for block_name, block in ssa.items():
+    for index, instr in enumerate(block):
+      recursive = recursive_return(instr, fn_name) if instr.op in RET_IDS else None
+
+      if recursive is False:
+        return []
+
+      # a recursive `call` not returned needs its own frame
+      if recursive is None and any(node.op in CALL_IDS and node.fn == fn_name for node in postorder(instr)):
+        return []
+
+      if recursive is not None:
+        # the pending operations of all the calls have to be the same
+        if recursive[1] is not None:
+          if op is not None and op != recursive[1]:
+            return []
+
+          op = recursive[1]
+
+        returns[(block_name, index)] = recursive
+
+  if len(returns) == 0:
+    return []
+
+  temps = max_local(ssa) + 1
+  acc   = temps + max(len(call.args) for call, _, _ in returns.values())
+  typ   = next(iter(returns.values()))[0].typ
+  dirty = []
+
+  for block_name, block in list(ssa.items()):
+    new_block = []
+
+    for index, instr in enumerate(block):
+      if (block_name, index) in returns:
+        call, call_op, x = returns[(block_name, index)]
+        # the args are evaluated before the parameters are overwritten (they may read them)
+        stores = [Instr('stloc', 'void', loc=temps + i, value=arg) for i, arg in enumerate(call.args)]
+
+        if call_op is not None:
+          update = Instr('stloc', 'void', loc=acc, value=Instr(call_op, typ, l=Instr('ldloc', typ, loc=acc), r=x))
+          # keeping the evaluation order of the original operands
+          stores = [update] + stores if instr.value.l is x else stores + [update]
+
+        new_block.extend(stores)
+        new_block.extend(Instr('stloc', 'void', loc=i, value=Instr('ldloc', arg.typ, loc=temps + i)) for i, arg in enumerate(call.args))
+        new_block.append(Instr('goto', 'void', target=entry))
+        # instructions following a `ret` are never executed
+        break
+
+      # the base cases apply the pending operations
+      if instr.op in RET_IDS and op is not None and instr.value is not None:
+        instr = instr.replace(value=Instr(op, instr.value.typ, l=Instr('ldloc', instr.value.typ, loc=acc), r=instr.value))
+
+      new_block.append(instr)
+
+    if len(new_block) != len(block) or any(a is not b for a, b in zip(new_block, block)):
+      ssa[block_name] = new_block
+      dirty.append(block_name)
+
+  # the accumulator is initialized by a new entry block (the old one is the head of the loop)
+  if op is not None:
+    new_entry = f'l{max_label(ssa) + 1}'
+    old       = dict(ssa)
+
+    ssa.clear()
+    ssa[new_entry] = [
+      Instr('stloc', 'void', loc=acc, value=Instr('const', typ, value=ACCUMULATED_OPS[op])),
+      Instr('goto', 'void', target=entry),
+    ]
+    ssa.update(old)
+    dirty.append(new_entry)
+
+  return dirty
@@ -0,0 +1,343 @@
+'''
+This module contains the rewrite rules engine used by the optimizer
+
+Rules are written as `'lhs -> rhs'` strings, where both sides are infix expressions:
+* `x`, `y`, `z` match any instruction
+* `n`, `m`, `k` match any `const` (in the rhs they are their value)
+* integers match a `const` with that value
+* `+ - * / < << >>` and the unary `-` match the corresponding instruction
+* `f(...)` in the rhs calls the function `f` of the rule set with the values of constants (and the other nodes as they are)
+  and the type of the rewritten node as `typ`, it returns a value for a `const`, an instruction, or `None` when the rule doesn't apply
+
+A variable used twice has to match the same node (see `hashcons`), and a rhs node whose operands are all constants is folded,
+a rule never changes the type of the node it rewrites (like `x + 0 -> x` when `x` has another type, whose value doesn't wrap around the same)
+
+Rules are compiled into an automaton dispatching on the code of a node and the codes of its operands, so all the rules
+a node could match are found with a single dict lookup (adding a rule doesn't make other nodes slower)
+'''
+
+import re
+
+from collections import Counter
+from data        import Instr, OPERANDS, opcode
+from semantics   import wrap
+from walk        import transform
+
+ANY_VARS   = 'xyz'
+CONST_VARS = 'nmk'
+ANY        = -1 # the shape of a variable matching any instruction
+
+BIN_SYMBOLS = {
+  '+':  'add',
+  '-':  'sub',
+  '*':  'mul',
+  '/':  'div',
+  '<':  'less',
+  '<<': 'shl',
+  '>>': 'shr',
+}
+
+# binary operators by precedence (lower first)
+PRECEDENCE = [['<'], ['<<', '>>'], ['+', '-'], ['*', '/']]
+
+TOKEN_REGEX = re.compile(r'\s*(<<|>>|->|[-+*/<(),]|\d+|[a-zA-Z_]\w*)')
+
+class PVar:
+  '''
+  Pattern matching any instruction (or any `const` when `const` is set)
+  '''
+
+  def __init__(self, name, const):
+    self.name  = name
+    self.const = const
+
+class PLit:
+  '''
+  Pattern matching a `const` with value `value`
+  '''
+
+  def __init__(self, value):
+    self.value = value
+
+class POp:
+  '''
+  Pattern matching an instruction with code `code` and operands matching `operands`
+  '''
+
+  def __init__(self, code, operands):
+    self.code     = code
+    self.op       = opcode(code)
+    self.operands = operands
+
+class PCall:
+  '''
+  Rhs only pattern, calling the function `name` of the rule set with `args` (the values of the constant ones)
+  '''
+
+  def __init__(self, name, args):
+    self.name = name
+    self.args = args
+
+def tokenize(text):
+  tokens = []
+  i      = 0
+
+  while i < len(text.rstrip()):
+    token = TOKEN_REGEX.match(text, i)
+
+    if token is None:
+      raise SyntaxError(f'unexpected character in rule `{text}` at {i}')
+
+    tokens.append(token.group(1))
+    i = token.end()
+
+  return tokens
+
+def parse_expr(tokens, text):
+  '''
+  This function parses an infix expression from `tokens` (consuming them) into a pattern
+  '''
+
+  def expect(token):
+    if len(tokens) == 0 or tokens[0] != token:
+      raise SyntaxError(f'expected `{token}` in rule `{text}`')
+
+    tokens.pop(0)
+
+  def parse_binary(level):
+    # the last level are unary operations
+    if level == len(PRECEDENCE):
+      return parse_unary()
+
+    l = parse_binary(level + 1)
+
+    while len(tokens) > 0 and tokens[0] in PRECEDENCE[level]:
+      symbol = tokens.pop(0)
+      l      = POp(BIN_SYMBOLS[symbol], [l, parse_binary(level + 1)])
+
+    return l
+
+  def parse_unary():
+    if len(tokens) == 0:
+      raise SyntaxError(f'unexpected end of rule `{text}`')
+
+    token = tokens.pop(0)
+
+    if token == '-':
+      return POp('neg', [parse_unary()])
+
+    if token == '(':
+      e = parse_binary(0)
+      expect(')')
+      return e
+
+    if token.isdigit():
+      return PLit(int(token))
+
+    # calling a function
+    if len(tokens) > 0 and tokens[0] == '(':
+      tokens.pop(0)
+      args = [parse_binary(0)]
+
+      while tokens[0] == ',':
+        tokens.pop(0)
+        args.append(parse_binary(0))
+
+      expect(')')
+      return PCall(token, args)
+
+    if token[0] not in ANY_VARS + CONST_VARS:
+      raise SyntaxError(f'unknown variable `{token}` in rule `{text}`')
+
+    return PVar(token, token[0] in CONST_VARS)
+
+  return parse_binary(0)
+
+class Rule:
+  '''
+  Data structure for handling a rewrite rule, `when(bindings, typ)` is an optional guard (`typ` is the type of the rewritten node)
+  '''
+
+  def __init__(self, text, when=None, name=None):
+    lhs, rhs = text.split('->')
+
+    self.text = text
+    self.name = name if name is not None else text
+    self.when = when
+    self.lhs  = self.parse_side(lhs)
+    self.rhs  = self.parse_side(rhs)
+
+    assert isinstance(self.lhs, POp), 'the lhs of a rule has to be an operation'
+
+  def parse_side(self, text):
+    tokens  = tokenize(text)
+    pattern = parse_expr(tokens, self.text)
+
+    if len(tokens) > 0:
+      raise SyntaxError(f'unexpected `{tokens[0]}` in rule `{self.text}`')
+
+    return pattern
+
+  def shape(self):
+    '''
+    This function returns the code of the lhs root and of its operands (`ANY` for a variable)
+    '''
+
+    return (self.lhs.op,) + tuple(
+      opcode('const') if isinstance(p, PLit) or (isinstance(p, PVar) and p.const) else
+      ANY             if isinstance(p, PVar) else
+      p.op
+      for p in self.lhs.operands
+    )
+
+class RuleSet:
+  '''
+  Data structure for handling a set of rules compiled into a dispatch automaton
+
+  * `fold(code, typ, *values)` computes the value of an operation on constants of type `typ`, raising `ArithmeticError` when it can't
+    be folded (see `semantics.fold`)
+  * `functions` are the functions callable from the rhs of the rules
+  * `fired` counts how many times each rule was applied
+  '''
+
+  def __init__(self, rules, fold, functions={}):
+    self.rules     = []
+    self.fold      = fold
+    self.functions = functions
+    self.fired     = Counter()
+    # the state of the automaton for each shape of node (code of the node and codes of its operands), filled lazily
+    self.automaton = {}
+
+    for r in rules:
+      self.add(r)
+
+  def add(self, rule):
+    if isinstance(rule, str):
+      rule = Rule(rule)
+
+    self.rules.append(rule)
+    # the automaton has to be built again
+    self.automaton = {}
+
+  def candidates(self, node):
+    '''
+    This function returns the rules `node` could match, looking at the shape of the node
+    '''
+
+    shape = (node.op,) + tuple(operand.op for operand in node.operands() if isinstance(operand, Instr))
+
+    if shape not in self.automaton:
+      self.automaton[shape] = [
+        r for r in self.rules
+        if len(r.shape()) == len(shape) and all(s in (ANY, n) for s, n in zip(r.shape(), shape))
+      ]
+
+    return self.automaton[shape]
+
+  def match(self, pattern, node, bindings, typ):
+    '''
+    This function returns whether `node` matches `pattern`, filling `bindings`, the operations matched have to be of type `typ`
+    (an operation of another type wraps around to another width, like the `i64` products of `strength.div_by_const`)
+    '''
+
+    match pattern:
+      case PVar(name=name, const=const):
+        if const and node.code != 'const':
+          return False
+
+        # a variable used twice has to match the same node
+        if name in bindings:
+          return bindings[name] is node or (const and bindings[name].value == node.value)
+
+        bindings[name] = node
+        return True
+
+      case PLit(value=value):
+        return node.code == 'const' and node.value == value
+
+      case POp(op=op, operands=operands):
+        if node.op != op or node.typ != typ:
+          return False
+
+        return all(self.match(p, o, bindings, typ) for p, o in zip(operands, node.operands()))
+
+  def instantiate(self, pattern, bindings, typ):
+    '''
+    This function builds the rhs `pattern`, returns `None` when a constant can't be computed (like a division by zero)
+    '''
+
+    match pattern:
+      case PVar(name=name):
+        return bindings[name]
+
+      case PLit(value=value):
+        return Instr('const', typ, value=value)
+
+      case PCall(name=name, args=args):
+        args = [self.instantiate(a, bindings, typ) for a in args]
+
+        if None in args:
+          return None
+
+        result = self.functions[name](*(a.value if a.code == 'const' else a for a in args), typ=typ)
+
+        if result is None or isinstance(result, Instr):
+          return result
+
+        return Instr('const', typ, value=result)
+
+      case POp(code=code, operands=operands):
+        operands = [self.instantiate(p, bindings, typ) for p in operands]
+
+        if None in operands:
+          return None
+
+        # folding operations on constants (each one is a value of its own type, like a `u8` operand of an `i64` product)
+        if all(o.code == 'const' for o in operands):
+          try:
+            return Instr('const', typ, value=int(self.fold(code, typ, *(wrap(o.value, o.typ) for o in operands))))
+          # the operation has no defined result at compile time, so it's left to the runtime
+          except ArithmeticError:
+            return None
+
+        return Instr(code, typ, **dict(zip(OPERANDS[code], operands)))
+
+  def rewrite_node(self, node):
+    '''
+    This function applies the rules to `node` (not to its operands) until none matches, returns `(changed, node)`
+    '''
+
+    changed = False
+
+    while True:
+      for r in self.candidates(node):
+        bindings = {}
+
+        if not self.match(r.lhs, node, bindings, node.typ):
+          continue
+
+        # guards get the values of the constant variables (`x` matching a `const` is still a node, so its type can be read)
+        if r.when is not None and not r.when({ k: v.value if k in CONST_VARS else v for k, v in bindings.items() }, node.typ):
+          continue
+
+        new_node = self.instantiate(r.rhs, bindings, node.typ)
+
+        if new_node is None or new_node.typ != node.typ:
+          continue
+
+        self.fired[r.name] += 1
+        changed             = True
+        node                = new_node
+        break
+
+      # no rule matched
+      else:
+        return changed, node
+
+  def rewrite(self, tree, memo=None):
+    '''
+    This function applies the rules to each node of `tree` (operands first, without recursion), returns `(changed, tree)`,
+    `memo` caches the results by node, so a node shared by more trees (see `hashcons`) is rewritten once
+    '''
+
+    return transform(tree, self.rewrite_node, memo)
@@ -0,0 +1,242 @@
+'''
+This module contains the sparse conditional constant propagation pass (sccp), it finds the phis and locals holding a constant value
+and the `branch`es always going the same way, walking only the control flow edges which can be taken
+
+Each value has a lattice value:
+* `UNDEF`       the value wasn't met yet (or is only defined on edges never taken)
+* a constant    every definition met so far gives the same constant
+* `OVERDEFINED` the value isn't known at compile time
+'''
+
+from data      import Instr, opcodes
+from cfg       import CFG, remove_phi_incoming
+from deadcode  import liveness
+from semantics import wrap
+from walk      import postorder, transform
+
+UNDEF       = 'undef'
+OVERDEFINED = 'overdefined'
+
+LDLOC_IDS  = opcodes(['ldloc'])
+STLOC_IDS  = opcodes(['stloc'])
+PHI_IDS    = opcodes(['phi'])
+LDPHI_IDS  = opcodes(['ldphi'])
+FOLDED_IDS = opcodes(['add', 'sub', 'mul', 'div', 'less', 'shl', 'shr', 'neg'])
+
+def meet(a, b):
+  '''
+  This function returns the lattice value of a value defined both as `a` and as `b`
+  '''
+
+  if a == UNDEF:
+    return b
+
+  if b == UNDEF or a == b:
+    return a
+
+  return OVERDEFINED
+
+class SCCP:
+  '''
+  Data structure for handling the propagation state of a ssa function: the lattice value of each phi (by name)
+  and local (by index), and the control flow edges found executable
+  '''
+
+  def __init__(self, ssa, fold):
+    self.ssa        = ssa
+    self.fold       = fold
+    self.cfg        = CFG(ssa)
+    self.phis       = {}
+    self.locals     = {}
+    self.edges      = set()
+    self.executable = set()
+    # blocks reading each phi and each local, visited again when the value lowers
+    self.phi_users  = {}
+    self.loc_users  = {}
+
+    # a local read before being stored has the value it had when the function was called, which is unknown
+    live_in, _ = liveness(ssa, self.cfg)
+    entry_live = live_in[self.cfg.entry]
+
+    for block_name, block in ssa.items():
+      for instr in block:
+        if instr.op in PHI_IDS:
+          self.phis[instr.name] = UNDEF
+
+        if instr.op in STLOC_IDS:
+          self.locals[instr.loc] = OVERDEFINED if instr.loc in entry_live else UNDEF
+
+        for node in postorder(instr):
+          if node.op in LDPHI_IDS:
+            self.phi_users.setdefault(node.name, set()).add(block_name)
+          elif node.op in LDLOC_IDS:
+            self.loc_users.setdefault(node.loc, set()).add(block_name)
+
+  def value_of(self, node):
+    '''
+    This function returns the lattice value of a leaf node (constants and locals are values of the type they're read as)
+    '''
+
+    match node.code:
+      case 'const':
+        return wrap(node.value, node.typ)
+
+      case 'ldphi':
+        return self.phis[node.name]
+
+      case 'ldloc':
+        # locals never stored keep the (unknown) value of when the function was called
+        return wrap(self.locals.get(node.loc, OVERDEFINED), node.typ)
+
+      case _:
+        return OVERDEFINED
+
+  def evaluate(self, root, memo):
+    '''
+    This function returns the lattice value of the tree `root`, `memo` caches the values by node (shared nodes are evaluated once)
+    '''
+
+    for node in postorder(root, skip=memo):
+      if node.op not in FOLDED_IDS:
+        memo[id(node)] = self.value_of(node)
+        continue
+
+      # each operand is a value of its own type (like a `u8` operand of an `i64` product)
+      operands = [wrap(memo[id(o)], o.typ) for o in node.operands()]
+
+      if OVERDEFINED in operands:
+        memo[id(node)] = OVERDEFINED
+      elif UNDEF in operands:
+        memo[id(node)] = UNDEF
+      else:
+        try:
+          memo[id(node)] = int(self.fold(node.code, node.typ, *operands))
+        # the operation fails at runtime, so it's left there
+        except ArithmeticError:
+          memo[id(node)] = OVERDEFINED
+
+    return memo[id(root)]
+
+  def mark_edge(self, pred, succ, worklist):
+    if (pred, succ) in self.edges:
+      return
+
+    self.edges.add((pred, succ))
+    self.executable.add(succ)
+    # the phis of the successor have a new incoming value
+    worklist.add(succ)
+
+  def visit(self, block_name, worklist):
+    '''
+    This function evaluates the block (only executed ones are visited), lowering the values it defines,
+    the blocks reading the lowered values and the successors reached by new edges are added to `worklist`
+    '''
+
+    memo = {}
+
+    for instr in self.ssa[block_name]:
+      match instr.code:
+        case 'phi':
+          value = UNDEF
+
+          # values coming from edges never taken are ignored
+          for pred, v in zip(instr.preds, instr.values):
+            if (pred, block_name) in self.edges:
+              # phi values are read at the end of the predecessor
+              value = meet(value, self.evaluate(v, {}))
+
+          if value != self.phis[instr.name]:
+            self.phis[instr.name] = meet(self.phis[instr.name], value)
+            worklist.update(self.phi_users.get(instr.name, ()))
+
+        case 'stloc':
+          value = meet(self.locals[instr.loc], self.evaluate(instr.value, memo))
+
+          if value != self.locals[instr.loc]:
+            self.locals[instr.loc] = value
+            worklist.update(self.loc_users.get(instr.loc, ()))
+
+        case 'goto':
+          self.mark_edge(block_name, instr.target, worklist)
+
+        case 'branch':
+          # the condition is a value of its type (a `u8` `256` is `0`)
+          value = wrap(self.evaluate(instr.value, memo), instr.value.typ)
+
+          # an undefined condition (reading values never defined) is handled as unknown
+          if value in [UNDEF, OVERDEFINED]:
+            targets = [instr.T, instr.F]
+          else:
+            targets = [instr.T if value else instr.F]
+
+          for target in targets:
+            self.mark_edge(block_name, target, worklist)
+
+  def run(self):
+    '''
+    This function propagates the values until none of them lowers anymore
+    '''
+
+    self.executable.add(self.cfg.entry)
+    worklist = { self.cfg.entry }
+
+    while len(worklist) > 0:
+      block_name = worklist.pop()
+
+      if block_name in self.executable:
+        self.visit(block_name, worklist)
+
+  def constant(self, node):
+    '''
+    This function returns the `const` replacing `node` (a `ldphi` or a `ldloc`), or `None` when its value isn't a constant
+    '''
+
+    value = self.value_of(node) if node.op in LDPHI_IDS or node.op in LDLOC_IDS else OVERDEFINED
+
+    return None if value in [UNDEF, OVERDEFINED] else Instr('const', node.typ, value=value)
+
+def sparse_conditional_constant_propagation(ssa, fold):
+  '''
+  This function replaces the reads of phis and locals holding a constant with the constant, and the `branch`es
+  which can only go one way with a `goto`, `fold(code, typ, *values)` computes the value of an operation on constants (see `rewrite.RuleSet`),
+  returns the names of the changed blocks
+
+  Blocks never executed are left to `deadcode.remove_unreachable_blocks`
+  '''
+
+  sccp  = SCCP(ssa, fold)
+  sccp.run()
+
+  dirty = []
+  memo  = {}
+
+  def replace(node):
+    const = sccp.constant(node)
+
+    return (False, node) if const is None else (True, const)
+
+  for block_name in sccp.cfg.reverse_postorder():
+    # blocks never executed can't be changed, they may have undefined values
+    if block_name not in sccp.executable:
+      continue
+
+    block     = ssa[block_name]
+    new_block = [transform(instr, replace, memo)[1] for instr in block]
+    last      = new_block[-1] if len(new_block) > 0 else None
+
+    # a `branch` with a single executable edge always goes the same way
+    if last is not None and last.code == 'branch':
+      taken = [target for target in [last.T, last.F] if (block_name, target) in sccp.edges]
+
+      if len(taken) == 1 and last.T != last.F:
+        new_block[-1] = Instr('goto', 'void', target=taken[0])
+
+        for dropped in {last.T, last.F} - set(taken):
+          ssa[dropped] = remove_phi_incoming(ssa[dropped], block_name)
+          dirty.append(dropped)
+
+    if any(a is not b for a, b in zip(new_block, block)):
+      ssa[block_name] = new_block
+      dirty.append(block_name)
+
+  return dirty
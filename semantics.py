@@ -0,0 +1,153 @@
+'''
+This module contains the semantics of the operations on constants, shared by the folding passes (see `rewrite.RuleSet`, `sccp`, `loops`)
+
+Integer types (`i32`, `u8`, ..., see `strength.int_type`) have a fixed width: results wrap around to the range of the type
+and divisions truncate toward zero, computed exactly on python ints (no float is involved), other types keep the python semantics
+(divisions are truncated to int)
+
+An operation without a defined result raises an `ArithmeticError`, so it isn't folded and it's left to the runtime, where it traps
+(the compiled functions of `backend` raise it too, and `validate` marks the lane as trapped):
+* a division by zero
+* a shift by a negative count, or by a count not smaller than the width of the type (`MAX_SHIFT` for types without a width)
+'''
+
+from strength import int_type
+
+# shifts of values without a fixed width by more than this aren't computed (the python int would grow too much)
+MAX_SHIFT = 64
+
+SHIFT_OPS   = ['shl', 'shr']
+MODULAR_OPS = ['add', 'sub', 'mul', 'neg']
+
+def truncated_div(l, r):
+  '''
+  This function returns `l / r` truncated toward zero, exactly when both are ints (raises `ZeroDivisionError`)
+  '''
+
+  if isinstance(l, int) and isinstance(r, int):
+    quotient = abs(l) // abs(r)
+    return quotient if (l < 0) == (r < 0) else -quotient
+
+  return int(l / r)
+
+# the operations on python values, before wrapping around
+OPERATIONS = {
+  'add':  lambda l, r: l + r,
+  'sub':  lambda l, r: l - r,
+  'mul':  lambda l, r: l * r,
+  'div':  truncated_div,
+  'less': lambda l, r: int(l < r),
+  'shl':  lambda l, r: l << r,
+  'shr':  lambda l, r: l >> r,
+  'neg':  lambda l: -l,
+}
+
+# the functions computing each operation on each type, by `(code, typ)`, and the ones converting values to each type,
+# filled lazily (see `operation` and `converter`)
+FOLDERS    = {}
+CONVERTERS = {}
+
+def wrap(value, typ):
+  '''
+  This function returns `value` wrapped around to the range of `typ` (values of other types are returned as they are)
+  '''
+
+  info = int_type(typ)
+
+  if info is None or not isinstance(value, int):
+    return value
+
+  signed, width = info
+  value        &= (1 << width) - 1
+
+  return value - (1 << width) if signed and value >> (width - 1) else value
+
+def fits(value, typ):
+  '''
+  This function returns whether `value` is in the positive range of the signed type as wide as `typ`, so it can be
+  an operand of `typ` with any signedness (values of types without a fixed width always fit)
+  '''
+
+  info = int_type(typ)
+  return info is None or abs(value) < 1 << (info[1] - 1)
+
+def converter(typ):
+  '''
+  This function returns the function wrapping the ints of the python semantics around to the range of `typ` (faster than `wrap`,
+  the type is only parsed once), values of types without a fixed width are kept as they are
+  '''
+
+  if typ not in CONVERTERS:
+    info = int_type(typ)
+
+    if info is None:
+      CONVERTERS[typ] = lambda value: value
+    else:
+      signed, width = info
+      mask          = (1 << width) - 1
+      # adding the sign bit before masking and subtracting it after maps the unsigned range to the signed one
+      bias          = 1 << (width - 1) if signed else 0
+
+      CONVERTERS[typ] = lambda value: ((value + bias) & mask) - bias
+
+  return CONVERTERS[typ]
+
+def shift_limit(typ):
+  '''
+  This function returns the count the shifts of type `typ` have to be lower than (see the module)
+  '''
+
+  info = int_type(typ)
+  return MAX_SHIFT if info is None else info[1]
+
+def check_shift(r, limit):
+  '''
+  This function returns the shift count `r`, raising `ArithmeticError` when it's out of `0 <= r < limit` (see `shift_limit`)
+  '''
+
+  if not 0 <= r < limit:
+    raise ArithmeticError(f'shift count `{r}` out of range `0..{limit - 1}`')
+
+  return r
+
+def make_operation(code, typ):
+  op    = OPERATIONS[code]
+  info  = int_type(typ)
+  limit = shift_limit(typ)
+
+  if code in SHIFT_OPS:
+    f = lambda l, r: op(l, check_shift(r, limit))
+  else:
+    f = op
+
+  if info is None:
+    return f
+
+  wrapped = converter(typ)
+
+  # constants out of the range of the type (like a negative `u32`) are wrapped around first, the results of the modular
+  # operations are the same either way
+  if code in MODULAR_OPS:
+    return lambda *values: wrapped(f(*values))
+
+  return lambda *values: wrapped(f(*(wrapped(value) for value in values)))
+
+def operation(code, typ):
+  '''
+  This function returns the function computing `code` on values of type `typ` (see `fold`), made once per `(code, typ)`
+  '''
+
+  key = code, typ
+
+  if key not in FOLDERS:
+    FOLDERS[key] = make_operation(code, typ)
+
+  return FOLDERS[key]
+
+def fold(code, typ, *values):
+  '''
+  This function returns the value of the operation `code` on the constants `values` of type `typ`, wrapped around to the type,
+  raises `ArithmeticError` when it has no defined result at compile time (see the module)
+  '''
+
+  return operation(code, typ)(*values)
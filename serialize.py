@@ -0,0 +1,110 @@
+'''
+This module contains the flat encoding of ssa functions: the nodes of a function are listed children first, each one only once
+(so shared nodes stay shared) and operands refer to nodes by their index in the list
+
+The encoding is made of tuples of strings and ints, so pickling it is fast and doesn't recurse (pickling instruction trees
+recurses as deep as the trees), and opcodes and types are stored by name in a table, so it doesn't depend on opcode ids:
+* `codes`  the opcodes used by the function
+* `types`  the types used by the function
+* `nodes`  a tuple `(code index, type index, kinds, operands)` for each node, `kinds` tells how each operand is encoded (see `Operand`)
+* `blocks` a tuple `(block name, indexes of the top level instructions)` for each block
+'''
+
+from data import Instr, instr_from_operands
+from walk import postorder
+
+class Operand:
+  '''
+  How an operand is encoded (a class, so the decoders can `match` on the names)
+  '''
+
+  VALUE  = 0 # the operand as it is (ints, strings, None)
+  NODE   = 1 # the index of a node
+  NODES  = 2 # a tuple of indexes of nodes (like `call` args)
+  VALUES = 3 # a tuple of values (like phi preds)
+
+class Encoder:
+  '''
+  Data structure for handling the tables of the encoding of a function
+  '''
+
+  def __init__(self):
+    self.codes = {}
+    self.types = {}
+    self.nodes = []
+    self.index = {} # index of each node already encoded (by id)
+
+  def intern(self, table, value):
+    return table.setdefault(value, len(table))
+
+  def encode_operand(self, operand):
+    if isinstance(operand, Instr):
+      return Operand.NODE, self.index[id(operand)]
+
+    if isinstance(operand, list):
+      if all(isinstance(e, Instr) for e in operand):
+        return Operand.NODES, tuple(self.index[id(e)] for e in operand)
+
+      return Operand.VALUES, tuple(operand)
+
+    return Operand.VALUE, operand
+
+  def encode(self, root):
+    '''
+    This function encodes the nodes of `root` not encoded yet, returns the index of `root`
+    '''
+
+    for node in postorder(root, skip=self.index):
+      kinds, operands = zip(*map(self.encode_operand, node.operands())) if len(node.operands()) > 0 else ((), ())
+
+      self.index[id(node)] = len(self.nodes)
+      self.nodes.append((self.intern(self.codes, node.code), self.intern(self.types, node.typ), kinds, operands))
+
+    return self.index[id(root)]
+
+def encode_function(ssa):
+  '''
+  This function returns the flat encoding of `ssa` (see the module)
+  '''
+
+  encoder = Encoder()
+  blocks  = tuple((block_name, tuple(encoder.encode(instr) for instr in block)) for block_name, block in ssa.items())
+
+  return tuple(encoder.codes.keys()), tuple(encoder.types.keys()), tuple(encoder.nodes), blocks
+
+def decode_nodes(codes, types, nodes):
+  '''
+  This function returns the instructions of the encoded `nodes`, in the same order
+  '''
+
+  decoded = []
+
+  for code, typ, kinds, operands in nodes:
+    values = []
+
+    for kind, operand in zip(kinds, operands):
+      match kind:
+        case Operand.VALUE:  values.append(operand)
+        case Operand.NODE:   values.append(decoded[operand])
+        case Operand.NODES:  values.append([decoded[i] for i in operand])
+        case Operand.VALUES: values.append(list(operand))
+
+    decoded.append(instr_from_operands(codes[code], types[typ], values))
+
+  return decoded
+
+def decode_function(encoded):
+  '''
+  This function returns the ssa function of the flat encoding `encoded` (see `encode_function`)
+  '''
+
+  codes, types, nodes, blocks = encoded
+  decoded                     = decode_nodes(codes, types, nodes)
+
+  return { block_name: [decoded[i] for i in roots] for block_name, roots in blocks }
+
+def encode_module(ssa_functions):
+  return { fn_name: encode_function(ssa) for fn_name, ssa in ssa_functions.items() }
+
+def decode_module(encoded):
+  return { fn_name: decode_function(e) for fn_name, e in encoded.items() }
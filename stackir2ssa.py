@@ -1,9 +1,9 @@
 from data  import Instr, Label
-from copy  import deepcopy
 
-def sir2ssa(sir):
+def sir2ssa_stream(sir):
   '''
-  This function converts a stack based ir chunk into a single static assignment one
+  This function converts a stack based ir chunk into a single static assignment one, yielding `(block_name, block)` pairs
+  as soon as each block is finished (`sir` can be any iterable, like a generator reading a big file)
 
   * Chunk = piece of ir
   * Ir    = intermediate representation
@@ -12,17 +12,59 @@ def sir2ssa(sir):
   '''
   While a stack based ir can be stored in a linear array, a single static assignment cannot because
   it has to store small chunk of code inside blocks (reacheable using branches or jumps)
+
+  Sir is read once in order, labels don't need to be searched since a label gets its ssa block name the first time
+  it's referenced (by a `jmp`/`jmpf`) or met, so only the current block and the virtual stack are kept in memory
   '''
-  
-  i                 = 0            # the indexer for sir
-  ssa               = { 'l0': [] } # the ssa representation result
-  block             = ssa['l0']    # a ref to the current ssa block (default is the main block)
-  vstack            = []           # a virtual stack simulating load (ld) and pop sir instructions
-  chunks_to_convert = []           # waitlist for chunks to convert (a chunk is usually appended to this list after a jmpf/jmpt)
-  blocks_remapping  = {}           # sir labels to ssa blocks name remapping
 
-  def convert_instr_into_block(b, instr):
-    nonlocal i, block
+  blocks_counter   = 1     # the next ssa block name to allocate ('l0' is the main block)
+  block_name       = 'l0'  # the name of the current ssa block
+  block            = []    # the current ssa block
+  terminated       = False # whether the current block ends with a `ret`/`goto` (following instructions are unreachable)
+  vstack           = []    # a virtual stack simulating load (ld) and pop sir instructions
+  blocks_remapping = {}    # sir labels to ssa blocks name remapping
+  defined_labels   = set() # sir labels already met
+
+  def new_block_name():
+    nonlocal blocks_counter
+
+    blocks_counter += 1
+    return f'l{blocks_counter - 1}'
+
+  def label_block(label):
+    # allocating the block name the first time the label is referenced
+    if label not in blocks_remapping:
+      blocks_remapping[label] = new_block_name()
+
+    return blocks_remapping[label]
+
+  for instr in sir:
+    if isinstance(instr, Label):
+      if instr.name in defined_labels:
+        raise ValueError(f'label `{instr.name}` defined twice')
+
+      defined_labels.add(instr.name)
+
+      # the label is at the beginning of the current block, so it can just refer to it
+      if len(block) == 0 and instr.name not in blocks_remapping:
+        blocks_remapping[instr.name] = block_name
+        continue
+
+      target = label_block(instr.name)
+
+      # the current block falls through the label
+      if not terminated:
+        block.append(Instr('goto', 'void', target=target))
+
+      # the current block is finished, the label one is gonna be filled
+      yield block_name, block
+      block_name, block, terminated = target, [], False
+      continue
+
+    # instructions following a `ret`/`goto` go into a new (unreachable) block
+    if terminated:
+      yield block_name, block
+      block_name, block, terminated = new_block_name(), [], False
 
     match instr.code:
       case 'ldloc':
@@ -30,75 +72,59 @@ def sir2ssa(sir):
 
       case 'ldc':
         vstack.append(Instr('const', instr.typ, value=instr.value))
-      
+
       case 'add' | 'sub' | 'mul' | 'div' | 'less' | 'shl' | 'shr':
         r = vstack.pop()
         l = vstack.pop()
         vstack.append(Instr(instr.code, instr.typ, l=l, r=r))
-      
+
       case 'neg':
         vstack.append(Instr(instr.code, instr.typ, value=vstack.pop()))
-      
+
       case 'stloc':
-        b.append(Instr('stloc', 'void', loc=instr.loc, value=vstack.pop()))
-      
+        block.append(Instr('stloc', 'void', loc=instr.loc, value=vstack.pop()))
+
       case 'ret':
-        b.append(Instr('ret', 'void', value=vstack.pop() if instr.typ != 'void' else None))
+        block.append(Instr('ret', 'void', value=vstack.pop() if instr.typ != 'void' else None))
+        terminated = True
 
       case 'jmp':
-        b.append(Instr('goto', 'void', target=blocks_remapping[instr.target]))
-      
+        block.append(Instr('goto', 'void', target=label_block(instr.target)))
+        terminated = True
+
       case 'pop':
-        b.append(vstack.pop())
+        block.append(vstack.pop())
 
       case 'jmpf':
         # value to check
         to_check = vstack.pop()
-        t = f'l{len(ssa)}'
-        f = f'l{len(ssa) + 1}'
-
-        # adding the else block to the remapping table (to let future `jmp` to remap a sir label into a ssa block name)
-        blocks_remapping[instr.target] = f
+        # the true block is the code following the `jmpf`, so it's the next one to be filled
+        t = new_block_name()
+        # the else block is the one of the label (it's filled when the label is met)
+        f = label_block(instr.target)
 
         # emitting a branch instruction
-        b.append(Instr('branch', 'void', value=to_check, T=t, F=f))
-
-        # calculating the index of the label into the sir chunk
-        label_index = sir.index(Label(instr.target))
-
-        # appending an empty ssa block for the true branch
-        ssa[t] = []
-        # inserting it into the waiting list (it will be evaluated lately)
-        chunks_to_convert.append((t, sir[i+1:label_index]))
+        block.append(Instr('branch', 'void', value=to_check, T=t, F=f))
 
-        # moving to the label index (i += 1 in the caller is gonna skip it, so the label won't be processed by the caller cycle)
-        i = label_index
+        # the current block is finished, moving to the true block
+        yield block_name, block
+        block_name, block, terminated = t, [], False
 
-        # appending an empty list for the else block
-        ssa[f] = []
-        # using the else block as main one
-        block = ssa[f]
-      
       case _:
         raise ValueError(f'unknown instr code `{instr.code}`')
 
-  # iterating instructions
-  while i < len(sir):
-    convert_instr_into_block(block, sir[i])
+  # the last block
+  yield block_name, block
 
-    # moving to the next chunk instruction
-    i += 1
+  # a `jmp`/`jmpf` referred to a label never met
+  for label in blocks_remapping.keys() - defined_labels:
+    raise ValueError(f'unknown label `{label}`')
 
-  # converting remaining blocks (previously inserted in the waiting list)
-  for block_name, chunk in chunks_to_convert:
-    # iterating chunk instructions
-    i = 0
-    while i < len(chunk):
-      convert_instr_into_block(ssa[block_name], chunk[i])
-
-      # moving to the next chunk instruction
-      i += 1
-  
   assert len(vstack) == 0
-  
-  return ssa
\ No newline at end of file
+
+def sir2ssa(sir):
+  '''
+  This function does the same of `sir2ssa_stream`, but returns the whole ssa chunk as a dict
+  '''
+
+  return dict(sir2ssa_stream(sir))
@@ -0,0 +1,219 @@
+'''
+This module contains the strength reduction of multiplications and divisions by constants, used by the rules of `optimizer.STRENGTH_RULES`
+
+* `x * n` becomes a sum of shifts of `x` (the signed digits of `n`), when it's cheaper than the multiplication
+* `x / n` becomes a shift when `n` is a power of 2 (with a rounding correction for signed types), otherwise a multiplication
+  by a magic number followed by a shift (Granlund and Montgomery, "Division by invariant integers using multiplication")
+
+Divisions truncate toward zero (see `semantics`), the type (`i32`, `u8`, ...) tells the signedness and the width of the operands,
+other types (like floats) aren't reduced
+'''
+
+from data import Instr
+
+# how many simple operations (`add`, `sub`, `shl`, `shr`, `neg`, `less`) a `mul` and a `div` cost
+MUL_COST = 4
+DIV_COST = 20
+
+# the type of the products of the magic number divisions (see `div_by_const`), and how many bits its positive values have
+WIDE_TYPE  = 'i64'
+WIDE_WIDTH = 63
+
+def int_type(typ):
+  '''
+  This function returns `(signed, width)` for an integer type, `None` for other types
+  '''
+
+  if len(typ) < 2 or typ[0] not in 'iu' or not typ[1:].isdigit():
+    return None
+
+  return typ[0] == 'i', int(typ[1:])
+
+def is_power_of_two(n):
+  '''
+  This functions returns whether `n` is a power of 2
+  '''
+
+  return n > 0 and n & (n - 1) == 0
+
+def log2(n):
+  '''
+  This function returns the exponent of the power of 2 `n`
+  '''
+
+  return n.bit_length() - 1
+
+def signed_digits(n):
+  '''
+  This function returns the non zero digits of the non adjacent form of `n` (`n > 0`) as `(shift, sign)`, lowest first,
+  it's the representation of `n` as sum of powers of 2 with the fewest terms
+  '''
+
+  digits = []
+  shift  = 0
+
+  while n != 0:
+    if n & 1:
+      # choosing -1 when the next bit is set too, so the run of ones becomes a single carry
+      sign    = 2 - (n & 3)
+      n      -= sign
+      digits.append((shift, sign))
+
+    n    >>= 1
+    shift += 1
+
+  return digits
+
+def const(typ, value):
+  return Instr('const', typ, value=value)
+
+def shift(x, k, typ):
+  return x if k == 0 else Instr('shl', typ, l=x, r=const(typ, k))
+
+def signed_value(n, width):
+  '''
+  This function returns the value of the lowest `width` bits of `n` read as a signed int (`2**32 - 2` is `-2` for `width == 32`)
+  '''
+
+  sign = 1 << (width - 1)
+  return ((n + sign) & ((1 << width) - 1)) - sign
+
+def mul_cost(n):
+  '''
+  This function returns the cost of multiplying by `n` with shifts, additions and subtractions
+  '''
+
+  digits = signed_digits(abs(n))
+  shifts = sum(1 for k, _ in digits if k > 0)
+
+  return shifts + len(digits) - 1 + (n < 0)
+
+def shift_add_mul(x, n, typ):
+  '''
+  This function returns `x * n` of type `typ` as shifts, additions and subtractions of `x`, `None` when a `mul` is cheaper
+  '''
+
+  info = int_type(typ)
+
+  if info is None:
+    return None
+
+  # the product wraps around, so `n` is the same of its value in the signed range of the type (a `u32` multiplication
+  # by `2**32 - 2` is one by `-2`), which has the fewest digits
+  width = info[1]
+  n     = signed_value(n, width)
+
+  if n in [0, 1] or mul_cost(n) >= MUL_COST:
+    return None
+
+  # the highest digit is always positive, so it's the start of the sum
+  digits = signed_digits(abs(n))[::-1]
+
+  # shifting by the whole width is undefined (see `semantics`), the `mul` is kept
+  if digits[0][0] >= width:
+    return None
+
+  result = shift(x, digits[0][0], typ)
+
+  for k, sign in digits[1:]:
+    result = Instr('add' if sign > 0 else 'sub', typ, l=result, r=shift(x, k, typ))
+
+  return Instr('neg', typ, value=result) if n < 0 else result
+
+def div_cost(n, signed):
+  '''
+  This function returns the cost of dividing by `n` (`n` isn't `0` or `1`) with the operations made by `div_by_const`
+  '''
+
+  d = abs(n)
+
+  if d == 1:
+    cost = 0
+  # a shift (with the rounding correction `x + ((x < 0) << k) - (x < 0)` for signed types)
+  elif is_power_of_two(d):
+    cost = 5 if signed else 1
+  # the multiplication by the magic number and its shift, then the rounding of negative dividends for signed types
+  # (or an addition of `0` bringing the quotient back to the type for unsigned ones)
+  else:
+    cost = MUL_COST + 1 + (2 if signed else 1)
+
+  return cost + (n < 0)
+
+def unsigned_magic(d, width):
+  '''
+  This function returns `(m, s)` so that `x / d == (x * m) >> s` for each `0 <= x < 2**width` (`d > 1`)
+  '''
+
+  l = (d - 1).bit_length()
+  s = width + l
+
+  return (1 << s) // d + 1, s
+
+def signed_magic(d, width):
+  '''
+  This function returns `(m, s)` so that `x / d == ((x * m) >> s) + (x < 0)` for each `-2**(width - 1) <= x < 2**(width - 1)` (`d > 1`)
+  '''
+
+  return unsigned_magic(d, width - 1)
+
+def div_by_const(x, n, typ):
+  '''
+  This function returns `x / n` of type `typ` without divisions, `None` when it can't be done or isn't cheaper
+  '''
+
+  info = int_type(typ)
+
+  if info is None:
+    return None
+
+  signed, width = info
+  # the divisor is wrapped around to the type, like the operands of a `div` (see `semantics`)
+  n             = signed_value(n, width) if signed else n & ((1 << width) - 1)
+  d             = abs(n)
+
+  # dividing by the lowest signed value would shift by the whole width
+  if n in [0, 1] or d >= 1 << (width - 1 if signed else width):
+    return None
+
+  if div_cost(n, signed) >= DIV_COST:
+    return None
+
+  # a negative divisor is only possible for signed types, the quotient has the opposite sign (division truncates)
+  if n < 0:
+    result = x if d == 1 else div_by_const(x, d, typ)
+    return None if result is None else Instr('neg', typ, value=result)
+
+  is_negative = lambda: Instr('less', typ, l=x, r=const(typ, 0))
+
+  if is_power_of_two(d):
+    k = log2(d)
+
+    if not signed:
+      return Instr('shr', typ, l=x, r=const(typ, k))
+
+    # `shr` rounds toward negative infinity, so `d - 1` is added to negative dividends
+    # (`(x < 0) << k) - (x < 0)` is `d - 1` when `x` is negative, otherwise `0`)
+    negative = is_negative()
+    bias     = Instr('sub', typ, l=shift(negative, k, typ), r=negative)
+
+    return Instr('shr', typ, l=Instr('add', typ, l=x, r=bias), r=const(typ, k))
+
+  # the product reads `x` as it is, so it has to be a value of the type (the operations of the type wrap their operands first)
+  if x.typ != typ:
+    return None
+
+  m, s = signed_magic(d, width) if signed else unsigned_magic(d, width)
+
+  # `x * m` is twice as wide as `x`, so the multiplication and the shift are done in `WIDE_TYPE` (the quotient fits `typ` again),
+  # the division is kept when the product doesn't fit it either
+  largest = 1 << (width - 1) if signed else (1 << width) - 1
+
+  if largest * m >= 1 << WIDE_WIDTH:
+    return None
+
+  product  = Instr('mul', WIDE_TYPE, l=x, r=const(WIDE_TYPE, m))
+  quotient = Instr('shr', WIDE_TYPE, l=product, r=const(WIDE_TYPE, s))
+
+  # the magic number rounds toward negative infinity, so negative dividends are rounded up, the quotient is brought back to `typ`
+  # by this operation (an addition of `0` for unsigned types), so the operations using it keep wrapping around to `typ`
+  return Instr('add', typ, l=quotient, r=is_negative() if signed else const(typ, 0))
@@ -0,0 +1,59 @@
+import pytest
+import backend
+
+from data        import Instr
+from backend     import compile_module
+from interpreter import Interpreter, Bailout
+
+def compiled(value, typ, *args):
+  return compile_module({ 'f': { 'l0': [Instr('ret', typ, value=value)] } })['f'](*args)
+
+def param(typ):
+  return Instr('ldloc', typ, loc=0)
+
+def test_divisions_are_exact():
+  x = param('i64')
+  assert compiled(Instr('div', 'i64', l=x, r=Instr('const', 'i64', value=3)), 'i64', 2**62 + 1) == (2**62 + 1) // 3
+  assert compiled(Instr('div', 'i64', l=x, r=Instr('const', 'i64', value=2)), 'i64', -7) == -3
+
+def test_results_wrap_to_the_type():
+  assert compiled(Instr('add', 'i32', l=param('i32'), r=Instr('const', 'i32', value=1)), 'i32', 2**31 - 1) == -2**31
+  assert compiled(Instr('sub', 'u8', l=param('u8'), r=Instr('const', 'u8', value=1)), 'u8', 0) == 255
+  assert compiled(Instr('shl', 'u32', l=param('u32'), r=Instr('const', 'u32', value=31)), 'u32', 3) == 2**31
+  assert compiled(Instr('less', 'u32', l=param('u32'), r=Instr('const', 'u32', value=5)), 'u32', -1) == 0
+
+@pytest.mark.parametrize('count', [-1, 32, 2**32 + 40])
+def test_undefined_shifts_trap_like_in_the_interpreter(count):
+  shifts = { 'f': { 'l0': [Instr('ret', 'i32', value=Instr('shl', 'i32', l=param('i32'), r=Instr('ldloc', 'i32', loc=1)))] } }
+
+  with pytest.raises(Bailout):
+    Interpreter(shifts).call('f', [1, count])
+
+  with pytest.raises(ArithmeticError):
+    compile_module(shifts)['f'](1, count)
+
+def test_shifts_have_the_semantics_of_the_validator():
+  np       = pytest.importorskip('numpy')
+  validate = pytest.importorskip('validate')
+  shifts   = { 'f': { 'l0': [Instr('ret', 'i32', value=Instr('shr', 'i32', l=param('i32'), r=Instr('ldloc', 'i32', loc=1)))] } }
+  counts   = np.array([-1, 0, 5, 31, 32, 40])
+
+  result, status, _ = validate.VectorInterpreter(shifts).call('f', [np.full(len(counts), -2**31), counts])
+
+  for count, value, trapped in zip(counts.tolist(), result.tolist(), status.tolist()):
+    if trapped == validate.TRAP:
+      with pytest.raises(ArithmeticError):
+        compile_module(shifts)['f'](-2**31, count)
+    else:
+      assert compile_module(shifts)['f'](-2**31, count) == value
+
+  assert status.tolist() == [validate.TRAP, 0, 0, 0, validate.TRAP, validate.TRAP]
+
+def test_caches_are_bounded():
+  backend.clear_cache()
+
+  for n in range(backend.MODULE_CACHE_SIZE + 10):
+    compiled(Instr('const', 'i32', value=n), 'i32')
+
+  assert len(backend.MODULE_CACHE) == backend.MODULE_CACHE_SIZE
+  assert len(backend.CODE_CACHE) == backend.CODE_CACHE_SIZE
@@ -0,0 +1,58 @@
+import pytest
+
+from data      import Instr, Label
+from binary    import ModuleFile, Tag, write_module, load_module, RecordWriter, RecordReader, StringTable
+from generate  import generate_module
+from optimizer import optimize1
+from serialize import encode_function, decode_function
+
+def sir_repr(sir):
+  return [repr(instr) for instr in sir]
+
+def test_ssa_modules_round_trip(tmp_path):
+  module  = generate_module(3, functions=5, call_ratio=0.3, size=60)
+  _, phis = optimize1(module)
+  path    = str(tmp_path / 'module.bin')
+
+  for m in [module, phis]:
+    write_module(path, m)
+    assert { fn_name: encode_function(ssa) for fn_name, ssa in load_module(path).items() } == { fn_name: encode_function(ssa) for fn_name, ssa in m.items() }
+
+def test_sir_modules_round_trip(tmp_path):
+  module = generate_module(3, functions=5, sir=True, size=60)
+  path   = str(tmp_path / 'module.bin')
+
+  write_module(path, module)
+  loaded = load_module(path)
+
+  assert all(sir_repr(loaded[fn_name]) == sir_repr(sir) for fn_name, sir in module.items())
+  assert any(isinstance(instr, Label) for sir in loaded.values() for instr in sir)
+
+def test_functions_are_decoded_lazily(tmp_path):
+  path = str(tmp_path / 'module.bin')
+  write_module(path, ((f'f{i}', ssa) for i, ssa in enumerate(generate_module(1, functions=3, size=30).values())))
+
+  with ModuleFile(path) as module:
+    assert list(module.keys()) == ['f0', 'f1', 'f2'] and 'f1' in module and len(module) == 3
+    assert encode_function(module['f1']) == encode_function(module['f1'])
+
+def test_modules_cant_mix_sir_and_ssa(tmp_path):
+  with pytest.raises(ValueError):
+    write_module(str(tmp_path / 'module.bin'), { 'a': generate_module(1, functions=1)['f0'], 'b': generate_module(1, functions=1, sir=True)['f0'] })
+
+@pytest.mark.parametrize('value', [None, True, False, 0, -1, 2**70, -2**70, 'l3', 1.5, [], ['l1', 'l2'], [1, [None, 'x']]])
+def test_tagged_values_round_trip(value):
+  strings = StringTable()
+  writer  = RecordWriter(strings)
+  writer.value(value)
+
+  assert writer.out[0] in vars(Tag).values()
+  assert RecordReader(writer.out, 0, list(strings.index.keys())).value() == value
+
+def test_flat_encoding_keeps_shared_nodes():
+  shared = Instr('add', 'i32', l=Instr('ldloc', 'i32', loc=0), r=Instr('const', 'i32', value=1))
+  ssa    = { 'l0': [Instr('stloc', 'void', loc=1, value=shared), Instr('ret', 'i32', value=Instr('mul', 'i32', l=shared, r=shared))] }
+  copy   = decode_function(encode_function(ssa))
+
+  assert copy['l0'][0].value is copy['l0'][1].value.l is copy['l0'][1].value.r
+  assert encode_function(copy) == encode_function(ssa)
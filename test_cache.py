@@ -0,0 +1,67 @@
+from data        import Instr
+from cache       import OptimizationCache, optimize_cached, function_keys, passes_hash
+from generate    import generate_module
+from optimizer   import O1_PASSES
+from passmanager import PassManager, FUNCTION_PASS
+
+def test_cached_functions_are_the_optimized_ones(tmp_path, same_results):
+  module = generate_module(4, functions=5, call_ratio=0.3, size=40)
+  cache  = OptimizationCache(str(tmp_path))
+
+  _, first = optimize_cached(module, cache)
+  assert cache.stats.misses == 5 and cache.stats.stores == 5
+
+  passes, second = optimize_cached(module, cache)
+  assert passes == 0 and cache.stats.hits == 5
+  assert repr(second) == repr(first)
+
+  same_results(module, second)
+
+def test_keys_change_with_the_callees():
+  ret    = lambda value: { 'l0': [Instr('ret', 'i32', value=value)] }
+  call   = Instr('call', 'i32', fn='f0', args=[Instr('ldloc', 'i32', loc=0)])
+  module = { 'f0': ret(Instr('const', 'i32', value=1)), 'f1': ret(call), 'f2': ret(Instr('ldloc', 'i32', loc=0)) }
+  before = function_keys(module)
+
+  module['f0'] = ret(Instr('const', 'i32', value=2))
+  after        = function_keys(module)
+
+  # `f1` may inline `f0`, `f2` doesn't depend on it
+  assert before['f0'] != after['f0']
+  assert before['f1'] != after['f1']
+  assert before['f2'] == after['f2']
+
+def test_lambda_passes_are_told_apart():
+  a, b = PassManager(), PassManager()
+  a.add('pass', lambda ssa_functions, fn_name: [], FUNCTION_PASS)
+  b.add('pass', lambda ssa_functions, fn_name: None, FUNCTION_PASS)
+
+  assert passes_hash(a) != passes_hash(b)
+  assert passes_hash(O1_PASSES) == passes_hash(O1_PASSES)
+
+def test_eviction_keeps_the_cache_under_its_size(tmp_path):
+  module = generate_module(6, functions=12, size=60)
+  full   = OptimizationCache(str(tmp_path / 'full'))
+
+  optimize_cached(module, full)
+
+  limit = full.size() // 3
+  cache = OptimizationCache(str(tmp_path / 'bounded'), max_bytes=limit)
+
+  optimize_cached(module, cache)
+
+  assert cache.stats.evictions > 0
+  assert cache.size() <= limit
+  assert cache.total == cache.size()
+
+def test_stores_dont_list_the_cache(tmp_path, monkeypatch):
+  module = generate_module(6, functions=12, size=40)
+  cache  = OptimizationCache(str(tmp_path))
+  lists  = []
+
+  monkeypatch.setattr(cache, 'entries', lambda entries=cache.entries: lists.append(1) or entries())
+  optimize_cached(module, cache)
+
+  assert cache.stats.stores == 12
+  assert len(lists) == 1
+  assert cache.total == cache.size()
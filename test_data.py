@@ -0,0 +1,40 @@
+import copy
+import pickle
+import pytest
+
+from data import Instr, OPCODES, opcode, opcodes
+
+def test_instructions_have_the_slots_of_their_code():
+  instr = Instr('add', 'i32', l=Instr('ldloc', 'i32', loc=0), r=Instr('const', 'i32', value=1))
+
+  assert instr.code == 'add' and OPCODES[instr.op] == 'add'
+  assert [name for name, _ in instr.fields()] == ['l', 'r']
+  assert not hasattr(instr, '__dict__')
+
+  with pytest.raises(AttributeError):
+    instr.value = 1
+
+def test_sir_instructions_leave_the_ssa_operands_empty():
+  assert Instr('add', 'i32').operands() == (None, None)
+  assert Instr('ldc', 'i32', value=3).to_human_readable_sir() == 'ldc i32 value=3'
+
+def test_unknown_codes_are_rejected():
+  with pytest.raises(ValueError):
+    Instr('jump', 'void')
+
+def test_replace_shares_the_other_operands():
+  l     = Instr('ldloc', 'i32', loc=0)
+  instr = Instr('add', 'i32', l=l, r=Instr('const', 'i32', value=1))
+  new   = instr.replace(r=Instr('const', 'i32', value=2))
+
+  assert new.l is l and new.r.value == 2 and instr.r.value == 1
+
+def test_instructions_can_be_copied_and_pickled():
+  instr = Instr('call', 'i64', fn='g', args=[Instr('const', 'i64', value=2**40)])
+
+  for copied in [copy.deepcopy(instr), pickle.loads(pickle.dumps(instr))]:
+    assert repr(copied) == repr(instr)
+    assert copied.op == instr.op
+
+def test_opcodes_are_sets_of_integers():
+  assert opcodes(['add', 'sub']) == frozenset([opcode('add'), opcode('sub')])
@@ -0,0 +1,84 @@
+from data        import Instr
+from deadcode    import fold_constant_branches, thread_empty_blocks, remove_unreachable_blocks, merge_straight_blocks, remove_dead_stores
+from generate    import generate_module
+from interpreter import Interpreter
+from optimizer   import remove_dead_code
+
+def const(value, typ='i32'):
+  return Instr('const', typ, value=value)
+
+def choice(condition):
+  return {
+    'l0': [Instr('branch', 'void', value=condition, T='l1', F='l2')],
+    'l1': [Instr('ret', 'i32', value=const(1))],
+    'l2': [Instr('ret', 'i32', value=const(2))],
+  }
+
+def test_fold_constant_branches_keeps_the_sideeffects_of_the_condition():
+  effect = Instr('call', 'i32', fn='g', args=[])
+  ssa    = {
+    'l0': [Instr('branch', 'void', value=Instr('less', 'i32', l=effect, r=const(1)), T='l1', F='l1')],
+    'l1': [Instr('ret', 'void')],
+  }
+
+  fold_constant_branches(ssa)
+
+  assert [instr.code for instr in ssa['l0']] == ['call', 'goto']
+  assert ssa['l0'][0] is effect
+
+def test_constant_branches_are_decided_on_the_value_of_their_type():
+  # `256` is `0` for `u8`, so the branch isn't taken
+  for value, expected in [(256, 2), (257, 1), (0, 2), (-1, 1)]:
+    ssa = choice(const(value, 'u8'))
+    fold_constant_branches(ssa)
+
+    assert ssa['l0'][-1].code == 'goto'
+    assert Interpreter({ 'f': choice(const(value, 'u8')) }).call('f', []) == expected
+    assert Interpreter({ 'f': ssa }).call('f', []) == expected
+
+def test_unreachable_blocks_are_removed():
+  ssa = choice(const(1))
+  fold_constant_branches(ssa)
+
+  assert remove_unreachable_blocks(ssa) == ['l2']
+  assert list(ssa.keys()) == ['l0', 'l1']
+
+def test_empty_blocks_are_threaded_and_straight_blocks_merged():
+  ssa = {
+    'l0': [Instr('stloc', 'void', loc=0, value=const(4)), Instr('goto', 'void', target='l1')],
+    'l1': [Instr('goto', 'void', target='l2')],
+    'l2': [Instr('ret', 'i32', value=Instr('ldloc', 'i32', loc=0))],
+  }
+
+  thread_empty_blocks(ssa)
+  assert ssa['l0'][-1].target == 'l2'
+
+  remove_unreachable_blocks(ssa)
+  merge_straight_blocks(ssa)
+
+  assert list(ssa.keys()) == ['l0']
+  assert Interpreter({ 'f': ssa }).call('f', []) == 4
+
+def test_dead_stores_keep_their_sideeffects():
+  effect = Instr('call', 'i32', fn='g', args=[])
+  ssa    = {
+    'l0': [
+      Instr('stloc', 'void', loc=1, value=effect),
+      Instr('stloc', 'void', loc=2, value=const(3)),
+      Instr('ret', 'i32', value=Instr('ldloc', 'i32', loc=2)),
+    ],
+  }
+
+  remove_dead_stores(ssa)
+
+  assert ssa['l0'][0] is effect
+  assert [instr.code for instr in ssa['l0']] == ['call', 'stloc', 'ret']
+
+def test_remove_dead_code_keeps_the_results(same_results):
+  module = generate_module(7, functions=6, size=60)
+  after  = { fn_name: dict(ssa) for fn_name, ssa in module.items() }
+
+  for ssa in after.values():
+    remove_dead_code(ssa)
+
+  same_results(module, after)
@@ -0,0 +1,38 @@
+from bench       import bench_size, compare
+from callgraph   import CallGraph
+from generate    import GeneratorOptions, generate_module, generate_sir
+from interpreter import Interpreter
+from serialize   import encode_function
+
+def test_the_same_seed_gives_the_same_program():
+  assert repr(generate_sir(3, size=80)) == repr(generate_sir(3, size=80))
+  assert repr(generate_sir(3, size=80)) != repr(generate_sir(4, size=80))
+
+  a, b = generate_module(5, functions=4, call_ratio=0.5), generate_module(5, functions=4, call_ratio=0.5)
+  assert { n: encode_function(f) for n, f in a.items() } == { n: encode_function(f) for n, f in b.items() }
+
+def test_programs_terminate_without_bailouts():
+  module = generate_module(6, functions=10, call_ratio=0.3, options=GeneratorOptions(size=60, typ='i64'))
+
+  for fn_name in module.keys():
+    for args in [[0, 0], [1, -1], [2**40, 7]]:
+      Interpreter(module, fuel=10**7).call(fn_name, args)
+
+def test_calls_go_to_the_functions_before():
+  graph = CallGraph(generate_module(7, functions=8, call_ratio=0.5, size=60))
+
+  assert graph.recursive() == set()
+  assert any(graph.callees.values())
+  assert all(int(callee[1:]) < int(fn_name[1:]) for fn_name, callees in graph.callees.items() for callee in callees)
+
+def test_benchmarks_measure_and_compare():
+  options = GeneratorOptions(size=50)
+  result  = bench_size(200, 0, options, 0.2, 1)
+
+  assert result['functions'] == 4 and result['sir_instrs'] > 0
+  assert result['optimized_ssa_nodes'] <= result['ssa_nodes'] + result['functions'] * 50
+
+  old = { 'results': [{ 'size': 200, 'sir2ssa_instrs_per_s': 100.0, 'optimize_instrs_per_s': 100.0 }] }
+  new = { 'results': [{ 'size': 200, 'sir2ssa_instrs_per_s': 90.0, 'optimize_instrs_per_s': 50.0 }] }
+
+  assert [r['measure'] for r in compare(old, new)] == ['optimize_instrs_per_s']
@@ -0,0 +1,55 @@
+from data     import Instr
+from generate import generate_module
+from hashcons import HashConsTable, global_value_numbering
+
+def const(value, typ='i32'):
+  return Instr('const', typ, value=value)
+
+def local(loc):
+  return Instr('ldloc', 'i32', loc=loc)
+
+def add(l, r, typ='i32'):
+  return Instr('add', typ, l=l, r=r)
+
+def test_equal_trees_are_interned_to_the_same_node():
+  table = HashConsTable()
+  a     = table.intern(add(local(0), const(1)))
+  b     = table.intern(add(local(0), const(1)))
+
+  assert a is b
+  assert table.intern(add(local(0), const(1), 'i64')) is not a
+  # `1 == 1.0 == True`, but they are different constants
+  assert table.intern(const(1)) is not table.intern(const(True)) is not table.intern(const(1.0))
+
+def test_instructions_with_sideeffects_are_not_interned():
+  table = HashConsTable()
+  call  = lambda: Instr('call', 'i32', fn='g', args=[const(1)])
+
+  a, b  = table.intern(call()), table.intern(call())
+
+  assert a is not b
+  assert a.args[0] is b.args[0]
+
+def test_stores_separate_the_versions_of_a_local():
+  ssa = {
+    'l0': [
+      Instr('stloc', 'void', loc=1, value=add(local(0), const(1))),
+      Instr('stloc', 'void', loc=0, value=add(local(0), const(1))),
+      Instr('ret', 'i32', value=add(local(0), const(1))),
+    ],
+  }
+
+  assert global_value_numbering(ssa) == ['l0']
+
+  first, second, ret = ssa['l0']
+  assert first.value is second.value
+  assert ret.value is not first.value
+
+def test_gvn_keeps_the_results(same_results):
+  module = generate_module(8, functions=6, size=60)
+  after  = { fn_name: dict(ssa) for fn_name, ssa in module.items() }
+
+  for ssa in after.values():
+    global_value_numbering(ssa)
+
+  same_results(module, after)
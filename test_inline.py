@@ -0,0 +1,62 @@
+from data        import Instr
+from generate    import generate_module
+from inline      import inline_calls, should_inline, function_size
+from interpreter import Interpreter
+from walk        import postorder
+
+def param(loc=0):
+  return Instr('ldloc', 'i32', loc=loc)
+
+def call(fn, *args):
+  return Instr('call', 'i32', fn=fn, args=list(args))
+
+def calls(ssa):
+  return [node.fn for block in ssa.values() for instr in block for node in postorder(instr) if node.code == 'call']
+
+def small_callee():
+  # `g(x) = x < 0 ? -x : x`, a callee with more blocks
+  return {
+    'l0': [Instr('branch', 'void', value=Instr('less', 'i32', l=param(), r=Instr('const', 'i32', value=0)), T='l1', F='l2')],
+    'l1': [Instr('ret', 'i32', value=Instr('neg', 'i32', value=param()))],
+    'l2': [Instr('ret', 'i32', value=param())],
+  }
+
+def test_small_callees_are_inlined():
+  # the call is in the middle of a tree, the rest of the instruction reads the returned value
+  module = {
+    'g': small_callee(),
+    'f': { 'l0': [Instr('ret', 'i32', value=Instr('add', 'i32', l=call('g', param()), r=param(1)))] },
+  }
+  before = { fn_name: dict(ssa) for fn_name, ssa in module.items() }
+
+  assert inline_calls(module) == ['f']
+  assert calls(module['f']) == []
+
+  for args in [[-5, 1], [5, 2], [0, 0]]:
+    assert Interpreter(module).call('f', list(args)) == Interpreter(before).call('f', list(args))
+
+def test_recursive_callees_are_not_inlined():
+  module = { 'f': { 'l0': [Instr('ret', 'i32', value=call('f', param()))] } }
+
+  assert inline_calls(module) == []
+  assert calls(module['f']) == ['f']
+
+def test_constant_args_make_callees_cheaper():
+  args = lambda *args: Instr('call', 'i32', fn='g', args=list(args))
+
+  assert not should_inline(args(param(), param()), 55, sites=2)
+  assert should_inline(args(Instr('const', 'i32', value=1), Instr('const', 'i32', value=2)), 55, sites=2)
+  # a single call site replaces the only use of the callee
+  assert should_inline(args(param()), 55, sites=1)
+
+def test_callers_are_not_grown_past_the_budget():
+  module = { 'g': small_callee(), 'f': { 'l0': [Instr('ret', 'i32', value=call('g', param()))] } }
+
+  assert inline_calls(module, budget=function_size(module['f'])) == []
+
+def test_inlining_keeps_the_results(same_results):
+  module = generate_module(9, functions=8, call_ratio=0.4, size=40)
+  after  = { fn_name: dict(ssa) for fn_name, ssa in module.items() }
+
+  assert len(inline_calls(after)) > 0
+  same_results(module, after)
@@ -0,0 +1,52 @@
+import pytest
+
+from data        import Instr
+from interpreter import Interpreter, Bailout, evaluate_constant_calls
+
+def const(value, typ='i32'):
+  return Instr('const', typ, value=value)
+
+def param(loc, typ='i32'):
+  return Instr('ldloc', typ, loc=loc)
+
+def function(value, typ='i32'):
+  return { 'l0': [Instr('ret', typ, value=value)] }
+
+def call(fn, *args, typ='i32'):
+  return Instr('call', typ, fn=fn, args=list(args))
+
+def evaluated(callee, *args, typ='i32'):
+  '''
+  This function returns the value `main` returns after its call to `callee` with `args` was evaluated, or the call when it wasn't
+  '''
+
+  module = { 'callee': callee, 'main': function(call('callee', *args, typ=typ), typ) }
+  evaluate_constant_calls(module, fuel=1000)
+
+  return module['main']['l0'][-1].value
+
+def test_results_wrap_to_the_type():
+  assert evaluated(function(Instr('add', 'i32', l=param(0), r=const(1))), const(2**31 - 1)).value == -2**31
+  assert evaluated(function(Instr('div', 'i64', l=param(0, 'i64'), r=const(3, 'i64')), 'i64'), const(2**62 + 1, 'i64'), typ='i64').value == (2**62 + 1) // 3
+
+def test_operands_are_values_of_their_type():
+  assert evaluated(function(Instr('less', 'u32', l=param(0, 'u32'), r=const(5, 'u32')), 'u32'), const(-1, 'u32'), typ='u32').value == 0
+
+@pytest.mark.parametrize('body', [
+  Instr('div', 'i32', l=param(0), r=const(0)),
+  Instr('shl', 'i32', l=param(0), r=const(-1)),
+  Instr('shl', 'i32', l=param(0), r=const(40)),
+  Instr('shr', 'i32', l=param(0), r=const(10**20)),
+  call('external', param(0)),
+])
+def test_calls_that_cant_run_at_compile_time_are_kept(body):
+  assert evaluated(function(body), const(1)).code == 'call'
+
+def test_out_of_fuel_is_a_bailout():
+  loop = {
+    'l0': [Instr('goto', 'void', target='l1')],
+    'l1': [Instr('goto', 'void', target='l1')],
+  }
+
+  with pytest.raises(Bailout):
+    Interpreter({ 'f': loop }, fuel=100).call('f', [])
@@ -0,0 +1,113 @@
+import random
+
+from data        import Instr
+from generate    import generate_module
+from interpreter import Interpreter, Bailout
+from linear      import VReg, lower, linear_scan, live_intervals, sethi_ullman
+from mem2reg     import promote_locals
+from semantics   import operation, wrap
+
+def execute(fn, location, args, fuel=10**6):
+  '''
+  This function returns the value returned by the lowered function `fn`, keeping the virtual registers in their `location`
+  (registers sharing a location while both live would read each other's values)
+  '''
+
+  storage = {}
+  locals  = dict(enumerate(args))
+  block   = next(iter(fn.blocks.keys()))
+
+  while fuel > 0:
+    for instr in fn.blocks[block]:
+      fuel  -= 1
+      values = [storage[location[a]] if isinstance(a, VReg) else a for a in instr.args]
+
+      match instr.code:
+        case 'goto':
+          block = instr.attrs['target']
+          break
+
+        case 'branch':
+          block = instr.attrs['T' if values[0] else 'F']
+          break
+
+        case 'ret':
+          return wrap(values[0], instr.typ) if len(values) > 0 else None
+
+        case 'stloc':
+          locals[instr.attrs['loc']] = values[0]
+
+        case 'ldloc':
+          value = wrap(locals[instr.attrs['loc']], instr.typ)
+
+        case 'mov':
+          value = wrap(values[0], instr.typ)
+
+        case code:
+          value = operation(code, instr.typ)(*values)
+
+      if instr.dst is not None:
+        storage[location[instr.dst]] = value
+
+  raise Bailout('out of fuel')
+
+def test_sethi_ullman_numbers():
+  x    = lambda: Instr('ldloc', 'i32', loc=0)
+  add  = lambda l, r: Instr('add', 'i32', l=l, r=r)
+  tree = add(add(x(), x()), add(x(), Instr('const', 'i32', value=1)))
+  need = sethi_ullman(tree)
+
+  assert need[id(tree.r.r)] == 0
+  assert need[id(tree.r)] == 1
+  assert need[id(tree.l)] == 2
+  assert need[id(tree)] == 2
+
+def test_lowered_functions_keep_the_results():
+  rng    = random.Random(0)
+  module = generate_module(11, functions=6, size=60)
+
+  for fn_name, ssa in module.items():
+    fn = lower(ssa)
+
+    for registers in [2, 4, 8]:
+      location = linear_scan(fn, registers)
+
+      assert set(location.keys()) == set(live_intervals(fn).keys())
+      assert all(l.startswith('s') or int(l[1:]) < registers for l in location.values())
+
+      for _ in range(8):
+        args = [rng.randint(-20, 20), rng.randint(-2**40, 2**40)]
+
+        try:
+          expected = Interpreter(module, fuel=10**6).call(fn_name, list(args))
+        except Bailout:
+          continue
+
+        assert execute(fn, location, args) == expected, (fn_name, registers, args)
+
+def test_phis_are_copied_on_the_edges():
+  module = generate_module(12, functions=6, size=60)
+  after  = { fn_name: dict(ssa) for fn_name, ssa in module.items() }
+
+  for fn_name, ssa in after.items():
+    promote_locals(ssa)
+    fn       = lower(ssa)
+    location = linear_scan(fn, 3)
+
+    for args in [[0, 1], [5, -3], [17, 2**33]]:
+      try:
+        expected = Interpreter(module, fuel=10**6).call(fn_name, list(args))
+      except Bailout:
+        continue
+
+      assert execute(fn, location, args) == expected, (fn_name, args)
+
+def test_intervals_live_at_the_same_time_get_different_registers():
+  fn        = lower(generate_module(13, functions=1, size=80)['f0'])
+  intervals = live_intervals(fn)
+  location  = linear_scan(fn, 4)
+
+  for a, (a_start, a_end) in intervals.items():
+    for b, (b_start, b_end) in intervals.items():
+      if a != b and a_start <= b_end and b_start <= a_end:
+        assert location[a] != location[b]
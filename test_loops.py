@@ -0,0 +1,77 @@
+from data        import Instr
+from cfg         import CFG, max_label, max_local
+from interpreter import Interpreter
+from loops       import natural_loops, unroll_loops
+from semantics   import fold
+
+def const(value, typ='i32'):
+  return Instr('const', typ, value=value)
+
+def counter(typ='i32'):
+  return Instr('ldloc', typ, loc=0)
+
+def counted_loop(bound, typ='i32', init=0):
+  '''
+  This function returns a loop counting from `init` to `bound` in blocks not named `l<n>`, the sum of the counter is in local 1
+  '''
+
+  return {
+    'entry': [
+      Instr('stloc', 'void', loc=0, value=const(init, typ)),
+      Instr('stloc', 'void', loc=1, value=const(0, typ)),
+      Instr('goto', 'void', target='head'),
+    ],
+    'head':  [Instr('branch', 'void', value=Instr('less', typ, l=counter(typ), r=bound), T='body', F='exit')],
+    'body':  [
+      Instr('stloc', 'void', loc=1, value=Instr('add', typ, l=Instr('ldloc', typ, loc=1), r=counter(typ))),
+      Instr('stloc', 'void', loc=0, value=Instr('add', typ, l=counter(typ), r=const(1, typ))),
+      Instr('goto', 'void', target='head'),
+    ],
+    'exit':  [Instr('ret', typ, value=Instr('ldloc', typ, loc=1))],
+  }
+
+def loops_of(ssa):
+  cfg = CFG(ssa)
+  return natural_loops(cfg, cfg.dominators())
+
+def test_natural_loops():
+  [loop] = loops_of(counted_loop(const(3)))
+
+  assert loop.header == 'head'
+  assert loop.blocks == { 'head', 'body' }
+  assert loop.latches == ['body']
+
+def test_loops_with_a_known_trip_count_are_fully_unrolled():
+  ssa = counted_loop(const(3))
+
+  assert len(unroll_loops(ssa, fold)) > 0
+  assert loops_of(ssa) == []
+  assert Interpreter({ 'f': ssa }).call('f', []) == 0 + 1 + 2
+
+def test_trip_counts_wrap_around_to_the_type():
+  # `200` is `-56` for `i8`, so the body never runs
+  ssa = counted_loop(const(200, 'i8'), 'i8')
+
+  unroll_loops(ssa, fold)
+  assert Interpreter({ 'f': ssa }).call('f', []) == 0
+
+def test_loops_with_an_unknown_trip_count_are_partially_unrolled():
+  bound = Instr('ldloc', 'i32', loc=2)
+  ssa   = counted_loop(bound)
+
+  unroll_loops(ssa, fold, factor=4)
+
+  assert len(ssa) > 4
+  assert len(loops_of(ssa)) == 1
+
+  for n in range(-1, 10):
+    assert Interpreter({ 'f': ssa }).call('f', [None, None, n]) == sum(range(n))
+
+def test_new_labels_and_locals():
+  ssa = counted_loop(const(3))
+
+  assert max_label(ssa) == -1
+  assert max_local(ssa) == 1
+
+  unroll_loops(ssa, fold)
+  assert max_label(ssa) >= 0
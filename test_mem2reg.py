@@ -0,0 +1,49 @@
+from data        import Instr
+from generate    import generate_module
+from interpreter import Interpreter
+from mem2reg     import promote_locals
+
+def const(value):
+  return Instr('const', 'i32', value=value)
+
+def counter():
+  return Instr('ldloc', 'i32', loc=0)
+
+def test_promote_locals_with_named_blocks():
+  # the entry block is the loop header, so a new entry block is made
+  ssa = {
+    'loop': [
+      Instr('stloc', 'void', loc=0, value=Instr('add', 'i32', l=counter(), r=const(1))),
+      Instr('branch', 'void', value=Instr('less', 'i32', l=counter(), r=const(3)), T='loop', F='exit'),
+    ],
+    'exit': [Instr('ret', 'i32', value=counter())],
+  }
+
+  promote_locals(ssa)
+
+  assert next(iter(ssa.keys())) == 'l0'
+  assert Interpreter({ 'f': ssa }).call('f', [0]) == 3
+
+def test_promoted_locals_are_phis():
+  ssa = {
+    'l0': [Instr('branch', 'void', value=Instr('ldloc', 'i32', loc=0), T='l1', F='l2')],
+    'l1': [Instr('stloc', 'void', loc=1, value=const(1)), Instr('goto', 'void', target='l3')],
+    'l2': [Instr('stloc', 'void', loc=1, value=const(2)), Instr('goto', 'void', target='l3')],
+    'l3': [Instr('ret', 'i32', value=Instr('ldloc', 'i32', loc=1))],
+  }
+
+  promote_locals(ssa)
+
+  assert [instr.code for instr in ssa['l1']] == ['goto']
+  assert [instr.code for instr in ssa['l3']] == ['phi', 'ret']
+  assert ssa['l3'][-1].value.code == 'ldphi'
+  assert [Interpreter({ 'f': ssa }).call('f', [x]) for x in [0, 5]] == [2, 1]
+
+def test_promote_locals_keeps_the_results(same_results):
+  module = generate_module(4, functions=6, size=60)
+  after  = { fn_name: dict(ssa) for fn_name, ssa in module.items() }
+
+  for ssa in after.values():
+    promote_locals(ssa)
+
+  same_results(module, after)
@@ -0,0 +1,61 @@
+from data      import Instr
+from generate  import generate_module
+from inline    import inline_calls
+from optimizer import optimize1
+from parallel  import optimize_parallel, call_levels, split
+from callgraph import CallGraph
+
+def big_callee(terms=30):
+  '''
+  This function returns a function bigger than `inline.INLINE_THRESHOLD`, so it's only inlined when it has a single call site
+  '''
+
+  value = Instr('ldloc', 'i32', loc=0)
+
+  for n in range(terms):
+    value = Instr('add', 'i32', l=Instr('mul', 'i32', l=value, r=Instr('ldloc', 'i32', loc=0)), r=Instr('const', 'i32', value=n))
+
+  return { 'l0': [Instr('ret', 'i32', value=value)] }
+
+def caller():
+  return { 'l0': [Instr('ret', 'i32', value=Instr('call', 'i32', fn='g', args=[Instr('ldloc', 'i32', loc=0)]))] }
+
+def test_parallel_optimization_keeps_the_results(same_results):
+  module = generate_module(3, functions=8, call_ratio=0.3, size=60)
+
+  _, optimized = optimize_parallel(module, workers=2)
+
+  assert optimized.keys() == module.keys()
+  same_results(module, optimized)
+
+def test_parallel_optimization_of_sir(same_results):
+  sir       = generate_module(5, functions=6, sir=True, size=40)
+  module    = generate_module(5, functions=6, size=40)
+  _, result = optimize_parallel(sir_functions=sir, workers=2)
+
+  same_results(module, result)
+
+def test_external_sites_are_an_option_of_the_inliner():
+  module = lambda: { 'g': big_callee(), 'f': caller() }
+  assert inline_calls(module(), ['f']) == ['f']
+
+  # another call to `g` outside the functions given makes it a callee with more sites
+  assert inline_calls(module(), ['f'], external_sites={ 'g': 1 }) == []
+  # and the option isn't kept by the inliner
+  assert inline_calls(module(), ['f']) == ['f']
+
+def test_call_levels_come_after_their_callees():
+  module = generate_module(1, functions=10, call_ratio=0.4, size=30)
+  graph  = CallGraph(module)
+  level  = { fn_name: n for n, components in enumerate(call_levels(graph)) for component in components for fn_name in component }
+
+  for fn_name, callees in graph.callees.items():
+    assert all(level[callee] < level[fn_name] for callee in callees if callee != fn_name)
+
+def test_split():
+  assert split(list(range(7)), 3) == [[0, 1, 2], [3, 4, 5], [6]]
+  assert split([1], 4) == [[1]]
+
+def test_one_worker_is_optimize1():
+  module = generate_module(2, functions=4, call_ratio=0.3, size=40)
+  assert repr(optimize_parallel(module, workers=1)[1]) == repr(optimize1(module)[1])
@@ -0,0 +1,111 @@
+from data        import Instr
+from generate    import generate_module
+from optimizer   import optimize0, optimize1
+from passmanager import PassManager, Worklist, BLOCK_PASS, FUNCTION_PASS, MODULE_PASS
+
+def ret(value):
+  return [Instr('ret', 'i32', value=Instr('const', 'i32', value=value))]
+
+def returned(ssa, block_name):
+  return ssa[block_name][-1].value.value
+
+def test_worklist_never_queues_twice():
+  worklist = Worklist(['a', 'b', 'a'])
+  worklist.push('b')
+
+  assert len(worklist) == 2
+  assert worklist.pop() == 'a'
+
+  worklist.push('a')
+  assert [worklist.pop(), worklist.pop()] == ['b', 'a']
+
+def test_passes_are_sorted_and_replaced_by_name():
+  manager = PassManager()
+  manager.add('b', lambda ssa, block_name: False, order=1)
+  manager.add('a', lambda ssa, block_name: False, order=1)
+  manager.add('c', lambda ssa, block_name: False, order=-1)
+
+  @manager.register('b', FUNCTION_PASS, order=0)
+  def b(ssa_functions, fn_name):
+    return []
+
+  assert [(p.name, p.kind) for p in manager.passes] == [('c', BLOCK_PASS), ('b', FUNCTION_PASS), ('a', BLOCK_PASS)]
+
+def test_block_passes_run_until_the_block_is_stable():
+  manager = PassManager()
+
+  # counting down the returned constant, one step per run
+  @manager.register('down')
+  def down(ssa, block_name):
+    if returned(ssa, block_name) <= 0:
+      return False
+
+    ssa[block_name] = ret(returned(ssa, block_name) - 1)
+    return True
+
+  module = { 'f': { 'l0': ret(3), 'l1': ret(1) } }
+
+  assert manager.run(module) == 4
+  assert returned(module['f'], 'l0') == returned(module['f'], 'l1') == 0
+
+def test_dirty_blocks_are_visited_again():
+  manager = PassManager()
+  visited = []
+
+  @manager.register('visit')
+  def visit(ssa, block_name):
+    visited.append(block_name)
+    return False
+
+  # the function pass changes `l1` once
+  @manager.register('change', FUNCTION_PASS)
+  def change(ssa_functions, fn_name):
+    ssa = ssa_functions[fn_name]
+
+    if returned(ssa, 'l1') == 1:
+      ssa['l1'] = ret(2)
+      return ['l1']
+
+    return []
+
+  manager.run({ 'f': { 'l0': ret(0), 'l1': ret(1) } })
+  assert visited == ['l0', 'l1', 'l1']
+
+def test_functions_changed_by_module_passes_are_optimized_again():
+  manager = PassManager()
+  runs    = []
+
+  @manager.register('count', FUNCTION_PASS)
+  def count(ssa_functions, fn_name):
+    runs.append(fn_name)
+    return []
+
+  @manager.register('module', MODULE_PASS)
+  def module_pass(ssa_functions, fn_names):
+    return ['g'] if runs.count('g') == 1 else []
+
+  manager.run({ 'f': {}, 'g': {}, 'h': {} }, fn_names=['f', 'g'])
+  assert runs == ['f', 'g', 'g']
+
+def test_options_are_given_to_the_passes_by_name():
+  manager = PassManager()
+  seen    = {}
+
+  manager.add('block', lambda ssa, block_name, value=0: seen.setdefault('block', value) and False)
+  manager.add('function', lambda ssa_functions, fn_name, value=0: seen.setdefault('function', value) and [], FUNCTION_PASS)
+  manager.add('module', lambda ssa_functions, fn_names, value=0: seen.setdefault('module', value) and [], MODULE_PASS)
+
+  manager.run({ 'f': { 'l0': ret(0) } }, options={ 'block': { 'value': 1 }, 'function': { 'value': 2 }, 'module': { 'value': 3 }, 'missing': { 'value': 4 } })
+  assert seen == { 'block': 1, 'function': 2, 'module': 3 }
+
+def test_optimize1_keeps_the_results(same_results):
+  module   = generate_module(16, functions=6, call_ratio=0.3, size=60)
+  _, after = optimize1(module)
+
+  same_results(module, after)
+
+def test_optimize0_keeps_the_results(same_results):
+  sir      = generate_module(17, functions=6, sir=True, size=60)
+  _, after = optimize0(sir)
+
+  same_results(generate_module(17, functions=6, size=60), after)
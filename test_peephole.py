@@ -0,0 +1,43 @@
+from data        import Instr, Label
+from generate    import generate_module
+from interpreter import Interpreter
+from peephole    import peephole
+from stackir2ssa import sir2ssa
+
+def test_peephole_folds_wrap():
+  sir = [
+    Instr('ldc', 'i32', value=2**31 - 1),
+    Instr('ldc', 'i32', value=1),
+    Instr('add', 'i32'),
+    Instr('ldc', 'i32', value=2),
+    Instr('div', 'i32'),
+    Instr('ret', 'i32'),
+  ]
+
+  assert [(instr.code, instr.value) for instr in peephole(sir)] == [('ldc', -2**30), ('ret', None)]
+  assert list(peephole([Instr('ldc', 'i32', value=-2**31), Instr('neg', 'i32'), Instr('ret', 'i32')]))[0].value == -2**31
+  # shifts by a negative count are left to the runtime
+  assert len(list(peephole([Instr('ldc', 'i32', value=1), Instr('ldc', 'i32', value=-1), Instr('shl', 'i32'), Instr('ret', 'i32')]))) == 4
+
+def test_jmpf_on_constants_of_their_type():
+  # `256` is `0` for `u8`, so the jump is always taken
+  for value, expected in [(256, 2), (257, 1), (0, 2), (-1, 1)]:
+    sir = [
+      Instr('ldc', 'u8', value=value),
+      Instr('jmpf', 'void', target='L1'),
+      Instr('ldc', 'i32', value=1),
+      Instr('ret', 'i32'),
+      Label('L1'),
+      Instr('ldc', 'i32', value=2),
+      Instr('ret', 'i32'),
+    ]
+    out = list(peephole(sir))
+
+    assert not any(isinstance(instr, Instr) and instr.code == 'jmpf' for instr in out)
+    assert Interpreter({ 'f': sir2ssa(sir) }).call('f', []) == expected
+    assert Interpreter({ 'f': sir2ssa(out) }).call('f', []) == expected
+
+def test_peephole_keeps_the_results(same_results):
+  module = generate_module(6, functions=8, sir=True, size=60)
+
+  same_results({ fn_name: sir2ssa(sir) for fn_name, sir in module.items() }, { fn_name: sir2ssa(list(peephole(sir))) for fn_name, sir in module.items() })
@@ -0,0 +1,32 @@
+from generate   import generate_module
+from optimizer  import optimize1
+from persistent import copy_on_write, snapshot, snapshot_diff, same_snapshot, shared_instructions
+from serialize  import encode_function
+
+def test_optimizing_a_copy_leaves_the_original_untouched():
+  module  = generate_module(20, functions=6, call_ratio=0.3, size=60)
+  encoded = { fn_name: encode_function(ssa) for fn_name, ssa in module.items() }
+  before  = snapshot(module)
+
+  _, after = optimize1(module)
+
+  assert same_snapshot(before, module)
+  assert { fn_name: encode_function(ssa) for fn_name, ssa in module.items() } == encoded
+  # the blocks no pass rewrote are still shared
+  assert shared_instructions(module, after) > 0
+
+def test_snapshot_diffs():
+  module = generate_module(21, functions=2, size=40)
+  old    = snapshot(module)
+  new    = copy_on_write(module)
+
+  assert snapshot_diff(old, new) == []
+
+  new['f0']['l0'] = list(new['f0']['l0'])
+  assert snapshot_diff(old, new) == []
+
+  new['f0']['l0']    = new['f0']['l0'][:-1]
+  new['f1']['extra'] = []
+
+  assert sorted(snapshot_diff(old, new)) == [('f0', 'l0'), ('f1', 'extra')]
+  assert not same_snapshot(old, new)
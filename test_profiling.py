@@ -0,0 +1,46 @@
+import json
+
+from data        import Instr
+from generate    import generate_module
+from optimizer   import optimize1, O1_PASSES
+from passmanager import PassManager, FUNCTION_PASS
+from profiling   import Profiler, block_nodes
+
+def test_profiled_runs_give_the_same_results():
+  module   = generate_module(18, functions=6, call_ratio=0.3, size=60)
+  plain    = optimize1(module)
+  profiled = optimize1(module, profiler=Profiler())
+
+  assert plain[0] == profiled[0]
+  assert repr(plain[1]) == repr(profiled[1])
+
+def test_passes_and_rules_are_measured():
+  module     = generate_module(19, functions=4, size=60)
+  profiler   = Profiler()
+  changes, _ = optimize1(module, profiler=profiler)
+  data       = json.loads(profiler.to_json())
+
+  assert set(data['passes'].keys()) <= { p.name for p in O1_PASSES.passes }
+  assert sum(stats['changes'] for stats in data['passes'].values()) == changes
+  assert all(stats['calls'] >= stats['changes'] for stats in data['passes'].values())
+  assert sum(stats['calls'] for stats in data['iterations']) == sum(stats['calls'] for stats in data['passes'].values())
+  assert sum(sum(counts.values()) for counts in data['rules'].values()) > 0
+  assert { (b['fn'], b['block']) for b in data['blocks'] } >= { (fn_name, block_name) for fn_name, ssa in module.items() for block_name in ssa }
+  assert profiler.summary().splitlines()[0].split() == ['pass', 'kind', 'calls', 'changes', 'nodes', 'time']
+
+def test_options_go_through_the_profiler():
+  manager  = PassManager()
+  seen     = []
+  profiler = Profiler()
+
+  manager.add('f', lambda ssa_functions, fn_name, value=0: seen.append(value), FUNCTION_PASS)
+  manager.run({ 'f': {} }, profiler=profiler, options={ 'f': { 'value': 7 } })
+
+  assert seen == [7]
+  assert profiler.passes['f'].calls == 1 and profiler.passes['f'].changes == 0
+
+def test_shared_nodes_are_counted_once():
+  shared = Instr('add', 'i32', l=Instr('ldloc', 'i32', loc=0), r=Instr('const', 'i32', value=1))
+  block  = [Instr('stloc', 'void', loc=1, value=shared), Instr('ret', 'i32', value=shared)]
+
+  assert block_nodes(block) == 5
@@ -0,0 +1,73 @@
+from data        import Instr
+from interpreter import Interpreter
+from recursion   import recursion_to_loop
+from semantics   import wrap
+from walk        import postorder
+
+def const(value):
+  return Instr('const', 'i32', value=value)
+
+def param(loc=0):
+  return Instr('ldloc', 'i32', loc=loc)
+
+def call(*args):
+  return Instr('call', 'i32', fn='f', args=list(args))
+
+def binary(code, l, r):
+  return Instr(code, 'i32', l=l, r=r)
+
+def recursive(base, step):
+  '''
+  This function returns `f(n, ...)`, returning `base` when `n < 1` and `step` otherwise
+  '''
+
+  return {
+    'l0': [Instr('branch', 'void', value=binary('less', param(), const(1)), T='l1', F='l2')],
+    'l1': [Instr('ret', 'i32', value=base)],
+    'l2': [Instr('ret', 'i32', value=step)],
+  }
+
+def self_calls(ssa):
+  return sum(1 for block in ssa.values() for instr in block for node in postorder(instr) if node.code == 'call')
+
+def converted(ssa):
+  before = { 'f': dict(ssa) }
+  after  = { 'f': ssa }
+
+  return before, after, recursion_to_loop(after, 'f')
+
+def test_tail_calls_become_loops():
+  # `f(n, s) = n < 1 ? s : f(n - 1, s + n)`
+  before, after, dirty = converted(recursive(param(1), call(binary('sub', param(), const(1)), binary('add', param(1), param()))))
+
+  assert len(dirty) > 0 and self_calls(after['f']) == 0
+
+  for n in range(-1, 10):
+    assert Interpreter(after).call('f', [n, 0]) == Interpreter(before).call('f', [n, 0])
+
+def test_accumulated_operations_on_either_side():
+  for step in [binary('mul', param(), call(binary('sub', param(), const(1)))), binary('add', call(binary('sub', param(), const(1))), param())]:
+    before, after, dirty = converted(recursive(const(1), step))
+
+    assert self_calls(after['f']) == 0
+    # the accumulator is initialized by a new entry block
+    assert next(iter(after['f'].keys())) != 'l0'
+
+    for n in range(-1, 12):
+      assert Interpreter(after).call('f', [n]) == Interpreter(before).call('f', [n])
+
+def test_loops_run_deeper_than_the_recursion():
+  _, after, _ = converted(recursive(param(1), call(binary('sub', param(), const(1)), binary('add', param(1), param()))))
+
+  assert Interpreter(after, fuel=10**7).call('f', [100_000, 0]) == wrap(sum(range(100_001)), 'i32')
+
+def test_calls_not_returned_are_kept():
+  # `f(n) = n < 1 ? 1 : f(n - 1) + f(n - 2)` needs a frame for each call
+  ssa = recursive(const(1), binary('add', call(binary('sub', param(), const(1))), call(binary('sub', param(), const(2)))))
+
+  assert recursion_to_loop({ 'f': ssa }, 'f') == []
+
+  # and so does an accumulated operand with sideeffects
+  ssa = recursive(const(1), binary('add', Instr('call', 'i32', fn='g', args=[]), call(binary('sub', param(), const(1)))))
+
+  assert recursion_to_loop({ 'f': ssa }, 'f') == []
@@ -0,0 +1,64 @@
+from data        import Instr
+from generate    import generate_module
+from interpreter import Interpreter
+from mem2reg     import promote_locals
+from sccp        import sparse_conditional_constant_propagation
+from semantics   import fold
+
+def const(value, typ='i32'):
+  return Instr('const', typ, value=value)
+
+def choice(condition):
+  return {
+    'l0': [Instr('stloc', 'void', loc=1, value=condition), Instr('goto', 'void', target='l1')],
+    'l1': [Instr('branch', 'void', value=Instr('ldloc', condition.typ, loc=1), T='l2', F='l3')],
+    'l2': [Instr('ret', 'i32', value=const(1))],
+    'l3': [Instr('ret', 'i32', value=const(2))],
+  }
+
+def test_branches_on_constant_locals_become_gotos():
+  ssa = choice(const(5))
+
+  sparse_conditional_constant_propagation(ssa, fold)
+
+  assert [repr(instr) for instr in ssa['l1']] == ["Instr('goto', 'void', target='l2')"]
+
+def test_constants_are_values_of_their_type():
+  # `256` is `0` for `u8`, and a local stored as `257` is read as `1` by a `u8` `ldloc`
+  for condition, expected in [(const(256, 'u8'), 2), (const(257, 'u8'), 1), (const(-256, 'i8'), 2)]:
+    ssa = choice(condition)
+    sparse_conditional_constant_propagation(ssa, fold)
+
+    assert ssa['l1'][-1].code == 'goto'
+    assert Interpreter({ 'f': choice(condition) }).call('f', []) == expected
+    assert Interpreter({ 'f': ssa }).call('f', []) == expected
+
+  ssa = choice(Instr('ldloc', 'u8', loc=1))
+  ssa['l0'][0] = Instr('stloc', 'void', loc=1, value=const(512, 'i32'))
+
+  sparse_conditional_constant_propagation(ssa, fold)
+  assert Interpreter({ 'f': ssa }).call('f', []) == 2
+
+def test_constants_flow_through_the_phis_of_executable_edges():
+  # `l2` is never reached, so the phi of `l3` only gets `7`
+  ssa = {
+    'l0': [Instr('stloc', 'void', loc=0, value=const(7)), Instr('branch', 'void', value=const(1), T='l1', F='l2')],
+    'l1': [Instr('goto', 'void', target='l3')],
+    'l2': [Instr('stloc', 'void', loc=0, value=const(8)), Instr('goto', 'void', target='l3')],
+    'l3': [Instr('ret', 'i32', value=Instr('add', 'i32', l=Instr('ldloc', 'i32', loc=0), r=const(1)))],
+  }
+
+  promote_locals(ssa)
+  sparse_conditional_constant_propagation(ssa, fold)
+
+  assert repr(ssa['l3'][-1].value.l) == "Instr('const', 'i32', value=7)"
+
+def test_sccp_keeps_the_results(same_results):
+  module = generate_module(5, functions=6, size=60)
+  after  = { fn_name: dict(ssa) for fn_name, ssa in module.items() }
+
+  for ssa in after.values():
+    promote_locals(ssa)
+    sparse_conditional_constant_propagation(ssa, fold)
+
+  same_results(module, after)
@@ -0,0 +1,73 @@
+import pytest
+
+from data      import Instr
+from optimizer import fold_bintree
+from semantics import fold
+
+def const(typ, value):
+  return Instr('const', typ, value=value)
+
+def binary(code, typ, l, r):
+  return Instr(code, typ, l=l, r=r)
+
+def folded(tree):
+  changed, result = fold_bintree(tree)
+  return result.value if result.code == 'const' else None
+
+def test_fold_wraps_to_the_type():
+  assert fold('add', 'i32', 2**31 - 1, 1) == -2**31
+  assert fold('sub', 'u32', 0, 1) == 2**32 - 1
+  assert fold('mul', 'i8', 16, 16) == 0
+  assert fold('neg', 'i32', -2**31) == -2**31
+
+def test_fold_divides_exactly():
+  assert fold('div', 'i64', 2**62 + 1, 3) == (2**62 + 1) // 3
+  assert fold('div', 'i32', -7, 2) == -3
+  assert fold('div', 'i32', -2**31, -1) == -2**31
+  assert fold('div', 'f64', 10**400, 3) == 10**400 // 3
+
+def test_fold_wraps_the_operands_first():
+  assert fold('less', 'u32', -1, 5) == 0
+  assert fold('div', 'u8', -26, 31) == 7
+  assert fold('shr', 'i8', 200, 1) == -28
+
+@pytest.mark.parametrize('code, typ, values', [
+  ('div', 'i32', (1, 0)),
+  ('shl', 'i32', (1, -1)),
+  ('shl', 'i32', (1, 32)),
+  ('shr', 'u8', (1, 8)),
+  ('shl', 'f64', (1, 65)),
+])
+def test_fold_refuses_undefined_results(code, typ, values):
+  with pytest.raises(ArithmeticError):
+    fold(code, typ, *values)
+
+def test_fold_rules_wrap():
+  overflow = binary('add', 'i32', const('i32', 2**31 - 1), const('i32', 1))
+
+  assert folded(overflow) == -2**31
+  assert folded(binary('div', 'i32', overflow, const('i32', 2))) == -2**30
+  assert folded(binary('div', 'i64', const('i64', 2**62 + 1), const('i64', 3))) == (2**62 + 1) // 3
+
+def test_fold_rules_leave_undefined_results():
+  assert folded(binary('div', 'i32', const('i32', 10**400), const('i32', 0))) is None
+  assert folded(binary('shl', 'i32', const('i32', 1), const('i32', -1))) is None
+  assert folded(binary('shl', 'i32', const('i32', 1), const('i32', 32))) is None
+  # the inner division can't be folded, so the outer rule sees a constant `x`
+  assert folded(binary('div', 'u8', binary('div', 'u8', const('u8', 5), const('u8', 256)), const('u8', 3))) is None
+
+def test_nested_divisions_are_merged_only_when_the_product_fits():
+  x = Instr('ldloc', 'i32', loc=0)
+
+  changed, result = fold_bintree(binary('div', 'i32', binary('div', 'i32', x, const('i32', 7)), const('i32', 3)))
+  assert changed and result.r.value == 21
+
+  changed, result = fold_bintree(binary('div', 'i32', binary('div', 'i32', x, const('i32', 2**16)), const('i32', 2**15)))
+  assert not changed
+
+def test_rules_dont_merge_operations_of_different_types():
+  x     = Instr('ldloc', 'u8', loc=0)
+  inner = binary('mul', 'u8', x, const('u8', 71))
+
+  changed, result = fold_bintree(binary('mul', 'i64', inner, const('i64', 373)))
+  assert not changed
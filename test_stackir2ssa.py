@@ -0,0 +1,73 @@
+import pytest
+
+from data        import Instr, Label
+from interpreter import Interpreter
+from stackir2ssa import sir2ssa, sir2ssa_stream
+from walk        import postorder
+
+def ldc(value):
+  return Instr('ldc', 'i32', value=value)
+
+def ldloc(loc):
+  return Instr('ldloc', 'i32', loc=loc)
+
+def stloc(loc):
+  return Instr('stloc', 'i32', loc=loc)
+
+def op(code):
+  return Instr(code, 'i32')
+
+def counting_loop():
+  '''
+  This function returns the sir of `s = 0; while (i < n) { s += i; i += 1 } return s` (`i` is local 0, `n` local 1)
+  '''
+
+  return [
+    ldc(0), stloc(2),
+    Label('head'),
+    ldloc(0), ldloc(1), op('less'), Instr('jmpf', 'void', target='exit'),
+    ldloc(2), ldloc(0), op('add'), stloc(2),
+    ldloc(0), ldc(1), op('add'), stloc(0),
+    Instr('jmp', 'void', target='head'),
+    Label('exit'),
+    ldloc(2), Instr('ret', 'i32'),
+  ]
+
+def test_loops_are_converted():
+  ssa = sir2ssa(counting_loop())
+
+  assert [block[-1].code for block in ssa.values()] == ['goto', 'branch', 'goto', 'ret']
+
+  for i, n in [(0, 5), (3, 3), (0, 0), (-2, 2)]:
+    assert Interpreter({ 'f': ssa }).call('f', [i, n]) == sum(range(i, n))
+
+def test_blocks_are_yielded_while_reading():
+  read = []
+
+  def reader():
+    for instr in counting_loop():
+      read.append(instr)
+      yield instr
+
+  blocks = sir2ssa_stream(reader())
+  name, block = next(blocks)
+
+  # the first block is finished by the first label, the rest of the sir isn't read yet
+  assert name == 'l0' and block[-1].code == 'goto'
+  assert len(read) == 3
+
+@pytest.mark.parametrize('sir', [
+  [Label('a'), ldc(1), Label('a'), Instr('ret', 'i32')],
+  [Instr('jmp', 'void', target='missing'), Instr('ret', 'void')],
+  [Instr('jmp', 'void', target='a')],
+])
+def test_wrong_labels_are_rejected(sir):
+  with pytest.raises(ValueError):
+    sir2ssa(sir)
+
+def test_long_expressions_are_trees():
+  sir = [ldc(0)] + [i for n in range(10_000) for i in [ldc(n), op('add')]] + [Instr('ret', 'i32')]
+  ssa = sir2ssa(sir)
+
+  assert len(ssa['l0']) == 1
+  assert sum(1 for _ in postorder(ssa['l0'][0])) == 20_002
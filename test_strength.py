@@ -0,0 +1,76 @@
+import pytest
+
+from data        import Instr
+from backend     import compile_module
+from interpreter import Interpreter
+from optimizer   import optimize1, get_faster_corresponding_instruction
+from strength    import shift_add_mul, div_by_const
+from walk        import postorder
+
+def const(typ, value):
+  return Instr('const', typ, value=value)
+
+def binary(code, typ, l, r):
+  return Instr(code, typ, l=l, r=r)
+
+def function(value):
+  return { 'l0': [Instr('ret', value.typ, value=value)] }
+
+def run(value, x):
+  return Interpreter({ 'f': function(value) }).call('f', [x])
+
+@pytest.mark.parametrize('typ', ['u8', 'i8'])
+@pytest.mark.parametrize('n', [-128, -7, -2, -1, 2, 3, 6, 7, 14, 100, 127, 200, 254, 255, 256, 258])
+def test_reductions_compute_the_same_values(typ, n):
+  x = Instr('ldloc', typ, loc=0)
+
+  for code, reduce in [('mul', shift_add_mul), ('div', div_by_const)]:
+    reduced = reduce(x, n, typ)
+
+    if reduced is None:
+      continue
+
+    assert reduced.typ == typ
+
+    for value in [*range(256), -1, -128, 300]:
+      assert run(reduced, value) == run(binary(code, typ, x, const(typ, n)), value)
+
+def test_quotients_wrap_around_to_the_type_of_the_division():
+  x    = Instr('ldloc', 'u8', loc=0)
+  ssa  = function(binary('mul', 'u8', binary('div', 'u8', x, const('u8', 3)), const('u8', 7)))
+  _, o = optimize1({ 'f': ssa })
+
+  assert Interpreter({ 'f': ssa }).call('f', [255]) == 83
+  assert Interpreter(o).call('f', [255]) == 83
+  assert compile_module(o)['f'](255) == 83
+
+def test_reductions_have_the_type_of_the_operation():
+  # the operand is an `i64`, but the operations are `u8` ones
+  x        = Instr('ldloc', 'i64', loc=0)
+  tree     = binary('div', 'u8', binary('div', 'u8', x, const('u8', 14)), const('u8', -1))
+  _, after = optimize1({ 'f': function(tree) })
+
+  assert after['f']['l0'][-1].value.typ == 'u8'
+
+  for value in [0, 255, 256, 1000, -1]:
+    assert Interpreter(after).call('f', [value]) == run(tree, value)
+
+def test_multiplications_never_shift_by_the_width():
+  x       = Instr('ldloc', 'u32', loc=0)
+  reduced = shift_add_mul(x, 2**32 - 2, 'u32')
+
+  assert all(node.value < 32 for node in postorder(reduced) if node.code == 'const')
+
+  for value in [0, 1, 7, 2**31, 2**32 - 1]:
+    assert run(reduced, value) == run(binary('mul', 'u32', x, const('u32', 2**32 - 2)), value)
+
+def test_div_by_const_wraps_the_divisor_to_the_type():
+  assert div_by_const(Instr('ldloc', 'u64', loc=0), 2**64, 'u64') is None
+  assert div_by_const(Instr('ldloc', 'i32', loc=0), -2**31, 'i32') is None
+  assert div_by_const(Instr('ldloc', 'u32', loc=0), 2**31, 'u32') is not None
+  # `257` is `1` for `u8`
+  assert div_by_const(Instr('ldloc', 'u8', loc=0), 257, 'u8') is None
+
+def test_strength_rules_skip_unfolded_constants():
+  changed, result = get_faster_corresponding_instruction(binary('div', 'i32', const('i32', 5), const('i32', 0)))
+  assert not changed
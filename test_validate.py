@@ -0,0 +1,76 @@
+import pytest
+
+np       = pytest.importorskip('numpy')
+validate = pytest.importorskip('validate')
+
+from data        import Instr
+from generate    import generate_module
+from interpreter import Interpreter, Bailout
+from optimizer   import optimize1
+
+def param(loc, typ='i32'):
+  return Instr('ldloc', typ, loc=loc)
+
+def function(value):
+  return { 'l0': [Instr('ret', value.typ, value=value)] }
+
+def test_optimized_modules_have_no_divergences():
+  module = generate_module(14, functions=6, call_ratio=0.3, size=60)
+  report = validate.validate(module, lanes=512)
+
+  assert report.ok(), report
+  assert report.checked == list(module.keys())
+
+def test_vector_interpreter_agrees_with_the_interpreter():
+  module = generate_module(15, functions=6, size=60)
+  vm     = validate.VectorInterpreter(module)
+
+  for fn_name, ssa in module.items():
+    params = validate.parameters(ssa)
+    inputs = validate.generate_inputs(params, 64, seed=1)
+    args   = [inputs.get(loc) for loc in range(max(params.keys(), default=-1) + 1)]
+
+    values, status, _ = vm.call(fn_name, args)
+
+    # a function without parameters runs on a single lane
+    for lane in range(len(status)):
+      try:
+        expected = Interpreter(module, fuel=10**6).call(fn_name, [None if a is None else int(a[lane]) for a in args])
+      except Bailout:
+        continue
+
+      # the interpreter has no fuel limit per lane, so lanes out of fuel aren't compared
+      if status[lane] == validate.OK:
+        assert int(values[lane]) == expected, (fn_name, lane)
+
+def test_divergences_are_found_and_minimized():
+  # `x * 3` "optimized" into `x + x`
+  x        = param(0)
+  original = { 'f': function(Instr('mul', 'i32', l=x, r=Instr('const', 'i32', value=3))) }
+  wrong    = { 'f': function(Instr('add', 'i32', l=x, r=x)) }
+  report   = validate.validate(original, wrong, lanes=256)
+
+  [divergence] = report.divergences
+
+  assert divergence.args == { 0: 1 } or divergence.args == { 0: -1 }
+  assert divergence.expected[0] == validate.OK
+  assert divergence.expected[1] != divergence.actual[1]
+  assert 'original' in divergence.reproducer()
+
+def test_traps_of_the_original_are_not_divergences():
+  # the original traps on `0`, the optimized one returns anything there
+  original = { 'f': function(Instr('div', 'i32', l=Instr('const', 'i32', value=10), r=param(0))) }
+  guessed  = { 'f': function(Instr('div', 'i32', l=Instr('const', 'i32', value=10), r=Instr('add', 'i32', l=param(0), r=Instr('less', 'i32', l=param(0), r=Instr('const', 'i32', value=1))))) }
+
+  # `x < 1` is `1` on `0` and negatives, so the optimized version is also wrong on the negatives
+  report = validate.validate(original, guessed, lanes=256)
+  assert len(report.divergences) == 1 and report.divergences[0].args[0] < 0
+
+  same = { 'f': function(Instr('div', 'i32', l=Instr('const', 'i32', value=10), r=param(0))) }
+  assert validate.validate(original, same, lanes=256).ok()
+
+def test_types_without_fixed_width_are_skipped():
+  module = { 'f': function(Instr('add', 'f64', l=param(0, 'f64'), r=param(0, 'f64'))) }
+  report = validate.validate(module, module, lanes=16)
+
+  assert report.checked == [] and 'f' in report.skipped
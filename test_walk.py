@@ -0,0 +1,54 @@
+from data import Instr
+from walk import children, postorder, transform, collect_instructions_with_sideeffects, is_pure
+
+def const(value):
+  return Instr('const', 'i32', value=value)
+
+def add(l, r):
+  return Instr('add', 'i32', l=l, r=r)
+
+def deep_sum(terms):
+  tree = const(0)
+
+  for n in range(terms):
+    tree = add(tree, const(n))
+
+  return tree
+
+def test_postorder_visits_children_first_and_shared_nodes_once():
+  shared = const(1)
+  tree   = add(add(shared, const(2)), shared)
+
+  assert [node.code for node in postorder(tree)] == ['const', 'const', 'add', 'add']
+  assert list(postorder(tree))[0] is shared
+
+def test_deep_trees_dont_hit_the_recursion_limit():
+  tree = deep_sum(20_000)
+
+  assert sum(1 for _ in postorder(tree)) == 40_001
+
+  changed, folded = transform(tree, lambda node: (True, const(node.l.value + node.r.value)) if node.code == 'add' else (False, node))
+  assert changed and folded.value == sum(range(20_000))
+
+def test_transform_shares_unchanged_subtrees():
+  left  = add(const(1), const(2))
+  right = Instr('neg', 'i32', value=const(3))
+  tree  = add(left, right)
+
+  changed, result = transform(tree, lambda node: (True, const(-3)) if node.code == 'neg' else (False, node))
+
+  assert changed
+  assert result.l is left
+  assert repr(result.r) == "Instr('const', 'i32', value=-3)"
+
+  changed, result = transform(tree, lambda node: (False, node))
+  assert not changed and result is tree
+
+def test_sideeffects_are_collected_in_evaluation_order():
+  f, g = Instr('call', 'i32', fn='f', args=[]), Instr('call', 'i32', fn='g', args=[Instr('call', 'i32', fn='h', args=[])])
+  tree = add(f, Instr('neg', 'i32', value=g))
+
+  assert collect_instructions_with_sideeffects(tree) == [f, g]
+  assert not is_pure(tree) and not is_pure(f)
+  assert is_pure(add(const(1), const(2)))
+  assert children(g) == g.args
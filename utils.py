@@ -1,4 +1,5 @@
 from data import Instr
+from walk import postorder
 
 def list_prettyrepr(l, indent_size=2, brack_indent_size=0, indent_first_brack=False, use_custom_repr=None):
   '''
@@ -65,7 +66,7 @@ def pretty_repr(obj, indent_size=2, brack_indent_size=0, indent_first_brack=Fals
       return list_prettyrepr(obj, indent_size, brack_indent_size, indent_first_brack)
 
     case _:
-      # checking whether type(obj) is primitive type
+      # checking whether type(obj) is primitive type (slotted data structures like `Instr` provide their own repr)
       if not hasattr(obj, '__dict__'):
         return repr(obj)
       
@@ -82,49 +83,66 @@ def ssa_chunk_to_human_readable(chunk):
   schunk                    = [] # the chunk with instructions as strings
   alphabet_counter          = 0  # single static assigned virtual register of ssa are named with alphabet letters
   alphabet_repeat_indicator = '' # single static assigned virtual register of ssa cannot be reassigned, so in the second use of `a` it will be `a'`
-  available_var_name        = lambda: ALPHABET[alphabet_counter] + alphabet_repeat_indicator # providing a variable name
+  names                     = {} # nodes shared by more instructions (see `hashcons`) are a single value, so they are printed once and then referenced by name
 
-  def decompose_arg(arg_name, arg):
+  def new_var_name():
+    '''
+    This function provides a new variable name
+    '''
+
+    nonlocal alphabet_counter, alphabet_repeat_indicator
+
+    # when reached the letter 'z' resets the alphabet indexer and adds an indicator
+    if alphabet_counter == len(ALPHABET):
+      alphabet_counter = 0
+      alphabet_repeat_indicator += "'"
+
+    alphabet_counter += 1
+    return ALPHABET[alphabet_counter - 1] + alphabet_repeat_indicator
+
+  def decompose_arg(arg):
     '''
     This function returns a variable name referring to a bigger instruction when needed (for more readability)
     '''
 
-    nonlocal alphabet_counter
+    # `call` args
+    if isinstance(arg, list):
+      return '[' + ', '.join(map(decompose_arg, arg)) + ']'
 
     if not isinstance(arg, Instr):
-      return f'{arg_name}={repr(arg)}'
+      return repr(arg)
 
-    # converts the instr into a human readable representation as string
+    # constants and phis are printed inline, the other instructions were already printed (they are operands)
     match arg.code:
       case 'const':
-        arg = arg.value
-      
-      case 'ldloc' | 'add' | 'sub' | 'mul' | 'div' | 'less' | 'branch' | 'neg' | 'shl' | 'shr':
-        add_ssa_instr_to_string(arg)
-        arg = available_var_name()
-        alphabet_counter += 1
+        return str(arg.value)
+
+      case 'ldphi':
+        return arg.name
 
       case _:
-        raise NotImplementedError(arg.code)
-    
-    return f'{arg_name}={arg}'
-  
+        return names[id(arg)]
+
   def add_ssa_instr_to_string(instr):
-    kwargs = ", ".join(map(str, (decompose_arg(k, instr.__dict__[k]) for k in filter(lambda k: k not in ["code", "typ"], instr.__dict__.keys()))))
+    # phis define the value named `instr.name`, which has a value for each predecessor
+    if instr.code == 'phi':
+      schunk.append(f'{instr.name} = phi {instr.typ} ' + ", ".join(f'{pred}={decompose_arg(v)}' for pred, v in zip(instr.preds, instr.values)))
+      return
+
+    kwargs = ", ".join(f'{k}={decompose_arg(v)}' for k, v in instr.fields())
 
     if instr.typ != 'void':
-      schunk.append(f'{available_var_name()} = {instr.code} {instr.typ} {kwargs}')
+      names[id(instr)] = new_var_name()
+      schunk.append(f'{names[id(instr)]} = {instr.code} {instr.typ} {kwargs}')
     else:
       schunk.append(f'{instr.code} {instr.typ} {kwargs}')
 
   for instr in chunk:
-    # when reached the letter 'z' resets the alphabet indexer and adds an indicator
-    if alphabet_counter == len(ALPHABET):
-      alphabet_counter = 0
-      alphabet_repeat_indicator += "'"
+    # operands are printed before the instructions using them (without recursion, so deep trees are supported)
+    for node in postorder(instr, skip=names):
+      if node.code not in ['const', 'ldphi']:
+        add_ssa_instr_to_string(node)
 
-    add_ssa_instr_to_string(instr)
-  
   return schunk
 
 def ssa_pretty_repr(ssa, indent_size=2, brack_indent_size=0, indent_first_brack=False):
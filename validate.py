@@ -0,0 +1,656 @@
+'''
+This module contains the differential validation of the optimizer: the original and the optimized version of each function
+are run over thousands of inputs at once, and the first input giving a different result is reported, after being minimized
+
+Functions are run by a vectorized interpreter (numpy arrays with one lane per input, lanes may take different paths, so each block
+is run for the lanes which are in it), with the fixed width semantics of the types (for example `i32` values wrap around):
+* operands are converted to the type of the operation
+* divisions truncate toward zero
+* the operations without a defined result (see `semantics`: a division by zero, a shift by a count out of `0 <= r < width`)
+  and reading a local never stored trap, a trap makes the result of the lane undefined
+
+The optimized version is wrong on an input when the original one returns on it and the optimized one traps or returns
+a different value (inputs where the original traps, or where one of them runs out of fuel, aren't compared)
+
+Numpy is an optional dependency, only needed by this module
+'''
+
+import random
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+from cfg       import CFG, successors
+from deadcode  import liveness
+from optimizer import optimize1, BIN_OPS
+from strength  import int_type
+from semantics import shift_limit, wrap
+from walk      import postorder
+from utils     import ssa_pretty_repr
+
+# how many inputs each function is run on
+DEFAULT_LANES = 4096
+# how many blocks each lane can enter (the blocks of the functions it calls included)
+DEFAULT_FUEL  = 10_000
+# lanes calling deeper than this run out of fuel
+MAX_DEPTH     = 64
+# how many times `minimize` tries to shrink an input
+MAX_SHRINKS   = 256
+
+# status of each lane
+OK          = 0
+TRAP        = 1
+OUT_OF_FUEL = 2
+
+# the block of the lanes which returned or stopped (see `VectorFrame.block`)
+DONE = -1
+
+# the type of the parameters whose type isn't told by any `ldloc`
+DEFAULT_TYPE = 'i32'
+
+class Unsupported(Exception):
+  '''
+  Raised when a function can't be validated (the reason is the message), like for types without fixed width
+  '''
+
+def require_numpy():
+  if np is None:
+    raise ImportError('validation needs numpy (`pip install numpy`)')
+
+# `(signed, width, dtype)` of the types already seen
+TYPES = {}
+
+def type_info(typ):
+  '''
+  This function returns `(signed, width, dtype)` of `typ`, raising `Unsupported` when it isn't a numpy integer type
+  '''
+
+  if typ not in TYPES:
+    info = int_type(typ)
+
+    if info is None or info[1] not in [8, 16, 32, 64]:
+      raise Unsupported(f'type `{typ}` has no fixed width semantics')
+
+    signed, width = info
+    TYPES[typ]    = signed, width, np.dtype(f'{"int" if signed else "uint"}{width}')
+
+  return TYPES[typ]
+
+def width_of(typ):
+  return type_info(typ)[:2]
+
+def dtype_of(typ):
+  return type_info(typ)[2]
+
+def to_lanes(values):
+  # values are stored as int64 whatever their type, converting back to a type keeps the bits (so it wraps)
+  return values.astype(np.int64, copy=False)
+
+def truncated_div(l, r, dtype):
+  '''
+  This function returns `l / r` truncated toward zero (`r` has no zeros), wrapped around to `dtype`
+  '''
+
+  if dtype.kind == 'u':
+    return l // r
+
+  # the magnitudes are unsigned, so the one of the minimum value (like `-2**31`) fits
+  unsigned  = np.dtype(f'uint{dtype.itemsize * 8}')
+  magnitude = lambda values: np.where(values < 0, -values.astype(unsigned), values.astype(unsigned))
+  quotient  = magnitude(l) // magnitude(r)
+
+  return np.where((l < 0) != (r < 0), -quotient, quotient).astype(dtype)
+
+class SlicedMemo:
+  '''
+  Data structure for handling the values of the nodes computed for a subset of the lanes of a block (the lanes taking an edge),
+  the values computed for all the lanes are sliced when read
+  '''
+
+  def __init__(self, memo, selected):
+    self.memo     = memo
+    self.selected = selected
+    self.own      = {}
+
+  def __contains__(self, key):
+    return key in self.own or key in self.memo
+
+  def __getitem__(self, key):
+    if key not in self.own:
+      self.own[key] = self.memo[key][self.selected]
+
+    return self.own[key]
+
+  def __setitem__(self, key, value):
+    self.own[key] = value
+
+class VectorFrame:
+  '''
+  Data structure for handling the state of a function running over many lanes
+  '''
+
+  def __init__(self, args, fuel):
+    lanes       = len(fuel)
+    self.block  = np.zeros(lanes, dtype=np.int64)
+    self.fuel   = fuel.copy()
+    self.status = np.zeros(lanes, dtype=np.int8)
+    self.result = np.zeros(lanes, dtype=np.int64)
+    self.phis   = {}
+    # values and whether they were stored, for each local
+    self.locals = { loc: (np.array(values, dtype=np.int64), np.ones(lanes, dtype=bool)) for loc, values in enumerate(args) if values is not None }
+
+class BlockPlan:
+  '''
+  Data structure for handling the order the nodes of a block are computed in
+
+  * `steps` are the instructions after the phis, each one with the nodes computed before running it (children first,
+    the nodes shared with the instructions before it are already computed)
+  * `edges[target]` are the names of the phis of `target`, their values coming from the block and the nodes computing them
+  '''
+
+  def __init__(self, ssa, block_name):
+    computed        = set()
+    self.steps      = []
+    self.edges      = {}
+    self.terminated = False
+
+    for instr in ssa[block_name]:
+      if instr.code == 'phi':
+        continue
+
+      if instr.code in ['stloc', 'ret', 'branch']:
+        roots = [] if instr.value is None else [instr.value]
+      else:
+        roots = [] if instr.code == 'goto' else [instr]
+
+      self.steps.append((instr, schedule(roots, computed)))
+
+      if instr.code in ['ret', 'goto', 'branch']:
+        self.terminated = True
+
+        for target in successors([instr]):
+          phis               = [phi for phi in ssa[target] if phi.code == 'phi']
+          values             = [phi.values[phi.preds.index(block_name)] for phi in phis]
+          self.edges[target] = [phi.name for phi in phis], values, schedule(values, set(computed))
+
+        break
+
+def schedule(roots, computed):
+  '''
+  This function returns the nodes of `roots` children first, skipping the ones in `computed` (ids), which is updated
+  '''
+
+  nodes = []
+
+  for root in roots:
+    for node in postorder(root, skip=computed):
+      computed.add(id(node))
+      nodes.append(node)
+
+  return nodes
+
+class VectorInterpreter:
+  '''
+  Data structure for handling the vectorized run of the functions of a module (see the module)
+  '''
+
+  def __init__(self, ssa_functions, fuel=DEFAULT_FUEL):
+    require_numpy()
+
+    self.ssa_functions = ssa_functions
+    self.fuel          = fuel
+    self.plans         = {}
+    self.orders        = {}
+    self.constants     = {} # the values of each `const` node (by id), for the most lanes it was read by
+
+  def plan(self, fn_name, block_name):
+    '''
+    This function returns the `BlockPlan` of a block, made the first time it's run
+    '''
+
+    key = fn_name, block_name
+
+    if key not in self.plans:
+      self.plans[key] = BlockPlan(self.ssa_functions[fn_name], block_name)
+
+    return self.plans[key]
+
+  def constant(self, node, lanes):
+    '''
+    This function returns the values of the `const` node `node` for `lanes` lanes (a read only view, shared by all the reads)
+    '''
+
+    values = self.constants.get(id(node))
+
+    if values is None or len(values) < lanes:
+      values                   = np.full(lanes, wrap(node.value, node.typ), dtype=dtype_of(node.typ))
+      values.flags.writeable   = False
+      self.constants[id(node)] = values
+
+    return values[:lanes]
+
+  def block_order(self, fn_name):
+    '''
+    This function returns the blocks of `fn_name` in reverse postorder and the position of each one
+    '''
+
+    if fn_name not in self.orders:
+      order                = CFG(self.ssa_functions[fn_name]).reverse_postorder()
+      self.orders[fn_name] = order, { block_name: i for i, block_name in enumerate(order) }
+
+    return self.orders[fn_name]
+
+  def call(self, fn_name, args, fuel=None, depth=0):
+    '''
+    This function runs `fn_name` over the lanes of `args` (an array for each parameter, `None` for the ones not given),
+    `fuel` is the fuel left to each lane (by default `self.fuel`), returns the returned values (as int64), the status
+    and the fuel left of each lane
+    '''
+
+    if fn_name not in self.ssa_functions:
+      raise Unsupported(f'function `{fn_name}` is outside the module')
+
+    order, index = self.block_order(fn_name)
+
+    if fuel is None:
+      lanes = max((len(a) for a in args if a is not None), default=1)
+      fuel  = np.full(lanes, self.fuel, dtype=np.int64)
+
+    frame = VectorFrame(args, fuel)
+
+    if depth > MAX_DEPTH:
+      frame.status[:] = OUT_OF_FUEL
+      return frame.result, frame.status, frame.fuel
+
+    # the first block (in reverse postorder) with lanes in it is run next, so lanes leaving a loop or an `if` early
+    # wait for the other ones, and blocks are run for as many lanes as possible
+    while True:
+      waiting = frame.block[frame.block != DONE]
+
+      if len(waiting) == 0:
+        return frame.result, frame.status, frame.fuel
+
+      i                 = int(waiting.min())
+      idx               = np.nonzero(frame.block == i)[0]
+      frame.fuel[idx]  -= 1
+      exhausted         = frame.fuel[idx] < 0
+
+      if exhausted.any():
+        frame.status[idx[exhausted]] = OUT_OF_FUEL
+        frame.block[idx[exhausted]]  = DONE
+        idx                          = idx[~exhausted]
+
+      if len(idx) > 0:
+        self.run_block(self.plan(fn_name, order[i]), index, frame, idx, depth)
+
+  def run_block(self, plan, index, frame, idx, depth):
+    memo  = {}
+    fault = np.zeros(len(idx), dtype=np.int8)
+
+    for instr, nodes in plan.steps:
+      self.evaluate(nodes, frame, idx, memo, fault, depth)
+
+      match instr.code:
+        case 'stloc':
+          if instr.loc not in frame.locals:
+            frame.locals[instr.loc] = np.zeros(len(frame.block), dtype=np.int64), np.zeros(len(frame.block), dtype=bool)
+
+          values, stored = frame.locals[instr.loc]
+          values[idx]    = to_lanes(memo[id(instr.value)])
+          stored[idx]    = True
+
+        case 'ret':
+          if instr.value is not None:
+            frame.result[idx] = to_lanes(memo[id(instr.value)])
+
+          frame.block[idx] = DONE
+
+        case 'goto':
+          self.jump(plan.edges[instr.target], index[instr.target], frame, idx, memo, fault, depth)
+
+        case 'branch':
+          taken = memo[id(instr.value)] != 0
+
+          for target, selected in [(instr.T, taken), (instr.F, ~taken)]:
+            if selected.any():
+              edge_fault = np.zeros(int(selected.sum()), dtype=np.int8)
+              self.jump(plan.edges[target], index[target], frame, idx[selected], SlicedMemo(memo, selected), edge_fault, depth)
+              fault[selected] = np.maximum(fault[selected], edge_fault)
+
+    # a block without terminator returns nothing
+    if not plan.terminated:
+      frame.block[idx] = DONE
+
+    faulty = fault != OK
+
+    if faulty.any():
+      frame.status[idx[faulty]] = fault[faulty]
+      frame.block[idx[faulty]]  = DONE
+
+  def jump(self, edge, target, frame, idx, memo, fault, depth):
+    '''
+    This function moves the lanes `idx` to the block `target` through `edge` (see `BlockPlan`), assigning its phis
+    (their values are computed before assigning any)
+    '''
+
+    names, values, nodes = edge
+    self.evaluate(nodes, frame, idx, memo, fault, depth)
+
+    for name, value in zip(names, values):
+      if name not in frame.phis:
+        frame.phis[name] = np.zeros(len(frame.block), dtype=np.int64)
+
+      frame.phis[name][idx] = to_lanes(memo[id(value)])
+
+    frame.block[idx] = target
+
+  def evaluate(self, nodes, frame, idx, memo, fault, depth):
+    '''
+    This function computes the values of `nodes` (children first) for the lanes `idx` into `memo` (by id),
+    the lanes trapping are marked in `fault`
+    '''
+
+    for node in nodes:
+      memo[id(node)] = self.operation(node, frame, idx, memo, fault, depth)
+
+  def operation(self, node, frame, idx, memo, fault, depth):
+    '''
+    This function returns the values of `node` (its operands are already in `memo`)
+    '''
+
+    match node.code:
+      case 'const':
+        return self.constant(node, len(idx))
+
+      case 'ldloc':
+        if node.loc not in frame.locals:
+          fault[:] = np.maximum(fault, TRAP)
+          return np.zeros(len(idx), dtype=dtype_of(node.typ))
+
+        values, stored = frame.locals[node.loc]
+        unset          = ~stored[idx]
+        fault[unset]   = np.maximum(fault[unset], TRAP)
+
+        return values[idx].astype(dtype_of(node.typ))
+
+      case 'ldphi':
+        return frame.phis[node.name][idx].astype(dtype_of(node.typ))
+
+      case 'call':
+        args                 = [to_lanes(memo[id(arg)]) for arg in node.args]
+        result, status, left = self.call(node.fn, args, frame.fuel[idx], depth + 1)
+        frame.fuel[idx]      = left
+        fault[:]             = np.maximum(fault, status)
+
+        return result.astype(dtype_of(node.typ)) if node.typ != 'void' else None
+
+      case 'neg':
+        return -memo[id(node.value)].astype(dtype_of(node.typ), copy=False)
+
+    if node.code not in BIN_OPS:
+      raise Unsupported(f'instr code `{node.code}` can\'t be validated')
+
+    _, width, dtype = type_info(node.typ)
+    l, r            = memo[id(node.l)].astype(dtype, copy=False), memo[id(node.r)].astype(dtype, copy=False)
+
+    match node.code:
+      case 'add':
+        return l + r
+
+      case 'sub':
+        return l - r
+
+      case 'mul':
+        return l * r
+
+      case 'less':
+        return (l < r).astype(dtype)
+
+      case 'div':
+        zero        = r == 0
+        fault[zero] = np.maximum(fault[zero], TRAP)
+        return truncated_div(l, np.where(zero, 1, r).astype(dtype), dtype)
+
+    # shifts, the lanes with a count out of range trap (see `semantics.shift_limit`), their count is replaced
+    # so the numpy shift is still defined
+    undefined        = (r < 0) | (r >= shift_limit(node.typ))
+    fault[undefined] = np.maximum(fault[undefined], TRAP)
+    count            = np.where(undefined, 0, r).astype(dtype)
+
+    if node.code == 'shl':
+      # shifting the bits as unsigned, so the ones shifted out are dropped
+      unsigned = np.dtype(f'uint{width}')
+      return (l.astype(unsigned) << count.astype(unsigned)).astype(dtype)
+
+    # the shift is arithmetic for signed types
+    return l >> count
+
+def parameters(ssa):
+  '''
+  This function returns the locals read by `ssa` before being stored (its parameters) with their type
+  '''
+
+  cfg        = CFG(ssa)
+  live_in, _ = liveness(ssa, cfg)
+  types      = {}
+
+  for block in ssa.values():
+    for instr in block:
+      for node in postorder(instr):
+        if node.code == 'ldloc':
+          types.setdefault(node.loc, node.typ)
+
+  return { loc: types.get(loc, DEFAULT_TYPE) for loc in sorted(live_in[cfg.entry]) }
+
+def interesting_values(typ):
+  '''
+  This function returns the values of `typ` where wraparound and rounding bugs usually show up
+  '''
+
+  signed, width = width_of(typ)
+  low, high     = (-(1 << (width - 1)), (1 << (width - 1)) - 1) if signed else (0, (1 << width) - 1)
+  values        = {0, 1, 2, 3, 7, 8, 100, low, high, low + 1, high - 1}
+
+  for k in range(width):
+    values.update([1 << k, (1 << k) - 1, (1 << k) + 1, -(1 << k), -(1 << k) + 1])
+
+  return sorted(v for v in values if low <= v <= high)
+
+def generate_inputs(params, lanes, seed=0):
+  '''
+  This function returns `lanes` random inputs for `params` (see `parameters`), as an array of each parameter,
+  the interesting values of each parameter (see `interesting_values`) are all included when there are enough lanes
+  '''
+
+  rng    = random.Random(seed)
+  inputs = {}
+
+  for loc, typ in params.items():
+    signed, width = width_of(typ)
+    special       = interesting_values(typ)
+    values        = special[:lanes]
+
+    while len(values) < lanes:
+      kind = rng.random()
+
+      if kind < 0.3:
+        values.append(rng.choice(special))
+      elif kind < 0.6:
+        values.append(rng.randint(-100, 100) if signed else rng.randint(0, 200))
+      else:
+        values.append(wrap(rng.getrandbits(width), typ))
+
+    # shuffling, so the interesting values of different parameters are combined
+    rng.shuffle(values)
+    inputs[loc] = np.array([wrap(v, typ) for v in values], dtype=dtype_of(typ))
+
+  return inputs
+
+class Divergence:
+  '''
+  Data structure for handling an input where the optimized function differs from the original one,
+  `args` are the values of the parameters (by local), `expected` and `actual` are `(status, value)`
+  '''
+
+  def __init__(self, fn_name, args, expected, actual, original, optimized):
+    self.fn_name   = fn_name
+    self.args      = args
+    self.expected  = expected
+    self.actual    = actual
+    self.original  = original
+    self.optimized = optimized
+
+  def describe(self, result):
+    status, value = result
+    return { OK: f'returns {value}', TRAP: 'traps', OUT_OF_FUEL: 'runs out of fuel' }[status]
+
+  def reproducer(self):
+    '''
+    This function returns the reproducer of the divergence: the input and the two versions of the function
+    '''
+
+    args = ', '.join(f'l{loc} = {value}' for loc, value in self.args.items())
+
+    return '\n'.join([
+      f'# `{self.fn_name}({args})`: the original {self.describe(self.expected)}, the optimized {self.describe(self.actual)}',
+      '# original',
+      ssa_pretty_repr(self.original),
+      '# optimized',
+      ssa_pretty_repr(self.optimized),
+    ])
+
+  def __repr__(self):
+    return f'Divergence({self.fn_name}, args={self.args}, expected={self.describe(self.expected)}, actual={self.describe(self.actual)})'
+
+class Validator:
+  '''
+  Data structure for handling the differential validation of a module (`ssa_functions`) and its optimized version
+  '''
+
+  def __init__(self, ssa_functions, optimized, fuel=DEFAULT_FUEL):
+    self.ssa_functions = ssa_functions
+    self.optimized     = optimized
+    self.original_vm   = VectorInterpreter(ssa_functions, fuel)
+    self.optimized_vm  = VectorInterpreter(optimized, fuel)
+
+  def run(self, fn_name, inputs):
+    '''
+    This function runs both versions of `fn_name` over `inputs` (see `generate_inputs`),
+    returns the mask of the diverging lanes and the results of both
+    '''
+
+    args = [None] * (max(inputs.keys(), default=-1) + 1)
+
+    for loc, values in inputs.items():
+      args[loc] = values
+
+    expected = self.original_vm.call(fn_name, args)[:2]
+    actual   = self.optimized_vm.call(fn_name, args)[:2]
+
+    (expected_values, expected_status), (actual_values, actual_status) = expected, actual
+
+    # returned values are compared with the type of the returns (a void function returns always 0)
+    diverging = (expected_status == OK) & ((actual_status == TRAP) | ((actual_status == OK) & (expected_values != actual_values)))
+
+    return diverging, expected, actual
+
+  def minimize(self, fn_name, params, args):
+    '''
+    This function returns a smaller version of the diverging input `args`: each parameter is moved toward 0 while the input
+    still diverges, the candidates of each round are run together
+    '''
+
+    for _ in range(MAX_SHRINKS):
+      candidates = []
+
+      for loc, value in args.items():
+        for smaller in [0, 1, -1, value // 2, -(-value // 2), value - (1 if value > 0 else -1)]:
+          smaller = wrap(smaller, params[loc])
+
+          if abs(smaller) < abs(value) or (abs(smaller) == abs(value) and smaller > value):
+            candidates.append({ **args, loc: smaller })
+
+      if len(candidates) == 0:
+        return args
+
+      inputs          = { loc: np.array([c[loc] for c in candidates], dtype=dtype_of(typ)) for loc, typ in params.items() }
+      diverging, _, _ = self.run(fn_name, inputs)
+
+      if not diverging.any():
+        return args
+
+      args = candidates[int(np.argmax(diverging))]
+
+    return args
+
+  def validate_function(self, fn_name, lanes=DEFAULT_LANES, seed=0):
+    '''
+    This function returns the first (minimized) divergence of `fn_name` over `lanes` random inputs, `None` when there's none
+    '''
+
+    params = parameters(self.ssa_functions[fn_name])
+
+    for loc, typ in parameters(self.optimized[fn_name]).items():
+      params.setdefault(loc, typ)
+
+    inputs          = generate_inputs(params, lanes, seed)
+    diverging, _, _ = self.run(fn_name, inputs)
+
+    if not diverging.any():
+      return None
+
+    lane = int(np.argmax(diverging))
+    args = self.minimize(fn_name, params, { loc: int(values[lane]) for loc, values in inputs.items() })
+
+    # the minimized input is run again alone, for the results of both versions
+    inputs              = { loc: np.array([value], dtype=dtype_of(params[loc])) for loc, value in args.items() }
+    _, expected, actual = self.run(fn_name, inputs)
+    first_lane          = lambda result: (int(result[1][0]), int(result[0][0]))
+
+    return Divergence(fn_name, args, first_lane(expected), first_lane(actual), self.ssa_functions[fn_name], self.optimized[fn_name])
+
+class ValidationReport:
+  '''
+  Data structure for handling the result of `validate`: the divergences found and the functions which couldn't be validated
+  '''
+
+  def __init__(self):
+    self.checked     = []
+    self.divergences = []
+    self.skipped     = {} # reason by function name
+
+  def ok(self):
+    return len(self.divergences) == 0
+
+  def __repr__(self):
+    return f'ValidationReport(checked={len(self.checked)}, divergences={self.divergences}, skipped={self.skipped})'
+
+def validate(ssa_functions, optimized=None, fn_names=None, lanes=DEFAULT_LANES, seed=0, fuel=DEFAULT_FUEL):
+  '''
+  This function validates the functions `fn_names` (by default all) of `optimized` (by default `optimize1(ssa_functions)`)
+  against the ones of `ssa_functions`, over `lanes` random inputs each (see the module), returns a `ValidationReport`
+  '''
+
+  require_numpy()
+
+  if optimized is None:
+    _, optimized = optimize1(ssa_functions)
+
+  validator = Validator(ssa_functions, optimized, fuel)
+  report    = ValidationReport()
+
+  for fn_name in (fn_names or ssa_functions.keys()):
+    try:
+      divergence = validator.validate_function(fn_name, lanes, seed)
+    except Unsupported as e:
+      report.skipped[fn_name] = str(e)
+      continue
+
+    report.checked.append(fn_name)
+
+    if divergence is not None:
+      report.divergences.append(divergence)
+
+  return report
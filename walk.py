@@ -0,0 +1,123 @@
+'''
+This module contains the tree walkers shared by the optimizer and the printers
+
+They use an explicit stack instead of recursion, so arbitrarily deep instruction trees (like a sum of 10k terms
+converted from stack code) can be walked without hitting the python recursion limit
+'''
+
+from data import Instr, opcodes
+
+INSTR_WITH_POSSIBLE_SIDEEFFECTS     = ['call']
+INSTR_WITH_POSSIBLE_SIDEEFFECTS_IDS = opcodes(INSTR_WITH_POSSIBLE_SIDEEFFECTS)
+
+def children(instr):
+  '''
+  This function returns the operands of `instr` which are instructions (including the ones in list operands, like `call` args)
+  '''
+
+  result = []
+
+  for operand in instr.operands():
+    if isinstance(operand, Instr):
+      result.append(operand)
+    elif isinstance(operand, list):
+      result.extend(e for e in operand if isinstance(e, Instr))
+
+  return result
+
+def postorder(root, descend=None, skip=()):
+  '''
+  This function yields the nodes of `root` children first (left to right), each shared node only once
+
+  * the children of a node are skipped when `descend(node)` is false (the node is still yielded)
+  * nodes whose id is in `skip` (any container, like a dict of already walked nodes) are skipped with their children
+  '''
+
+  visited = set()
+
+  # the flag tells whether the children of the node were already pushed
+  stack = [(root, False)]
+
+  while len(stack) > 0:
+    node, expanded = stack.pop()
+
+    if expanded:
+      yield node
+      continue
+
+    if id(node) in visited or id(node) in skip:
+      continue
+
+    visited.add(id(node))
+    stack.append((node, True))
+
+    if descend is None or descend(node):
+      # reversed, so the leftmost child is popped first
+      stack.extend((child, False) for child in reversed(children(node)))
+
+def replace_children(instr, new_child):
+  '''
+  This function returns `instr` with each child replaced by `new_child(child)`, the same node when no child changed
+  '''
+
+  new_fields = {}
+
+  for field_name, field in instr.fields():
+    if isinstance(field, Instr):
+      new_field = new_child(field)
+
+      if new_field is not field:
+        new_fields[field_name] = new_field
+
+    elif isinstance(field, list):
+      new_field = [new_child(e) if isinstance(e, Instr) else e for e in field]
+
+      if any(a is not b for a, b in zip(new_field, field)):
+        new_fields[field_name] = new_field
+
+  return instr.replace(**new_fields) if len(new_fields) > 0 else instr
+
+def transform(root, fn, memo=None, descend=None):
+  '''
+  This function rebuilds `root` children first, replacing each node with `fn(node)` (which returns `(changed, new_node)`)
+  after its children were replaced, returns `(changed, new_root)`
+
+  * nodes whose children didn't change aren't copied, so unchanged subtrees are shared with the old tree
+  * `memo` caches the results by node (a node shared by more trees is transformed once), subtrees already in it aren't walked again
+  * the children of a node are left as they are when `descend(node)` is false
+  '''
+
+  if memo is None:
+    memo = {}
+
+  # the old node is kept in the cache too, so its id can't be reused by a new node
+  new_node = lambda node: memo[id(node)][1][1] if id(node) in memo else node
+
+  for node in postorder(root, descend, skip=memo):
+    rebuilt = replace_children(node, new_node) if descend is None or descend(node) else node
+    changed, result = fn(rebuilt)
+
+    memo[id(node)] = node, (changed or rebuilt is not node, result)
+
+  return memo[id(root)][1]
+
+def collect_instructions_with_sideeffects(instr):
+  '''
+  This function walks through `instr`'s fields (`instr` is gonna be removed by the caller for uselessness)
+  looking for instructions with sideeffects to keep (in evaluation order)
+  '''
+
+  # instructions with sideeffects are kept whole, so there's no need to look inside them
+  has_sideeffects = lambda node: node.op in INSTR_WITH_POSSIBLE_SIDEEFFECTS_IDS
+
+  return [
+    node for node in postorder(instr, descend=lambda node: node is instr or not has_sideeffects(node))
+    if node is not instr and has_sideeffects(node)
+  ]
+
+def is_pure(instr):
+  '''
+  This function returns whether `instr` can be removed (or moved) without losing sideeffects
+  '''
+
+  return instr.op not in INSTR_WITH_POSSIBLE_SIDEEFFECTS_IDS and len(collect_instructions_with_sideeffects(instr)) == 0